@@ -0,0 +1,186 @@
+"""
+In-memory prefix completion over the vocabulary.
+
+`Completer` keeps the spellings of all indexable words in a sorted
+list, so the words starting with a prefix are found with two binary
+searches.  Completions are ranked by `Word.frequency`, and the results
+for one- and two-letter prefixes, whose ranges are long, are memoized
+until a word in their range changes.
+
+`Word.get_completer` loads the vocabulary once per process, and
+`Word.objects.complete` completes a prefix typed by a user.  The
+completer is then kept up to date incrementally as words are saved or
+deleted, attached to or removed from meanings, and as their
+frequencies change with indexing.
+"""
+
+from bisect import bisect_left, insort
+import heapq
+import threading
+
+
+MEMOIZED_PREFIX_LENGTH = 2
+
+
+class Completer(object):
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.spellings = []  # sorted unique spellings
+        self.words = {}  # word pk -> [spelling, language, frequency]
+        self.word_pks = {}  # spelling -> set of word pks
+        self.frequencies = {}  # spelling -> highest frequency of its words
+        self.meanings = {}  # word pk -> set of meaning pks
+        self.meaning_words = {}  # meaning pk -> set of word pks
+        self._memo = {}  # short prefix -> (limit, completions)
+
+    @classmethod
+    def from_rows(cls, words, links):
+        """
+        Builds a completer from ``(pk, spelling, language, frequency)``
+        4-tuples of words and ``(word pk, meaning pk)`` 2-tuples.
+        """
+        completer = cls()
+        for pk, spelling, language, frequency in words:
+            completer.words[pk] = [spelling, language, frequency]
+            completer.word_pks.setdefault(spelling, set()).add(pk)
+        completer.spellings = sorted(completer.word_pks)
+        for spelling in completer.spellings:
+            completer._update_frequency(spelling)
+        for word_pk, meaning_pk in links:
+            if word_pk in completer.words:
+                completer.meanings.setdefault(word_pk, set()).add(meaning_pk)
+                completer.meaning_words.setdefault(
+                    meaning_pk, set()).add(word_pk)
+        return completer
+
+    def _forget(self, spelling):
+        for length in range(MEMOIZED_PREFIX_LENGTH + 1):
+            self._memo.pop(spelling[:length], None)
+
+    def _update_frequency(self, spelling):
+        pks = self.word_pks.get(spelling)
+        if pks:
+            self.frequencies[spelling] = max(self.words[pk][2] for pk in pks)
+        else:
+            self.frequencies.pop(spelling, None)
+
+    def set_word(self, pk, spelling, language, frequency=0):
+        """Adds a word or updates its spelling, language and frequency"""
+        with self.lock:
+            old = self.words.get(pk)
+            if old and old[0] != spelling:
+                self._unlink_spelling(pk, old[0])
+            if not old or old[0] != spelling:
+                if spelling not in self.word_pks:
+                    insort(self.spellings, spelling)
+                self.word_pks.setdefault(spelling, set()).add(pk)
+            self.words[pk] = [spelling, language, frequency]
+            self._update_frequency(spelling)
+            self._forget(spelling)
+
+    def _unlink_spelling(self, pk, spelling):
+        pks = self.word_pks.get(spelling, set())
+        pks.discard(pk)
+        if not pks:
+            del self.word_pks[spelling]
+            del self.spellings[bisect_left(self.spellings, spelling)]
+        self._update_frequency(spelling)
+        self._forget(spelling)
+
+    def remove_word(self, pk):
+        with self.lock:
+            word = self.words.pop(pk, None)
+            if word:
+                self._unlink_spelling(pk, word[0])
+            for meaning_pk in self.meanings.pop(pk, ()):
+                self.meaning_words.get(meaning_pk, set()).discard(pk)
+
+    def add_meaning(self, word_pk, meaning_pk):
+        with self.lock:
+            if word_pk in self.words:
+                self.meanings.setdefault(word_pk, set()).add(meaning_pk)
+                self.meaning_words.setdefault(meaning_pk, set()).add(word_pk)
+                self._forget(self.words[word_pk][0])
+
+    def remove_meaning(self, meaning_pk, word_pk=None):
+        """
+        Detaches the meaning from the given word, or from all words if
+        `word_pk` is `None`.
+        """
+        with self.lock:
+            if word_pk is None:
+                word_pks = self.meaning_words.pop(meaning_pk, set())
+            else:
+                word_pks = set([word_pk])
+                self.meaning_words.get(meaning_pk, set()).discard(word_pk)
+            for pk in word_pks:
+                self.meanings.get(pk, set()).discard(meaning_pk)
+                if pk in self.words:
+                    self._forget(self.words[pk][0])
+
+    def change_frequency(self, pk, delta):
+        with self.lock:
+            if pk in self.words:
+                self.words[pk][2] += delta
+                self._update_frequency(self.words[pk][0])
+                self._forget(self.words[pk][0])
+
+    def set_frequency(self, pk, frequency):
+        with self.lock:
+            if pk in self.words:
+                self.words[pk][2] = frequency
+                self._update_frequency(self.words[pk][0])
+                self._forget(self.words[pk][0])
+
+    def _completion(self, spelling):
+        pks = self.word_pks[spelling]
+        meanings = {}
+        for pk in pks:
+            language = self.words[pk][1]
+            meanings.setdefault(language, set()).update(
+                self.meanings.get(pk, ()))
+        return {'spelling': spelling,
+                'frequency': self.frequencies[spelling],
+                'meanings': dict((language, sorted(pks))
+                                 for language, pks in meanings.iteritems()
+                                 if pks)}
+
+    def complete(self, prefix, limit=10):
+        """
+        Returns up to `limit` completions of the normalized `prefix`,
+        most frequent first.  Each completion is a dictionary with the
+        ``spelling``, its ``frequency`` and ``meanings``, which maps
+        languages to sorted lists of meaning primary keys.
+        """
+        with self.lock:
+            memoize = len(prefix) <= MEMOIZED_PREFIX_LENGTH
+            if memoize and prefix in self._memo:
+                memo_limit, completions = self._memo[prefix]
+                if memo_limit >= limit:
+                    return _copy_completions(completions[:limit])
+            start = bisect_left(self.spellings, prefix)
+            end = bisect_left(self.spellings, prefix + u'\uffff', start)
+            while (end < len(self.spellings) and
+                   self.spellings[end].startswith(prefix)):
+                end += 1
+            frequencies = self.frequencies
+            best = heapq.nsmallest(
+                limit, self.spellings[start:end],
+                key=lambda spelling: (-frequencies[spelling], spelling))
+            completions = [self._completion(spelling) for spelling in best]
+            if memoize:
+                self._memo[prefix] = limit, completions
+                return _copy_completions(completions)
+            return completions
+
+
+def _copy_completions(completions):
+    """
+    Copies memoized completions so that callers changing them don't
+    change the memo.
+    """
+    return [dict(completion,
+                 meanings=dict((language, list(pks)) for language, pks
+                               in completion['meanings'].iteritems()))
+            for completion in completions]
@@ -0,0 +1,198 @@
+"""
+Benchmarks with a synthetic multilingual vocabulary and corpus.
+
+The benchmark generates a vocabulary of random words in a few
+languages, grouped into meanings, and a corpus of documents made of
+those words, compounds of two words and unknown words.  It then
+measures
+
+ * indexing throughput in index entries per second
+ * `MeaningManager.lookup_splitting` latency
+ * `get_scored_matches_for_sentence` latency
+ * duration of a full re-index
+
+All randomness comes from a seeded generator, so runs with the same
+parameters are comparable across versions and database backends.  Use
+the ``babelsearch_benchmark`` management command to run it.
+"""
+
+import math
+import random
+import time
+
+
+LANGUAGES = 'en', 'fi', 'de'
+SYLLABLES = ('ka', 'ko', 'ta', 'ti', 'ra', 'ro', 'la', 'le', 'mi', 'mu',
+             'sa', 'se', 'va', 've', 'no', 'ni', 'pe', 'pu', 'ha', 'hu',
+             'ber', 'kon', 'stra', 'schu', 'ein', 'ter', 'ung', 'lich')
+
+
+class SyntheticCorpus(object):
+    """
+    Generates a reproducible vocabulary and corpus.
+
+     * `meanings` is the number of meanings in the vocabulary; each
+       meaning has a word in one to three languages
+     * `words_per_document` is the average document length
+     * `compound_ratio` is the share of document tokens which are
+       compounds of two vocabulary words
+     * `unknown_ratio` is the share of tokens not in the vocabulary
+    """
+
+    def __init__(self, meanings=1000, words_per_document=8,
+                 compound_ratio=0.2, unknown_ratio=0.1, seed=0):
+        self.random = random.Random(seed)
+        self.words_per_document = words_per_document
+        self.compound_ratio = compound_ratio
+        self.unknown_ratio = unknown_ratio
+        self.vocabulary = self._make_vocabulary(meanings)
+        self.spellings = sorted(set(spelling
+                                    for meaning in self.vocabulary
+                                    for language, spelling in meaning))
+
+    def _make_word(self, min_syllables=1, max_syllables=4):
+        return ''.join(self.random.choice(SYLLABLES)
+                       for i in range(self.random.randint(min_syllables,
+                                                          max_syllables)))
+
+    def _make_vocabulary(self, count):
+        vocabulary = []
+        seen = set()
+        while len(vocabulary) < count:
+            languages = self.random.sample(LANGUAGES,
+                                           self.random.randint(1, 3))
+            meaning = []
+            for language in languages:
+                spelling = self._make_word(2, 4)
+                if (language, spelling) not in seen:
+                    seen.add((language, spelling))
+                    meaning.append((language, spelling))
+            if meaning:
+                vocabulary.append(meaning)
+        return vocabulary
+
+    def make_token(self):
+        dice = self.random.random()
+        if dice < self.unknown_ratio:
+            return self._make_word(3, 6) + 'x'
+        if dice < self.unknown_ratio + self.compound_ratio:
+            return (self.random.choice(self.spellings) +
+                    self.random.choice(self.spellings))
+        return self.random.choice(self.spellings)
+
+    def make_text(self, length=None):
+        if length is None:
+            length = self.random.randint(1, 2 * self.words_per_document - 1)
+        return u' '.join(self.make_token() for i in range(length))
+
+    def documents(self, count):
+        for i in xrange(count):
+            yield self.make_text()
+
+    def queries(self, count, max_length=4):
+        for i in xrange(count):
+            yield self.make_text(self.random.randint(1, max_length))
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = int(math.ceil(fraction * len(values))) - 1
+    return values[min(max(index, 0), len(values) - 1)]
+
+
+def _latencies(function, arguments):
+    latencies = []
+    for argument in arguments:
+        start = time.time()
+        function(argument)
+        latencies.append(time.time() - start)
+    return {'count': len(latencies),
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99)}
+
+
+def run_benchmark(model, corpus, documents, queries=200, callback=None):
+    """
+    Loads the vocabulary of `corpus` and `documents` generated
+    documents into an empty database and measures indexing and search
+    performance.  `model` must be registered with the indexer and
+    have a ``text`` field which is indexed.
+
+    Returns a dictionary of results.
+    """
+    from babelsearch.models import IndexEntry, Meaning, Word
+    from babelsearch.models import get_scored_matches_for_sentence
+    from babelsearch.reindexer import reindex_all
+    from babelsearch.sharding import get_index_databases
+    from babelsearch.vocabulary import import_meanings
+
+    def report(message):
+        if callback:
+            callback(message)
+
+    results = {}
+
+    report('Importing %d meanings' % len(corpus.vocabulary))
+    start = time.time()
+    import_meanings(corpus.vocabulary)
+    results['vocabulary_import_time'] = time.time() - start
+
+    report('Indexing %d documents' % documents)
+    start = time.time()
+    for text in corpus.documents(documents):
+        model.objects.create(text=text)
+    indexing_time = time.time() - start
+    entries = sum(IndexEntry.objects.using(database).count()
+                  for database in get_index_databases())
+    results['documents'] = documents
+    results['index_entries'] = entries
+    results['meanings'] = Meaning.objects.count()
+    results['words'] = Word.objects.count()
+    results['indexing_time'] = indexing_time
+    results['indexing_entries_per_second'] = (
+        indexing_time and entries / indexing_time)
+
+    report('Measuring lookup_splitting latency')
+    tokens = [corpus.make_token() for i in range(queries)]
+    results['lookup_splitting'] = _latencies(
+        lambda token: list(Meaning.objects.lookup_splitting(token)[0]),
+        tokens)
+
+    report('Measuring search latency')
+    results['search'] = _latencies(
+        lambda query: get_scored_matches_for_sentence(model, query),
+        list(corpus.queries(queries)))
+
+    report('Re-indexing')
+    start = time.time()
+    reindex_all()
+    results['reindex_time'] = time.time() - start
+
+    return results
+
+
+def compare_results(old, new, keys=('indexing_entries_per_second',
+                                    'lookup_splitting.p50',
+                                    'lookup_splitting.p99',
+                                    'search.p50',
+                                    'search.p99',
+                                    'reindex_time')):
+    """
+    Returns a list of ``(key, old value, new value, ratio)`` 4-tuples
+    for the main figures of two benchmark results.  Nested keys are
+    separated with dots.
+    """
+    def get(results, key):
+        for part in key.split('.'):
+            results = results.get(part) if results else None
+        return results
+
+    rows = []
+    for key in keys:
+        old_value, new_value = get(old, key), get(new, key)
+        ratio = old_value and new_value is not None and new_value / old_value
+        rows.append((key, old_value, new_value, ratio))
+    return rows
@@ -0,0 +1,48 @@
+from django.db import connections, router, transaction
+from django.db.models import AutoField
+
+
+def bulk_insert(model, instances, using=None):
+    """
+    Inserts unsaved `instances` of `model` into its table with a
+    single `executemany` call.  Primary keys of the new rows are not
+    set on the instances, so callers must look the rows up again if
+    they need them.
+
+    Returns the number of rows inserted.
+    """
+    instances = list(instances)
+    if not instances:
+        return 0
+    if using is None:
+        using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    opts = model._meta
+    fields = [field for field in opts.local_fields
+              if not isinstance(field, AutoField)]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(opts.db_table),
+        ', '.join(qn(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    params = [[field.get_db_prep_save(field.pre_save(instance, True),
+                                      connection=connection)
+               for field in fields]
+              for instance in instances]
+    cursor = connection.cursor()
+    cursor.executemany(sql, params)
+    transaction.commit_unless_managed(using=using)
+    return len(instances)
+
+
+# maximum number of parameters in one ``__in`` lookup, kept below the
+# default limit of SQLite
+IN_CHUNK_SIZE = 500
+
+def chunked(items, size=IN_CHUNK_SIZE):
+    """
+    Splits `items` into lists of at most `size` items, e.g. to keep
+    ``__in`` lookups within database parameter limits.
+    """
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -1,3 +1,18 @@
+from collections import OrderedDict
+import hashlib
+from itertools import groupby
+import math
+import struct
+import sys
+import threading
+
+from django.db import connections, router
+
+from babelsearch.bulk import chunked
+from babelsearch.dbindexes import (
+    SEED_PREFIX_LENGTH, prefix_filter, prefixes_where)
+
+
 class SetWrapper(object):
 
     def __init__(self, parent, items=()):
@@ -107,36 +122,266 @@ class SetList(object):
         return '<SetList %s>' % unicode(self)
 
 class PrefixCache(dict):
+    """
+    Caches the values of a field, loaded for all values with the same
+    prefix of `SEED_PREFIX_LENGTH` characters at a time.
+
+    Values are loaded from the database `using`, or the one the
+    router reads `model` from.  `bloom_filter` is an optional callable
+    which returns a `BloomFilter` of all values of the field, or
+    `None`.  Values missing from the filter are known to be missing
+    without loading their prefix.
+
+    `add` and `discard` only change prefixes which are loaded, since
+    a loaded prefix must hold all of its values.
 
-    def __init__(self, model, fieldname):
+    `get_stats` returns counters for monitoring: ``hits`` and
+    ``misses`` of `contains`, ``fills`` of prefixes from the database,
+    ``evictions`` of prefixes, and an estimate of the ``bytes`` held.
+
+    The cache may be shared by threads.  Prefixes are loaded while
+    holding its lock, so that values added meanwhile aren't lost.
+    """
+
+    def __init__(self, model, fieldname, bloom_filter=None, using=None):
         self.model = model
         self.fieldname = fieldname
+        self.bloom_filter = bloom_filter
+        self.using = using
+        self.lock = threading.RLock()
+        self.hits = self.misses = self.fills = self.evictions = 0
+        self.bytes = 0
+        self._bytes = {}  # prefix -> bytes held for its values
+
+    def _get_bloom_filter(self):
+        return self.bloom_filter and self.bloom_filter()
+
+    def _get_connection(self):
+        return connections[self.using or router.db_for_read(self.model)]
 
     def _instances_with_prefix(self, prefix):
-        return self.model.objects.filter(
-            **{'%s__startswith' % self.fieldname: prefix})
+        return self.model.objects.using(self.using).filter(
+            **prefix_filter(self.fieldname, prefix, self._get_connection()))
+
+    def _set_bytes(self, prefix, size):
+        self.bytes += size - self._bytes.get(prefix, 0)
+        self._bytes[prefix] = size
+
+    def _fill(self, prefix, values):
+        values = set(values)
+        self[prefix] = values
+        self._set_bytes(prefix, sys.getsizeof(values) +
+                        sum(sys.getsizeof(value) for value in values))
+        self.fills += 1
+        self._used(prefix)
+
+    def _used(self, prefix):
+        """Called when the values of `prefix` are used or changed"""
 
     def contains(self, s):
-        prefix = s[:2]
-        if prefix not in self:
-            self[prefix] = set(self._instances_with_prefix(prefix)
-                               .values_list(self.fieldname, flat=True)
-                               .distinct())
-        return s in self[prefix]
+        prefix = s[:SEED_PREFIX_LENGTH]
+        with self.lock:
+            if prefix in self:
+                self.hits += 1
+                self._used(prefix)
+                return s in self[prefix]
+            bloom_filter = self._get_bloom_filter()
+            if bloom_filter is not None and s not in bloom_filter:
+                self.hits += 1
+                return False
+            self.misses += 1
+            self._fill(prefix, self._instances_with_prefix(prefix)
+                       .values_list(self.fieldname, flat=True)
+                       .distinct())
+            return s in self[prefix]
 
     def seed(self, values):
+        """
+        Loads the values of all prefixes of `values` which aren't
+        loaded yet, with one query for up to `IN_CHUNK_SIZE` prefixes.
+        """
         if not values:
             return
-        qs = self.model.objects.none()
-        prefixes = set(value[:2] for value in values)
-        for prefix in prefixes:
-            if prefix not in self:
-                qs |= self._instances_with_prefix(prefix)
-        for found_value in qs.values_list(self.fieldname, flat=True):
-            self.add(found_value)
+        with self.lock:
+            bloom_filter = self._get_bloom_filter()
+            if bloom_filter is not None:
+                values = [value for value in values if value in bloom_filter]
+            prefixes = set(value[:SEED_PREFIX_LENGTH] for value in values
+                           if value[:SEED_PREFIX_LENGTH] not in self)
+            found = []
+            connection = self._get_connection()
+            for chunk in chunked(prefixes):
+                where, params = prefixes_where(self.model, self.fieldname,
+                                               chunk, connection)
+                found.extend(self.model.objects.using(self.using)
+                             .extra(where=where, params=params).order_by()
+                             .values_list(self.fieldname, flat=True))
+            found.sort()
+            found_by_prefix = dict(
+                (prefix, set(group)) for prefix, group
+                in groupby(found,
+                           key=lambda value: value[:SEED_PREFIX_LENGTH]))
+            for prefix in prefixes:
+                self._fill(prefix, found_by_prefix.get(prefix, ()))
 
     def add(self, s):
-        self.setdefault(s[:2], set()).add(s)
+        prefix = s[:SEED_PREFIX_LENGTH]
+        with self.lock:
+            values = self.get(prefix)
+            if values is None:
+                return
+            if s not in values:
+                values.add(s)
+                self._set_bytes(prefix,
+                                self._bytes[prefix] + sys.getsizeof(s))
+            self._used(prefix)
 
     def discard(self, s):
-        self.setdefault(s[:2], set()).discard(s)
+        prefix = s[:SEED_PREFIX_LENGTH]
+        with self.lock:
+            values = self.get(prefix)
+            if values is None:
+                return
+            if s in values:
+                values.discard(s)
+                self._set_bytes(prefix,
+                                self._bytes[prefix] - sys.getsizeof(s))
+            self._used(prefix)
+
+    def clear(self):
+        with self.lock:
+            super(PrefixCache, self).clear()
+            self._bytes.clear()
+            self.bytes = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'fills': self.fills, 'evictions': self.evictions,
+                    'bytes': self.bytes, 'prefixes': len(self)}
+
+
+class BoundedPrefixCache(PrefixCache):
+    """
+    A `PrefixCache` which evicts the least recently used prefixes
+    when their values take more than about `max_bytes`.
+    """
+
+    def __init__(self, model, fieldname, max_bytes, bloom_filter=None,
+                 using=None):
+        super(BoundedPrefixCache, self).__init__(
+            model, fieldname, bloom_filter=bloom_filter, using=using)
+        self.max_bytes = max_bytes
+        self._recent = OrderedDict()
+
+    def _used(self, prefix):
+        # called with the lock held
+        self._recent.pop(prefix, None)
+        self._recent[prefix] = True
+        # the prefix just used is kept even if it alone is too large
+        while self.bytes > self.max_bytes and len(self._recent) > 1:
+            oldest, _ = self._recent.popitem(last=False)
+            self.pop(oldest, None)
+            self._set_bytes(oldest, 0)
+            del self._bytes[oldest]
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            super(BoundedPrefixCache, self).clear()
+            self._recent.clear()
+
+
+class BoundedSet(object):
+    """
+    A set which forgets its oldest items when it grows beyond
+    `max_size` items.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        if self.max_size <= 0:
+            return
+        self.items.pop(item, None)
+        self.items[item] = True
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+
+class BloomFilter(object):
+    """
+    A set of strings which never misses a string added to it, but
+    reports about `error_rate` of other strings as members too while
+    it holds at most `capacity` strings.
+    """
+
+    # capacity, count, size in bits and number of hashes
+    header = struct.Struct('<QQQQ')
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.count = 0
+        self.size = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(
+            1, int(round(float(self.size) / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def from_values(cls, values, capacity, error_rate=0.01):
+        bloom_filter = cls(capacity, error_rate)
+        for value in values:
+            bloom_filter.add(value)
+        return bloom_filter
+
+    def save(self, f):
+        """Writes the filter to the binary file object `f`"""
+        f.write(self.header.pack(self.capacity, self.count,
+                                 self.size, self.hash_count))
+        f.write(self.bits)
+
+    @classmethod
+    def load(cls, f):
+        """Reads a filter written by `save` from the file object `f`"""
+        bloom_filter = cls.__new__(cls)
+        (bloom_filter.capacity, bloom_filter.count,
+         bloom_filter.size, bloom_filter.hash_count) = cls.header.unpack(
+            f.read(cls.header.size))
+        bloom_filter.bits = bytearray(f.read((bloom_filter.size + 7) // 8))
+        return bloom_filter
+
+    def _positions(self, s):
+        if isinstance(s, unicode):
+            s = s.encode('utf-8')
+        # double hashing with both halves of an MD5 digest, which is
+        # the same in every process
+        h1, h2 = struct.unpack('<QQ', hashlib.md5(s).digest())
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, s):
+        for position in self._positions(s):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, s):
+        bits = self.bits
+        for position in self._positions(s):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def is_full(self):
+        return self.count > self.capacity
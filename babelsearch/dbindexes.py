@@ -0,0 +1,208 @@
+"""
+Database indexes for the search access paths.
+
+Django can't declare indexes over several columns, so these are
+created by a migration and, for databases created with ``syncdb``, by
+a ``post_syncdb`` handler.  On PostgreSQL, the migration creates them
+with ``CREATE INDEX CONCURRENTLY`` so that large existing tables stay
+writable meanwhile, unless ``BABELSEARCH_CREATE_INDEXES_CONCURRENTLY``
+is `False`.
+
+Prefix lookups of words (`Word.objects.with_prefix`) need an index
+which supports ``LIKE 'prefix%'``.  On PostgreSQL with a collation
+other than C the plain index doesn't, so a ``varchar_pattern_ops``
+index is created, and with ``BABELSEARCH_TRIGRAM_INDEX = True`` also a
+``pg_trgm`` index for substring matching.  On SQLite, prefix filters
+add a range condition which the plain index serves.
+
+`PrefixCache.seed` loads the words with any of a set of two-character
+prefixes with one ``SUBSTR(...) IN (...)`` query, which an index on
+that expression serves on PostgreSQL and SQLite 3.9 and later.
+"""
+
+from django.conf import settings
+from django.db import connection as default_connection, transaction
+
+
+SEARCH_INDEXES = (
+    # candidates: entries for a meaning in one content type, covering
+    # the columns fetched by `get_index_info_for_meanings`
+    ('babelsearch_entry_search', 'babelsearch_indexentry',
+     ('content_type_id', 'meaning_id', 'object_id', 'order')),
+    # `lookup_exact` and `lookup_splitting`
+    ('babelsearch_word_spell_idx', 'babelsearch_word',
+     ('normalized_spelling', 'indexable')),
+    # meanings of words, the unique index only serves meaning -> words
+    ('babelsearch_meaning_words_w', 'babelsearch_meaning_words',
+     ('word_id', 'meaning_id')),
+)
+
+# length of the prefixes of `PrefixCache`
+SEED_PREFIX_LENGTH = 2
+
+PREFIX_INDEXES = (
+    # prefix lookups with LIKE regardless of the database collation
+    ('babelsearch_word_prefix', 'babelsearch_word',
+     '(normalized_spelling varchar_pattern_ops)', 'postgresql'),
+)
+
+SEED_INDEXES = (
+    ('babelsearch_word_seed', 'babelsearch_word',
+     '(substr(normalized_spelling, 1, %d))' % SEED_PREFIX_LENGTH,
+     'postgresql'),
+    ('babelsearch_word_seed', 'babelsearch_word',
+     '(substr(normalized_spelling, 1, %d))' % SEED_PREFIX_LENGTH,
+     'sqlite'),
+)
+
+TRIGRAM_INDEXES = (
+    ('babelsearch_word_trgm', 'babelsearch_word',
+     'USING gin (normalized_spelling gin_trgm_ops)', 'postgresql'),
+)
+
+
+def get_index_definitions(connection=None):
+    """
+    Returns a list of ``(name, table, definition)`` 3-tuples for the
+    indexes used by babelsearch on the given database connection.
+    """
+    connection = connection or default_connection
+    qn = connection.ops.quote_name
+    definitions = [
+        (name, table,
+         '(%s)' % ', '.join(qn(column) for column in columns))
+        for name, table, columns in SEARCH_INDEXES]
+    special = PREFIX_INDEXES
+    if supports_expression_indexes(connection):
+        special += SEED_INDEXES
+    if getattr(settings, 'BABELSEARCH_TRIGRAM_INDEX', False):
+        special += TRIGRAM_INDEXES
+    definitions.extend((name, table, definition)
+                       for name, table, definition, vendor in special
+                       if vendor == connection.vendor)
+    return definitions
+
+
+def supports_expression_indexes(connection):
+    if connection.vendor == 'sqlite':
+        from django.db.backends.sqlite3.base import Database
+        return Database.sqlite_version_info >= (3, 9)
+    return connection.vendor == 'postgresql'
+
+
+def prefixes_where(model, fieldname, prefixes, connection=None):
+    """
+    Returns a ``(where, params)`` 2-tuple for `QuerySet.extra` which
+    selects the values of `fieldname` starting with any of the
+    `prefixes` of `SEED_PREFIX_LENGTH` characters with one condition.
+    """
+    connection = connection or default_connection
+    qn = connection.ops.quote_name
+    column = '%s.%s' % (qn(model._meta.db_table),
+                        qn(model._meta.get_field(fieldname).column))
+    where = 'SUBSTR(%s, 1, %d) IN (%s)' % (
+        column, SEED_PREFIX_LENGTH, ', '.join(['%s'] * len(prefixes)))
+    return [where], list(prefixes)
+
+
+def prefix_filter(fieldname, prefix, connection=None):
+    """
+    Returns keyword arguments for `QuerySet.filter` which select the
+    values of `fieldname` starting with `prefix` using an index.
+    """
+    connection = connection or default_connection
+    lookups = {'%s__startswith' % fieldname: prefix}
+    if connection.vendor == 'sqlite' and prefix and ord(prefix[-1]) < 0xffff:
+        # SQLite's LIKE is case-insensitive and can't use the index
+        lookups['%s__gte' % fieldname] = prefix
+        lookups['%s__lt' % fieldname] = (
+            prefix[:-1] + unichr(ord(prefix[-1]) + 1))
+    return lookups
+
+
+def index_exists(connection, table, name):
+    cursor = connection.cursor()
+    if connection.vendor == 'postgresql':
+        cursor.execute('SELECT 1 FROM pg_indexes WHERE indexname = %s',
+                       [name])
+    elif connection.vendor == 'sqlite':
+        cursor.execute("SELECT 1 FROM sqlite_master "
+                       "WHERE type = 'index' AND name = %s", [name])
+    elif connection.vendor == 'mysql':
+        cursor.execute('SHOW INDEX FROM %s WHERE Key_name = %%s'
+                       % connection.ops.quote_name(table), [name])
+    elif connection.vendor == 'oracle':
+        cursor.execute('SELECT 1 FROM user_indexes WHERE index_name = %s',
+                       [name.upper()])
+    else:
+        return False
+    return bool(cursor.fetchall())
+
+
+def _execute_outside_transaction(connection, sql):
+    """
+    Runs `sql` in autocommit mode, which PostgreSQL requires for
+    ``CREATE INDEX CONCURRENTLY``.
+    """
+    cursor = connection.cursor()
+    old_level = connection.connection.isolation_level
+    connection.connection.set_isolation_level(0)
+    try:
+        cursor.execute(sql)
+    finally:
+        connection.connection.set_isolation_level(old_level)
+
+
+def create_search_indexes(connection=None, concurrently=False, names=None,
+                          definitions=None):
+    """
+    Creates those indexes of `get_index_definitions`, or of the given
+    `definitions`, which don't exist yet, or only those in `names`.
+    `concurrently` only has an effect on PostgreSQL, and must not be
+    used inside a transaction managed by the caller.
+
+    Returns the names of the indexes created.
+    """
+    connection = connection or default_connection
+    concurrently = concurrently and connection.vendor == 'postgresql'
+    qn = connection.ops.quote_name
+    if definitions is None:
+        definitions = get_index_definitions(connection)
+    created = []
+    for name, table, definition in definitions:
+        if names is not None and name not in names:
+            continue
+        if index_exists(connection, table, name):
+            continue
+        statements = []
+        if 'gin_trgm_ops' in definition:
+            statements.append('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        statements.append('CREATE INDEX %s%s ON %s %s' % (
+            concurrently and 'CONCURRENTLY ' or '',
+            qn(name), qn(table), definition))
+        for sql in statements:
+            if concurrently:
+                _execute_outside_transaction(connection, sql)
+            else:
+                connection.cursor().execute(sql)
+        created.append(name)
+    transaction.commit_unless_managed(using=connection.alias)
+    return created
+
+
+def drop_search_indexes(connection=None, names=None, definitions=None):
+    connection = connection or default_connection
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    if definitions is None:
+        definitions = get_index_definitions(connection)
+    for name, table, definition in definitions:
+        if names is not None and name not in names:
+            continue
+        if not index_exists(connection, table, name):
+            continue
+        if connection.vendor == 'mysql':
+            cursor.execute('DROP INDEX %s ON %s' % (qn(name), qn(table)))
+        else:
+            cursor.execute('DROP INDEX %s' % qn(name))
+    transaction.commit_unless_managed(using=connection.alias)
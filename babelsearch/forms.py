@@ -1,10 +1,8 @@
 from django import forms
-from django.db.models import Q
 from django.forms.formsets import formset_factory
 from django.utils.encoding import force_unicode
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
-import operator
 
 from babelsearch.models import Meaning, IndexEntry
 from babelsearch.preprocess import lower_without_diacritics
@@ -94,11 +92,7 @@ class MeaningForm(forms.Form):
         meaning.add_words(added_words)
 
         removed_words = old_words.difference(new_words)
-        if removed_words:
-            word_criteria = (Q(language=l, normalized_spelling=s)
-                             for l, s in removed_words)
-            combined_criteria = reduce(operator.or_, word_criteria)
-            meaning.words.remove(*meaning.words.filter(combined_criteria))
+        meaning.remove_words(removed_words)
 
         return meaning, added_words.union(removed_words)
 
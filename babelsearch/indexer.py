@@ -1,6 +1,97 @@
-from django.db.models.signals import pre_save, post_save, pre_delete
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.signals import (
+    pre_save, post_save, pre_delete, post_syncdb)
+
+from babelsearch.stopwords import forget_instance_count
 
 registry = {}
+metadata = {}
+
+
+class ModelMetadata(object):
+    """
+    Metadata of an indexed or searched model which the indexing and
+    search code needs on every call, resolved once per process:
+
+     * `field_paths`: the registered field names split into attribute
+       paths for `resolve_field_value`
+     * `table` and `pk_column`: the names of the model's table and
+       primary key column
+     * `select_related`: the paths of foreign keys on the way to
+       registered fields, which can be fetched with the instances
+     * `content_type_id`: the primary key of the model's content type
+
+    The last two are resolved on first use, since models are
+    registered while the application's models are being imported.
+    """
+
+    def __init__(self, model, fields=()):
+        opts = model._meta
+        self.model = model
+        self.fields = fields
+        self.field_paths = [tuple(fieldname.split('__'))
+                            for fieldname in fields]
+        self.table = opts.db_table
+        self.pk_column = opts.pk.column
+        self._select_related = None
+        self._content_type_id = None
+
+    @property
+    def select_related(self):
+        if self._select_related is None:
+            self._select_related = sorted(set(filter(None, (
+                _get_foreign_key_path(self.model, path)
+                for path in self.field_paths))))
+        return self._select_related
+
+    @property
+    def content_type_id(self):
+        if self._content_type_id is None:
+            from django.contrib.contenttypes.models import ContentType
+            self._content_type_id = (
+                ContentType.objects.get_for_model(self.model).pk)
+        return self._content_type_id
+
+
+def _get_foreign_key_path(model, path):
+    """
+    Returns the longest prefix of the attribute `path` which only
+    follows forward foreign keys, as a ``__`` separated string.
+    """
+    names = []
+    for name in path[:-1]:
+        try:
+            field, _model, direct, m2m = model._meta.get_field_by_name(name)
+        except FieldDoesNotExist:
+            break
+        if not direct or m2m or getattr(field, 'rel', None) is None:
+            break
+        names.append(name)
+        model = field.rel.to
+    return '__'.join(names)
+
+
+def get_metadata(model):
+    """
+    Returns the `ModelMetadata` of a model, which needn't be registered.
+    """
+    try:
+        return metadata[model]
+    except KeyError:
+        return metadata.setdefault(
+            model, ModelMetadata(model, registry.get(model, ())))
+
+
+def forget_content_types(**kwargs):
+    """
+    Callback for the `post_syncdb` signal, which is also sent when
+    flushing the database.  Content types may get new primary keys.
+    """
+    for model_metadata in metadata.values():
+        model_metadata._content_type_id = None
+
+post_syncdb.connect(forget_content_types)
+
 
 def unindex_old_instance(sender, instance, raw, **kwargs):
     """
@@ -27,6 +118,8 @@ def index_instance(instance, created, raw, **kwargs):
     if not raw:
         from babelsearch.models import IndexEntry
         IndexEntry.objects.create_for_instance(instance)
+        if created:
+            forget_instance_count(instance.__class__)
 
 def unindex_instance(instance, **kwargs):
     """
@@ -36,6 +129,7 @@ def unindex_instance(instance, **kwargs):
     """
     from babelsearch.models import IndexEntry
     IndexEntry.objects.delete_for_instance(instance)
+    forget_instance_count(instance.__class__)
 
 def register(model, fields):
     """
@@ -43,6 +137,7 @@ def register(model, fields):
     mentioned in `fields`.
     """
     registry[model] = fields
+    metadata[model] = ModelMetadata(model, fields)
     pre_save.connect(unindex_old_instance, sender=model)
     post_save.connect(index_instance, sender=model)
     pre_delete.connect(unindex_instance, sender=model)
@@ -57,4 +152,5 @@ def unregister(model):
     pre_save.disconnect(unindex_old_instance, sender=model)
     fields = registry[model]
     del registry[model]
+    metadata.pop(model, None)
     return fields
@@ -0,0 +1,183 @@
+"""
+Timing and query counting for searches and indexing.
+
+Every call to `get_scored_matches_for_sentence` and
+`IndexManager.create_for_instance` produces a `Stats` object which is
+sent with the `stats_collected` signal.  The sender is the kind of the
+operation, ``'search'`` or ``'index'``.  Stats can also be collected
+for a block of code with the `collect_stats` context manager::
+
+    with collect_stats() as collected:
+        get_scored_matches_for_sentence(Sentence, u'piano concerto')
+    for stats in collected:
+        send_to_metrics(stats.kind, stats.as_dict())
+
+Database queries are only counted when Django logs them, i.e. when
+``DEBUG`` is on or inside `collect_stats(count_queries=True)`.  Only
+queries of the thread running the operation are counted, so those run
+in pool threads by a `babelsearch.parallel.ThreadExecutor`, e.g. when
+searching index shards with `map_shards`, are left out.
+
+Setting ``BABELSEARCH_LOG_STATS = True`` logs all stats to the
+``babelsearch.instrumentation`` logger at debug level.
+"""
+
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal
+
+
+stats_collected = Signal(providing_args=['stats'])
+
+logger = logging.getLogger('babelsearch.instrumentation')
+
+_local = threading.local()
+
+
+def _count_logged_queries():
+    return sum(len(connection.queries) for connection in connections.all())
+
+
+def _queries_logged():
+    return any(connection.use_debug_cursor or
+               (connection.use_debug_cursor is None and settings.DEBUG)
+               for connection in connections.all())
+
+
+class Stats(object):
+    """
+    Timings, query counts and other information about one search or
+    indexing operation.
+
+     * `timings` maps phase names to seconds spent
+     * `queries` maps phase names to numbers of database queries, and
+       is empty if queries weren't being logged
+     * `info` holds other values recorded by the operation, e.g. the
+       search tokens or the number of rows written
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.timings = {}
+        self.queries = {}
+        self.info = {}
+        self.total_time = 0.0
+        self._count_queries = _queries_logged()
+
+    @contextmanager
+    def measure(self, phase):
+        """
+        Adds the time spent and queries made inside the block to the
+        totals of the given phase.
+        """
+        if self._count_queries:
+            queries_before = _count_logged_queries()
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[phase] = (
+                self.timings.get(phase, 0.0) + time.time() - start)
+            if self._count_queries:
+                self.queries[phase] = (self.queries.get(phase, 0) +
+                                       _count_logged_queries() -
+                                       queries_before)
+
+    def record(self, **info):
+        self.info.update(info)
+
+    def as_dict(self):
+        result = {'kind': self.kind,
+                  'total_time': self.total_time,
+                  'timings': dict(self.timings),
+                  'queries': dict(self.queries)}
+        result.update(self.info)
+        return result
+
+    def __repr__(self):
+        return '<Stats %s %.4fs %r>' % (self.kind, self.total_time,
+                                        self.timings)
+
+
+class _NullStats(object):
+    """Stand-in for `Stats` used when no operation is active"""
+
+    @contextmanager
+    def measure(self, phase):
+        yield
+
+    def record(self, **info):
+        pass
+
+_null_stats = _NullStats()
+
+
+def current_stats():
+    """
+    Returns the `Stats` of the innermost active operation in this
+    thread, or a stand-in which ignores everything.
+    """
+    operations = getattr(_local, 'operations', None)
+    return operations and operations[-1] or _null_stats
+
+
+@contextmanager
+def operation(kind):
+    """
+    Creates a `Stats` object for the duration of the block and sends
+    it with `stats_collected` afterwards.
+    """
+    stats = Stats(kind)
+    operations = _local.__dict__.setdefault('operations', [])
+    operations.append(stats)
+    start = time.time()
+    try:
+        yield stats
+    finally:
+        stats.total_time = time.time() - start
+        operations.pop()
+        for collected in getattr(_local, 'collectors', ()):
+            collected.append(stats)
+        stats_collected.send(sender=kind, stats=stats)
+
+
+@contextmanager
+def collect_stats(count_queries=True):
+    """
+    Yields a list which receives the `Stats` of all operations
+    finished in this thread inside the block.  With `count_queries`,
+    query logging is turned on for all database connections of this
+    thread inside the block, and the queries logged meanwhile are
+    dropped afterwards so that the log doesn't grow in long-running
+    processes.
+    """
+    collected = []
+    collectors = _local.__dict__.setdefault('collectors', [])
+    collectors.append(collected)
+    if count_queries:
+        old_settings = [(connection, connection.use_debug_cursor,
+                         len(connection.queries))
+                        for connection in connections.all()]
+        for connection, _old, _logged in old_settings:
+            connection.use_debug_cursor = True
+    try:
+        yield collected
+    finally:
+        collectors.remove(collected)
+        if count_queries:
+            for connection, old, logged in old_settings:
+                connection.use_debug_cursor = old
+                del connection.queries[logged:]
+
+
+def log_stats(sender, stats, **kwargs):
+    """Receiver for `stats_collected` which logs the stats"""
+    logger.debug('%s: %r', sender, stats.as_dict())
+
+if getattr(settings, 'BABELSEARCH_LOG_STATS', False):
+    stats_collected.connect(log_stats)
@@ -0,0 +1,101 @@
+from django.core.management.base import NoArgsCommand, CommandError
+from optparse import make_option
+import datetime
+import json
+import os
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--entries', '-e', dest='entries', type='int',
+            default=10000,
+            help='Approximate number of index entries to create.'),
+        make_option('--meanings', '-m', dest='meanings', type='int',
+            default=2000,
+            help='Number of meanings in the synthetic vocabulary.'),
+        make_option('--words-per-document', dest='words_per_document',
+            type='int', default=8,
+            help='Average number of words in a document.'),
+        make_option('--queries', '-q', dest='queries', type='int',
+            default=200,
+            help='Number of lookups and searches to time.'),
+        make_option('--seed', dest='seed', type='int', default=0,
+            help='Seed for the corpus generator.'),
+        make_option('--model', dest='model', default='testapp.Sentence',
+            help='Indexed model with a text field, as app_label.Model.'),
+        make_option('--output', '-o', dest='output',
+            default='babelsearch-benchmark.jsonl',
+            help='File to append results to, one JSON object per line.'),
+        make_option('--label', '-l', dest='label', default='',
+            help='Label stored with the results, e.g. a version.'),
+    )
+    help = ('Benchmark babelsearch indexing and search in a new test '
+            'database with a synthetic corpus')
+
+    def handle_noargs(self, **options):
+        from django.conf import settings
+        from django.db.models import get_model
+        from django.test.simple import DjangoTestSuiteRunner
+        from babelsearch import indexer
+        from babelsearch.benchmark import (
+            SyntheticCorpus, run_benchmark, compare_results)
+        from babelsearch.models import Word
+
+        model = get_model(*options['model'].split('.', 1))
+        if model not in indexer.registry:
+            raise CommandError('Model %s is not registered for indexing'
+                               % options['model'])
+
+        parameters = dict((key, options[key]) for key in (
+            'entries', 'meanings', 'words_per_document', 'queries', 'seed',
+            'model'))
+        corpus = SyntheticCorpus(
+            meanings=options['meanings'],
+            words_per_document=options['words_per_document'],
+            seed=options['seed'])
+        documents = max(1, options['entries'] //
+                        options['words_per_document'])
+
+        def show_progress(message):
+            print message
+
+        # test databases for all aliases, since index shards and
+        # replicas must not receive the benchmark's writes
+        runner = DjangoTestSuiteRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            if hasattr(Word, '_caches'):
+                del Word._caches
+            results = run_benchmark(model, corpus, documents,
+                                    queries=options['queries'],
+                                    callback=show_progress)
+        finally:
+            runner.teardown_databases(old_config)
+
+        record = {'label': options['label'],
+                  'engine': settings.DATABASES['default']['ENGINE'],
+                  'time': datetime.datetime.now().isoformat(),
+                  'parameters': parameters,
+                  'results': results}
+
+        previous = None
+        path = options['output']
+        if os.path.exists(path):
+            for line in open(path):
+                old_record = json.loads(line)
+                if (old_record['engine'] == record['engine'] and
+                    old_record['parameters'] == parameters):
+                    previous = old_record
+        with open(path, 'a') as output:
+            output.write(json.dumps(record) + '\n')
+
+        print json.dumps(results, indent=2, sort_keys=True)
+        if previous:
+            print '\nCompared to %s (%s):' % (previous['label'] or '-',
+                                             previous['time'])
+            for key, old, new, ratio in compare_results(previous['results'],
+                                                        results):
+                print '%-30s %12s %12s %8s' % (
+                    key, '%.5g' % old if old is not None else '-',
+                    '%.5g' % new if new is not None else '-',
+                    '%.2fx' % ratio if ratio else '-')
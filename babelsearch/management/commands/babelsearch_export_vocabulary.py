@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+import codecs
+import sys
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--format', '-f', dest='format', default='txt',
+            help='File format: txt, tsv, csv or jsonl.'),
+        make_option('--batch-size', '-b', dest='batch_size', type='int',
+            default=1000,
+            help='Number of meanings to fetch per query.'),
+    )
+    help = ('Export the babelsearch vocabulary with one meaning per line')
+    args = '[file]'
+
+    def handle(self, *args, **options):
+        from babelsearch.vocabulary import (
+            FORMATS, iter_meanings, format_meanings)
+
+        format = options['format']
+        if format not in FORMATS:
+            raise CommandError('Unknown format %r' % format)
+        if len(args) > 1:
+            raise CommandError('Give at most one file name')
+
+        def write_lines(output):
+            meanings = iter_meanings(batch_size=options['batch_size'])
+            for line in format_meanings(meanings, format):
+                output.write(line)
+                output.write(u'\n')
+
+        if args and args[0] != '-':
+            with codecs.open(args[0], 'w', encoding='utf-8') as output:
+                write_lines(output)
+        else:
+            write_lines(codecs.getwriter('utf-8')(sys.stdout))
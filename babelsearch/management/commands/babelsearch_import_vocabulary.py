@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+import codecs
+import os
+import sys
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--format', '-f', dest='format',
+            help='File format: txt, tsv, csv or jsonl. '
+                 'Guessed from the file extension by default.'),
+        make_option('--batch-size', '-b', dest='batch_size', type='int',
+            default=1000,
+            help='Number of meanings to create per transaction.'),
+        make_option('--no-reindex', action='store_false', dest='reindex',
+            default=True,
+            help='Do not queue a re-index after importing.'),
+    )
+    help = ('Import meanings into the babelsearch vocabulary from a file '
+            'with one meaning per line')
+    args = '<file or ->'
+
+    def handle(self, *args, **options):
+        from babelsearch.reindexer import queue_full_reindex
+        from babelsearch.vocabulary import (
+            FORMATS, VocabularyFormatError, read_meanings, import_meanings)
+
+        if len(args) != 1:
+            raise CommandError('Give exactly one file name, or - for stdin')
+        path, = args
+        format = options.get('format')
+        if not format:
+            format = os.path.splitext(path)[1].lstrip('.') or 'txt'
+        if format not in FORMATS:
+            raise CommandError('Unknown format %r' % format)
+
+        def show_progress(count):
+            print '%d meanings imported' % count
+
+        def import_lines(lines):
+            try:
+                return import_meanings(read_meanings(lines, format),
+                                       batch_size=options['batch_size'],
+                                       callback=show_progress)
+            except VocabularyFormatError, e:
+                raise CommandError(str(e))
+
+        if path == '-':
+            count = import_lines(codecs.getreader('utf-8')(sys.stdin))
+        else:
+            with codecs.open(path, encoding='utf-8') as lines:
+                count = import_lines(lines)
+        if count and options['reindex']:
+            queue_full_reindex()
+            print 'Queued a re-index of all indexed instances'
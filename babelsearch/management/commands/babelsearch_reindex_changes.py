@@ -8,6 +8,9 @@ class Command(NoArgsCommand):
     option_list = NoArgsCommand.option_list + (
         make_option('--once', '-o', action='store_true', dest='once',
             help='Run reindexing only once and quit.'),
+        make_option('--processes', '-p', dest='processes', type='int',
+            help='Number of processes splitting words when re-indexing '
+                 'all instances.'),
     )
     help = 'Re-index whenever babelsearch vocabulary changes'
 
@@ -29,7 +32,9 @@ class Command(NoArgsCommand):
             else:
                 if trigger_time > last_trigger_time:
                     last_trigger_time = trigger_time
-                    work_done = reindex_for_changes(callback=show_instance)
+                    work_done = reindex_for_changes(
+                        callback=show_instance,
+                        processes=options.get('processes'))
                     if work_done and options.get('once', False):
                         break
                     continue
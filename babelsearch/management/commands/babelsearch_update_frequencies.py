@@ -0,0 +1,14 @@
+from django.core.management.base import NoArgsCommand
+
+
+class Command(NoArgsCommand):
+    help = ('Recompute word frequencies and meaning document frequencies '
+            'from the babelsearch index')
+
+    def handle_noargs(self, **options):
+        from babelsearch.models import Meaning, Word
+
+        print 'Updating word frequencies...'
+        Word.objects.update_frequencies()
+        print 'Updating meaning document frequencies...'
+        Meaning.objects.update_document_frequencies()
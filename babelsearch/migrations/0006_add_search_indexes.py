@@ -0,0 +1,92 @@
+# encoding: utf-8
+import datetime
+from django.conf import settings
+from django.db import connections
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+from babelsearch.dbindexes import create_search_indexes, drop_search_indexes
+
+# frozen here, since changes to `babelsearch.dbindexes.SEARCH_INDEXES`
+# need migrations of their own
+SEARCH_INDEXES = (
+    ('babelsearch_entry_search', 'babelsearch_indexentry',
+     ('content_type_id', 'meaning_id', 'object_id', 'order')),
+    ('babelsearch_word_spell_idx', 'babelsearch_word',
+     ('normalized_spelling', 'indexable')),
+    ('babelsearch_meaning_words_w', 'babelsearch_meaning_words',
+     ('word_id', 'meaning_id')),
+)
+
+def get_definitions(connection):
+    qn = connection.ops.quote_name
+    return [(name, table,
+             '(%s)' % ', '.join(qn(column) for column in columns))
+            for name, table, columns in SEARCH_INDEXES]
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        if db.dry_run:
+            return
+        connection = connections[db.db_alias]
+        concurrently = (
+            connection.vendor == 'postgresql' and
+            getattr(settings, 'BABELSEARCH_CREATE_INDEXES_CONCURRENTLY', True))
+        if concurrently:
+            # CREATE INDEX CONCURRENTLY can't run in the transaction
+            # South wraps migrations in
+            db.commit_transaction()
+        create_search_indexes(connection, concurrently=concurrently,
+                              definitions=get_definitions(connection))
+        if concurrently:
+            db.start_transaction()
+
+
+    def backwards(self, orm):
+        if not db.dry_run:
+            connection = connections[db.db_alias]
+            drop_search_indexes(connection,
+                                definitions=get_definitions(connection))
+
+
+    models = {
+        'babelsearch.indexentry': {
+            'Meta': {'ordering': "('content_type', 'object_id', 'order')", 'unique_together': "(('content_type', 'object_id', 'order', 'meaning'),)", 'object_name': 'IndexEntry'},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'meaning': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'index_entries'", 'to': "orm['babelsearch.Meaning']"}),
+            'object_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'order': ('django.db.models.fields.PositiveIntegerField', [], {})
+        },
+        'babelsearch.meaning': {
+            'Meta': {'object_name': 'Meaning'},
+            'document_frequency': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'words': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['babelsearch.Word']", 'symmetrical': 'False'})
+        },
+        'babelsearch.reindexqueue': {
+            'Meta': {'object_name': 'ReindexQueue'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'type': ('django.db.models.fields.CharField', [], {'max_length': '40'}),
+            'value': ('django.db.models.fields.CharField', [], {'max_length': '200'})
+        },
+        'babelsearch.word': {
+            'Meta': {'ordering': "('language', 'normalized_spelling')", 'unique_together': "(('normalized_spelling', 'language'),)", 'object_name': 'Word'},
+            'frequency': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'indexable': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'language': ('django.db.models.fields.CharField', [], {'max_length': '5', 'null': 'True'}),
+            'normalized_spelling': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        }
+    }
+
+    complete_apps = ['babelsearch']
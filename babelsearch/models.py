@@ -1,14 +1,42 @@
-from django.db import models, connection
+from django.db import models, connection, connections, router, transaction
+from django.db.models import Count, F, Max
 from django.db.models.base import ModelBase
+from django.db.models.query import EmptyQuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
 from django.db.models.signals import post_syncdb
 from django.conf import settings
 from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
+from contextlib import contextmanager
+import heapq
+import itertools
+import math
 import operator
+import os
+import struct
 import sys
-
-from babelsearch.datastruct import SetList, PrefixCache
-from babelsearch.preprocess import get_words, get_instance_words
+import threading
+import time
+
+from babelsearch.autocomplete import Completer
+from babelsearch.bulk import IN_CHUNK_SIZE, bulk_insert, chunked
+from babelsearch.datastruct import (
+    BloomFilter, BoundedPrefixCache, BoundedSet, PrefixCache, SetList)
+from babelsearch.dbindexes import (
+    create_search_indexes, get_index_definitions, prefix_filter)
+from babelsearch.indexer import get_metadata
+from babelsearch.instrumentation import current_stats, operation
+from babelsearch.sharding import (
+    get_index_databases, get_shard, get_shards_for_model, is_sharded,
+    map_shards)
+from babelsearch.preprocess import (
+    get_words, get_instance_words, lower_without_diacritics)
+from babelsearch.replicas import (
+    get_primary, get_read_database, primary_reads)
+from babelsearch.stopwords import (
+    get_common_meaning_pks, get_instance_count, get_stopword_spellings,
+    index_stopwords)
+from babelsearch import vectorized
 
 
 def unique_substrings(s):
@@ -68,37 +96,485 @@ def sorted_divisions(s, vocabulary, max_parts=3, min_lengths=(1, 3)):
                   max_parts=max_parts, min_lengths=min_lengths))
 
 
+class _TooManySteps(Exception):
+    pass
+
+
+def best_division(s, vocabulary, max_parts=3, min_lengths=(1, 3),
+                  max_steps=None):
+    """Returns the first division of `sorted_divisions`, or `None`
+
+    Only the best divisions of each suffix of ``s`` are kept, for each
+    number of parts and shortest part length, and each suffix is
+    solved once per recursion level and number of remaining parts.
+
+    With ``max_steps``, gives up and returns `None` after looking up
+    that many substrings in ``vocabulary``.
+    """
+    if not s:
+        return None
+    memo = {}
+    steps = [0]
+    last_level = len(min_lengths) - 1
+
+    def solve(offset, level, parts_left):
+        # maps (number of parts, length of the shortest part) to the
+        # lowest division of s[offset:] with those
+        key = offset, level, parts_left
+        if key in memo:
+            return memo[key]
+        best = {}
+        if s[offset].isdigit():
+            # numbers are never split
+            starts = [len(s)]
+        else:
+            starts = range(offset + max(min_lengths[level], 1), len(s) + 1)
+            if parts_left == 1:
+                starts = starts[-1:]
+        for end in starts:
+            if max_steps is not None:
+                steps[0] += 1
+                if steps[0] > max_steps:
+                    raise _TooManySteps
+            part = s[offset:end]
+            if part not in vocabulary:
+                continue
+            if end == len(s):
+                candidates = [((1, len(part)), (part,))]
+            else:
+                candidates = [
+                    ((parts + 1, min(len(part), shortest)), (part,) + rest)
+                    for (parts, shortest), rest in solve(
+                        end, min(level + 1, last_level),
+                        parts_left - 1).iteritems()]
+            for candidate_key, division in candidates:
+                if candidate_key not in best or division < best[candidate_key]:
+                    best[candidate_key] = division
+        memo[key] = best
+        return best
+
+    try:
+        found = solve(0, 0, max_parts)
+    except _TooManySteps:
+        return None
+    if not found:
+        return None
+    (parts, shortest), division = min(
+        found.iteritems(),
+        key=lambda ((parts, shortest), division): (parts, -shortest, division))
+    return division
+
+
+class WordManager(models.Manager):
+
+    @primary_reads
+    def get_or_create_many(self, words):
+        """
+        Returns a dictionary mapping each ``(language,
+        normalized_spelling)`` 2-tuple in `words` to a `Word`
+        instance.  Existing words are fetched with one query, and
+        missing words are inserted with one bulk insert and then
+        fetched with one more query.
+        """
+        wanted = set((language, spelling) for language, spelling in words)
+        if not wanted:
+            return {}
+        spellings = set(spelling for language, spelling in wanted)
+        found = self._get_many(wanted, spellings)
+        missing = wanted.difference(found)
+        if missing:
+            bulk_insert(self.model,
+                        (self.model(language=language,
+                                    normalized_spelling=spelling)
+                         for language, spelling in missing))
+            found.update(self._get_many(
+                missing, set(spelling for language, spelling in missing)))
+            for cache in self.model._get_caches():
+                for language, spelling in missing:
+                    cache.add(spelling)
+            self.model._vocabulary_changed(
+                spelling for language, spelling in missing)
+            completer = _get_loaded_completer()
+            if completer:
+                for key in missing:
+                    word = found[key]
+                    completer.set_word(word.pk, word.normalized_spelling,
+                                       word.language, word.frequency)
+        return found
+
+    def complete(self, prefix, limit=10):
+        """
+        Returns up to `limit` completions of `prefix` from the in-memory
+        `Completer`, most frequent words first.
+        """
+        return self.model.get_completer().complete(
+            lower_without_diacritics(prefix), limit)
+
+    def with_prefix(self, prefix):
+        """
+        Returns a queryset of indexable words starting with `prefix`,
+        filtered so that the database can use a prefix index.
+        """
+        return self.filter(indexable=True,
+                           **prefix_filter('normalized_spelling', prefix))
+
+    def _get_many(self, wanted, spellings):
+        found = {}
+        for chunk in chunked(spellings):
+            for word in self.filter(normalized_spelling__in=chunk):
+                key = word.language, word.normalized_spelling
+                if key in wanted:
+                    found[key] = word
+        return found
+
+    @primary_reads
+    def update_frequencies(self, word_pks=None, chunk_size=IN_CHUNK_SIZE):
+        """
+        Recomputes the `frequency` of the given words, or all words,
+        from the index.  Words are processed in chunks of
+        `chunk_size`, each with one aggregate query.
+        """
+        if word_pks is None:
+            word_pks = self.order_by('pk').values_list('pk', flat=True)
+        qn = connection.ops.quote_name
+        for chunk in chunked(word_pks, chunk_size):
+            if is_sharded():
+                counts = self._count_documents_in_shards(chunk)
+            else:
+                cursor = connection.cursor()
+                cursor.execute(
+                    'SELECT word_id, COUNT(*) FROM'
+                    ' (SELECT DISTINCT mw.word_id, ie.content_type_id,'
+                    '   ie.object_id'
+                    '  FROM %s ie INNER JOIN %s mw'
+                    '   ON mw.meaning_id = ie.meaning_id'
+                    '  WHERE mw.word_id IN (%s)) AS documents'
+                    ' GROUP BY word_id' % (
+                        qn(IndexEntry._meta.db_table),
+                        qn(Meaning.words.through._meta.db_table),
+                        ', '.join(['%s'] * len(chunk))),
+                    chunk)
+                counts = cursor.fetchall()
+            pks_by_frequency = {0: set(chunk)}
+            for word_pk, frequency in counts:
+                pks_by_frequency[0].discard(word_pk)
+                pks_by_frequency.setdefault(frequency, set()).add(word_pk)
+            completer = _get_loaded_completer()
+            for frequency, pks in pks_by_frequency.iteritems():
+                if pks:
+                    self.filter(pk__in=pks).update(frequency=frequency)
+                    if completer:
+                        for pk in pks:
+                            completer.set_frequency(pk, frequency)
+            transaction.commit_unless_managed()
+
+    def _count_documents_in_shards(self, word_pks):
+        """
+        Returns ``(word pk, frequency)`` 2-tuples for words with index
+        entries when the index is sharded and can't be joined to the
+        vocabulary tables.
+        """
+        word_pks_by_meaning = {}
+        for meaning_pk, word_pk in (Meaning.words.through.objects
+                                    .filter(word__in=word_pks)
+                                    .values_list('meaning', 'word')):
+            word_pks_by_meaning.setdefault(meaning_pk, []).append(word_pk)
+        documents = {}
+        for database in get_index_databases():
+            for chunk in chunked(word_pks_by_meaning):
+                for meaning_pk, ctype_pk, object_id in (
+                    IndexEntry.objects.using(database)
+                    .filter(meaning__in=chunk).order_by()
+                    .values_list('meaning', 'content_type', 'object_id')
+                    .distinct()):
+                    for word_pk in word_pks_by_meaning[meaning_pk]:
+                        documents.setdefault(word_pk, set()).add(
+                            (ctype_pk, object_id))
+        return [(pk, len(keys)) for pk, keys in documents.iteritems()]
+
+    @contextmanager
+    def batched_frequency_updates(self):
+        """
+        Defers frequency changes caused by indexing inside the block
+        and applies them in one go at the end, with one query to map
+        meanings to words and one update per distinct change.
+        """
+        batches = _frequency_local.__dict__.setdefault('batches', [])
+        batch = FrequencyChanges()
+        batches.append(batch)
+        try:
+            yield batch
+        finally:
+            batches.pop()
+            batch.flush()
+
+
+class FrequencyChanges(object):
+    """
+    Collects changes to word frequencies as sets of meanings of
+    indexed or unindexed instances, and applies them with `flush`.
+
+    The frequency of a word is the number of indexed instances which
+    have an index entry for a meaning of the word.  It can always be
+    recomputed from the index with `WordManager.update_frequencies`.
+    """
+
+    def __init__(self):
+        self.changes = []
+
+    def add(self, meaning_pks, delta):
+        if meaning_pks:
+            self.changes.append((set(meaning_pks), delta))
+
+    @primary_reads
+    def flush(self):
+        if not self.changes:
+            return
+        meaning_pks = set()
+        for pks, delta in self.changes:
+            meaning_pks.update(pks)
+        word_pks_by_meaning = {}
+        through = Meaning.words.through
+        for chunk in chunked(meaning_pks):
+            for meaning_pk, word_pk in (through.objects
+                                        .filter(meaning__in=chunk)
+                                        .values_list('meaning', 'word')):
+                word_pks_by_meaning.setdefault(meaning_pk, set()).add(word_pk)
+        deltas = {}
+        for pks, delta in self.changes:
+            word_pks = set()
+            for meaning_pk in pks:
+                word_pks.update(word_pks_by_meaning.get(meaning_pk, ()))
+            for word_pk in word_pks:
+                deltas[word_pk] = deltas.get(word_pk, 0) + delta
+        self.changes = []
+        pks_by_delta = {}
+        for word_pk, delta in deltas.iteritems():
+            if delta:
+                pks_by_delta.setdefault(delta, []).append(word_pk)
+        completer = _get_loaded_completer()
+        for delta, pks in pks_by_delta.iteritems():
+            for chunk in chunked(pks):
+                (Word.objects.filter(pk__in=chunk)
+                 .update(frequency=F('frequency') + delta))
+            if completer:
+                for pk in pks:
+                    completer.change_frequency(pk, delta)
+
+
+_frequency_local = threading.local()
+
+def _change_frequencies(meaning_pks, delta):
+    """
+    Changes word frequencies for an instance with the given meanings
+    being indexed (`delta` = 1) or unindexed (`delta` = -1).  Deferred
+    inside `WordManager.batched_frequency_updates`.
+    """
+    batches = getattr(_frequency_local, 'batches', None)
+    if batches:
+        batches[-1].add(meaning_pks, delta)
+    else:
+        changes = FrequencyChanges()
+        changes.add(meaning_pks, delta)
+        changes.flush()
+
+
+_completer_lock = threading.Lock()
+_vocabulary_lock = threading.Lock()
+
+DEFAULT_UNKNOWN_WORD_CACHE_SIZE = 0
+
+DEFAULT_VOCABULARY_BLOOM_FILTER_REFRESH = 300  # seconds
+
+def _get_loaded_completer():
+    """
+    Returns the `Completer` if `Word.get_completer` has loaded it, so
+    that processes which don't use completion don't pay for updates.
+    """
+    return getattr(Word, '_completer', None)
+
+
 class Word(models.Model):
     normalized_spelling = models.CharField(max_length=100)
     language = models.CharField(max_length=5, null=True)
     frequency = models.IntegerField(default=0)
     indexable = models.BooleanField(default=True)
 
+    objects = WordManager()
+
+    # incremented whenever this process changes the vocabulary
+    _vocabulary_version = 0
+    _bloom_filter = _bloom_filter_signature = None
+    _bloom_filter_checked = 0
+
+    @classmethod
+    def _get_cache(cls, using=None):
+        """
+        Returns the `PrefixCache` of spellings in the database `using`,
+        by default the one words are read from.  With
+        ``BABELSEARCH_PREFIX_CACHE_MAX_BYTES``, it evicts the least
+        recently used prefixes to stay within about that many bytes.
+        """
+        using = using or router.db_for_read(cls)
+        with _vocabulary_lock:
+            if not hasattr(cls, '_caches'):
+                cls._caches = {}
+            if using not in cls._caches:
+                max_bytes = getattr(settings,
+                                    'BABELSEARCH_PREFIX_CACHE_MAX_BYTES', None)
+                if max_bytes:
+                    cls._caches[using] = BoundedPrefixCache(
+                        cls, 'normalized_spelling', max_bytes,
+                        bloom_filter=cls.get_bloom_filter, using=using)
+                else:
+                    cls._caches[using] = PrefixCache(
+                        cls, 'normalized_spelling',
+                        bloom_filter=cls.get_bloom_filter, using=using)
+            return cls._caches[using]
+
+    @classmethod
+    def _get_caches(cls):
+        """
+        Returns the spelling caches of all databases, which are all
+        updated when words are written.  A replica which hasn't caught
+        up yet then only lacks the meanings of new words.
+        """
+        with _vocabulary_lock:
+            return getattr(cls, '_caches', {}).values()
+
+    @classmethod
+    def get_prefix_cache_stats(cls, using=None):
+        """
+        Returns the counters of the spelling cache of this process
+        for monitoring, see `PrefixCache.get_stats`.
+        """
+        return cls._get_cache(using).get_stats()
+
+    @classmethod
+    def _get_unknown_words(cls, using):
+        """
+        Returns the `BoundedSet` of spellings which can't be divided
+        into indexable words of the current vocabulary version in the
+        database `using`.  Holds at most
+        ``BABELSEARCH_UNKNOWN_WORD_CACHE_SIZE`` spellings.
+        """
+        with _vocabulary_lock:
+            version, by_database = getattr(cls, '_unknown_words', (None, {}))
+            if version != cls._vocabulary_version:
+                by_database = {}
+                cls._unknown_words = cls._vocabulary_version, by_database
+            if using not in by_database:
+                by_database[using] = BoundedSet(
+                    getattr(settings, 'BABELSEARCH_UNKNOWN_WORD_CACHE_SIZE',
+                            DEFAULT_UNKNOWN_WORD_CACHE_SIZE))
+            return by_database[using]
+
+    @classmethod
+    def get_bloom_filter(cls):
+        """
+        Returns a `BloomFilter` of the spellings of all words, or
+        `None` unless ``BABELSEARCH_VOCABULARY_BLOOM_FILTER`` is `True`.
+
+        The filter is built for a `get_vocabulary_signature`.  Every
+        ``BABELSEARCH_VOCABULARY_BLOOM_FILTER_REFRESH`` seconds, the
+        signature is checked and the filter replaced if words have been
+        added or deleted since, e.g. by other processes.  The
+        replacement is read from the file
+        ``BABELSEARCH_VOCABULARY_BLOOM_FILTER_PATH`` if it was written
+        for the current signature, and otherwise built and written
+        there for other processes.  Words added or changed by this
+        process are also added to the filter right away.
+
+        Renaming a word doesn't change the signature, so after words
+        have been renamed by another process, delete the file and
+        restart the processes which use it.
+        """
+        if not getattr(settings, 'BABELSEARCH_VOCABULARY_BLOOM_FILTER', False):
+            return None
+        refresh = getattr(settings, 'BABELSEARCH_VOCABULARY_BLOOM_FILTER_REFRESH',
+                          DEFAULT_VOCABULARY_BLOOM_FILTER_REFRESH)
+        with _vocabulary_lock:
+            bloom_filter = getattr(cls, '_bloom_filter', None)
+            now = time.time()
+            if (bloom_filter is not None and not bloom_filter.is_full() and
+                now < cls._bloom_filter_checked + refresh):
+                return bloom_filter
+            signature = get_vocabulary_signature()
+            if (bloom_filter is None or bloom_filter.is_full() or
+                signature != cls._bloom_filter_signature):
+                path = getattr(settings,
+                               'BABELSEARCH_VOCABULARY_BLOOM_FILTER_PATH', None)
+                bloom_filter = None
+                if path and os.path.exists(path):
+                    bloom_filter, file_signature = read_vocabulary_filter(path)
+                    if file_signature != signature or bloom_filter.is_full():
+                        bloom_filter = None
+                if bloom_filter is None and path:
+                    bloom_filter, signature = write_vocabulary_filter(path)
+                elif bloom_filter is None:
+                    bloom_filter, signature = build_vocabulary_filter()
+                cls._bloom_filter = bloom_filter
+                cls._bloom_filter_signature = signature
+            cls._bloom_filter_checked = now
+            return bloom_filter
+
+    @classmethod
+    def _vocabulary_changed(cls, spellings=()):
+        """
+        Starts a new vocabulary version after words have been added,
+        changed or deleted, and adds the `spellings` of new or changed
+        words to the bloom filter.
+        """
+        with _vocabulary_lock:
+            cls._vocabulary_version += 1
+            bloom_filter = getattr(cls, '_bloom_filter', None)
+            for spelling in spellings:
+                if bloom_filter is not None:
+                    bloom_filter.add(spelling)
+
     @classmethod
-    def _get_cache(cls):
-        if not hasattr(cls, '_cache'):
-            cls._cache = PrefixCache(cls, 'normalized_spelling')
-        return cls._cache
+    def get_completer(cls):
+        """
+        Returns the `Completer` of this process, loading the vocabulary
+        with two queries on first use.
+        """
+        with _completer_lock:
+            if getattr(cls, '_completer', None) is None:
+                words = (cls.objects.filter(indexable=True).values_list(
+                    'pk', 'normalized_spelling', 'language', 'frequency'))
+                links = Meaning.words.through.objects.values_list(
+                    'word', 'meaning')
+                cls._completer = Completer.from_rows(words.iterator(),
+                                                     links.iterator())
+            return cls._completer
 
     def save(self, **kwargs):
         super(Word, self).save(**kwargs)
-        Word._get_cache().add(self.normalized_spelling)
+        for cache in Word._get_caches():
+            cache.add(self.normalized_spelling)
+        Word._vocabulary_changed([self.normalized_spelling])
+        completer = _get_loaded_completer()
+        if completer and self.indexable:
+            completer.set_word(self.pk, self.normalized_spelling,
+                               self.language, self.frequency)
+        elif completer:
+            completer.remove_word(self.pk)
 
     def delete(self):
+        pk = self.pk
         super(Word, self).delete()
-        Word._get_cache().discard(self.normalized_spelling)
+        for cache in Word._get_caches():
+            cache.discard(self.normalized_spelling)
+        Word._vocabulary_changed()
+        completer = _get_loaded_completer()
+        if completer:
+            completer.remove_word(pk)
 
     class Meta:
         unique_together = ('normalized_spelling', 'language'),
         ordering = 'language', 'normalized_spelling',
 
     def __unicode__(self):
-        ## frequency counting currently disabled, not possible to
-        ## implement consistently in the current model
-        #return '%s:%s/%d' % (
-        #    self.language,
-        #    repr(self.normalized_spelling)[2:-1],
-        #    self.frequency)
         return '%s:%s' % (
             self.language, repr(self.normalized_spelling)[2:-1])
 
@@ -107,6 +583,59 @@ class Word(models.Model):
                          self.normalized_spelling)
 
 
+_signature_header = struct.Struct('<QQ')
+
+def get_vocabulary_signature():
+    """
+    Returns the highest primary key and the number of words as a
+    2-tuple, which changes whenever words are added or deleted, also
+    when a transaction commits a word with a lower primary key late.
+    """
+    aggregates = Word.objects.order_by().aggregate(last_pk=Max('pk'),
+                                                   count=Count('pk'))
+    return aggregates['last_pk'] or 0, aggregates['count']
+
+
+def build_vocabulary_filter():
+    """
+    Builds a `BloomFilter` of the spellings of all words in one pass
+    over the vocabulary.  Returns the filter and the vocabulary
+    signature it was built for.
+    """
+    signature = last_pk, count = get_vocabulary_signature()
+    spellings = (Word.objects.order_by().filter(pk__lte=last_pk)
+                 .values_list('normalized_spelling', flat=True))
+    bloom_filter = BloomFilter.from_values(spellings.iterator(),
+                                           capacity=2 * count + 1000)
+    return bloom_filter, signature
+
+
+def write_vocabulary_filter(path):
+    """
+    Builds the vocabulary bloom filter and replaces the file `path`
+    with it.  Returns the filter and its signature.
+    """
+    bloom_filter, signature = build_vocabulary_filter()
+    temporary_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(temporary_path, 'wb') as f:
+        f.write(_signature_header.pack(*signature))
+        bloom_filter.save(f)
+    os.rename(temporary_path, path)
+    return bloom_filter, signature
+
+
+def read_vocabulary_filter(path):
+    """
+    Reads a vocabulary bloom filter written by `write_vocabulary_filter`.
+    Returns the filter and the signature it was built for.
+    """
+    with open(path, 'rb') as f:
+        signature = _signature_header.unpack(
+            f.read(_signature_header.size))
+        bloom_filter = BloomFilter.load(f)
+    return bloom_filter, signature
+
+
 class MeaningManager(models.Manager):
 
     def create(self, *args, **kwargs):
@@ -115,6 +644,69 @@ class MeaningManager(models.Manager):
         meaning.add_words(words)
         return meaning
 
+    def bulk_create_with_words(self, words):
+        """
+        Creates a new meaning for each ``(language,
+        normalized_spelling)`` 2-tuple in `words` and attaches the
+        word to it.  Returns the new meanings in the order of `words`.
+        """
+        return self.bulk_create_meanings([word] for word in words)
+
+    def bulk_create_meanings(self, word_groups):
+        """
+        Creates a new meaning for each sequence of ``(language,
+        normalized_spelling)`` 2-tuples in `word_groups` and attaches
+        those words to it.  Returns the new meanings in the order of
+        `word_groups`.
+
+        Only the meaning rows themselves are inserted one by one since
+        their primary keys are needed.  Words are looked up and
+        created, and meanings and words are linked, in bulk.
+        """
+        word_groups = [set(tuple(word) for word in group)
+                       for group in word_groups]
+        if not word_groups:
+            return []
+        word_instances = Word.objects.get_or_create_many(
+            word for group in word_groups for word in group)
+        meanings = [self.create() for group in word_groups]
+        through = Meaning.words.through
+        links = [(word_instances[word].pk, meaning.pk)
+                 for meaning, group in zip(meanings, word_groups)
+                 for word in group]
+        bulk_insert(through,
+                    (through(meaning_id=meaning_pk, word_id=word_pk)
+                     for word_pk, meaning_pk in links))
+        completer = _get_loaded_completer()
+        if completer:
+            for word_pk, meaning_pk in links:
+                completer.add_meaning(word_pk, meaning_pk)
+        return meanings
+
+    def prefetch_words(self, meanings):
+        """
+        Fetches the words of all the given meanings with a single
+        query and caches them on the meaning instances, so that
+        `Meaning.get_words` and `unicode()` don't need to query the
+        database for each meaning.  Returns the meanings as a list.
+        """
+        meanings = list(meanings)
+        meanings_by_pk = {}
+        for meaning in meanings:
+            meaning._prefetched_words = []
+            meanings_by_pk.setdefault(meaning.pk, []).append(meaning)
+        if not meanings_by_pk:
+            return meanings
+        links = (Meaning.words.through.objects
+                 .filter(meaning__in=meanings_by_pk.keys())
+                 .select_related('word')
+                 .order_by('word__language', 'word__normalized_spelling'))
+        for link in links:
+            for meaning in meanings_by_pk[link.meaning_id]:
+                meaning._prefetched_words.append(link.word)
+        return meanings
+
+    @primary_reads
     def join(self, *meanings):
         """
         Copies all words to the first meaning from all the rest of the
@@ -122,15 +714,24 @@ class MeaningManager(models.Manager):
 
         TODO: improve performance
         """
+        completer = _get_loaded_completer()
         for meaning in meanings[1:]:
             for word in meaning.words.all():
                 meanings[0].words.add(word)
-            for indexentry in meaning.index_entries.all():
-                indexentry.meaning = meanings[0]
-                indexentry.save()
+                if completer:
+                    completer.add_meaning(word.pk, meanings[0].pk)
+            for database in get_index_databases():
+                for indexentry in (IndexEntry.objects.using(database)
+                                   .filter(meaning=meaning).order_by()):
+                    indexentry.meaning = meanings[0]
+                    indexentry.save(using=database)
             meaning.delete()
+        self.update_document_frequencies([meanings[0].pk])
+        Word.objects.update_frequencies(
+            meanings[0].words.values_list('pk', flat=True))
         return meanings[0]
 
+    @primary_reads
     def split(self, meaning, *part_meanings):
         """
         Copies all index entries to part_meanings from the first
@@ -139,22 +740,64 @@ class MeaningManager(models.Manager):
 
         TODO: improve performance
         """
-        for indexentry in meaning.index_entries.all():
-            indexentry.meaning = part_meanings[0]
-            indexentry.save()
-            for part_meaning in part_meanings[1:]:
-                indexentry.id = None
-                indexentry.meaning = part_meaning
-                indexentry.save()
+        for database in get_index_databases():
+            for indexentry in (IndexEntry.objects.using(database)
+                               .filter(meaning=meaning).order_by()):
+                indexentry.meaning = part_meanings[0]
+                indexentry.save(using=database)
+                for part_meaning in part_meanings[1:]:
+                    indexentry.id = None
+                    indexentry.meaning = part_meaning
+                    indexentry.save(using=database)
         meaning.delete()
+        self.update_document_frequencies([m.pk for m in part_meanings])
+        Word.objects.update_frequencies(
+            Word.objects.filter(meaning__in=part_meanings)
+            .values_list('pk', flat=True).distinct())
         return part_meanings
 
+    @primary_reads
+    def update_document_frequencies(self, meaning_pks=None,
+                                    chunk_size=IN_CHUNK_SIZE):
+        """
+        Recomputes the `document_frequency` of the given meanings, or
+        all meanings, from the index.  Meanings are processed in
+        chunks of `chunk_size`, each with one aggregate query.
+        """
+        if meaning_pks is None:
+            meaning_pks = self.order_by('pk').values_list('pk', flat=True)
+        qn = connection.ops.quote_name
+        table = qn(IndexEntry._meta.db_table)
+        for chunk in chunked(meaning_pks, chunk_size):
+            # an instance's entries are all in the same shard
+            counts = {}
+            for database in get_index_databases():
+                cursor = connections[database].cursor()
+                cursor.execute(
+                    'SELECT meaning_id, COUNT(*) FROM'
+                    ' (SELECT DISTINCT meaning_id, content_type_id, object_id'
+                    '  FROM %s WHERE meaning_id IN (%s)) AS documents'
+                    ' GROUP BY meaning_id' % (
+                        table, ', '.join(['%s'] * len(chunk))),
+                    chunk)
+                for meaning_pk, frequency in cursor.fetchall():
+                    counts[meaning_pk] = counts.get(meaning_pk, 0) + frequency
+            pks_by_frequency = {0: set(chunk)}
+            for meaning_pk, frequency in counts.iteritems():
+                pks_by_frequency[0].discard(meaning_pk)
+                pks_by_frequency.setdefault(frequency, set()).add(meaning_pk)
+            for frequency, pks in pks_by_frequency.iteritems():
+                if pks:
+                    self.filter(pk__in=pks).update(
+                        document_frequency=frequency)
+            transaction.commit_unless_managed()
+
     def lookup_exact(self, normalized_spelling):
         """
         Returns a queryset with all the meanings which have the given
         normalized spelling in at least one language.
         """
-        if Word._get_cache().contains(normalized_spelling):
+        if Word._get_cache(self._db).contains(normalized_spelling):
             return self.filter(words__normalized_spelling=normalized_spelling)
         else:
             return self.none()
@@ -176,16 +819,46 @@ class MeaningManager(models.Manager):
 
         The list of words is either the original word or the parts it
         was split up into.
-        """
-        all_substrings = unique_substrings(word)
-        found_words = Word.objects.filter(
-            normalized_spelling__in=all_substrings, indexable=True)
-        found_spellings = found_words.values_list(
-            'normalized_spelling', flat=True)
-        possible_divisions = sorted_divisions(word, found_spellings)
 
-        if possible_divisions:
-            found_words = possible_divisions[0]
+        With ``BABELSEARCH_UNKNOWN_WORD_CACHE_SIZE`` above 0, words
+        without a division in a database are remembered until the
+        vocabulary changes in this process, so words added by other
+        processes meanwhile aren't found.  The cache is skipped when
+        `create_missing` is `True`, since a word added elsewhere would
+        get a second meaning.  With
+        ``BABELSEARCH_VOCABULARY_BLOOM_FILTER = True``, substrings which
+        aren't in the vocabulary are mostly ruled out without a query,
+        unless `create_missing` is `True`, since words added elsewhere
+        since the last refresh of the filter would get a second meaning.
+        """
+        max_steps = getattr(settings, 'BABELSEARCH_MAX_DIVISION_STEPS', None)
+        database = self._db or router.db_for_read(Word)
+        unknown_words = Word._get_unknown_words(database)
+        division = None
+        if create_missing or word not in unknown_words:
+            substrings = unique_substrings(word)
+            bloom_filter = None
+            if not create_missing:
+                bloom_filter = Word.get_bloom_filter()
+            if bloom_filter is not None:
+                substrings = set(substring for substring in substrings
+                                 if substring in bloom_filter)
+            # the filter contains all spellings, so without a division
+            # into substrings it contains, there is none
+            if (bloom_filter is None or
+                best_division(word, substrings, max_steps=max_steps)):
+                found_spellings = set(
+                    Word.objects.using(database)
+                    .filter(normalized_spelling__in=substrings,
+                            indexable=True)
+                    .values_list('normalized_spelling', flat=True))
+                division = best_division(word, found_spellings,
+                                         max_steps=max_steps)
+            if not division:
+                unknown_words.add(word)
+
+        if division:
+            found_words = division
             meanings_for_division = (self.lookup_exact(w)
                                      for w in found_words)
             meanings = reduce(operator.or_, meanings_for_division).distinct()
@@ -215,7 +888,7 @@ class MeaningManager(models.Manager):
         This is similar to `lookup_ordered` but only fires one query
         since matches don't have to be partitioned by word order.
         """
-        Word._get_cache().seed(normalized_spellings)
+        Word._get_cache(self._db).seed(normalized_spellings)
         result = self.none()
         found_words = set()
         for word in set(normalized_spellings):
@@ -237,7 +910,27 @@ class MeaningManager(models.Manager):
         words not found.  In this case the set of found words contains
         all searched words.
         """
-        Word._get_cache().seed(normalized_spellings)
+        return self._lookup_ordered(normalized_spellings, create_missing, list)
+
+    def lookup_ordered_pks(self, normalized_spellings):
+        """
+        Same as `lookup_ordered` without `create_missing`, but the sets
+        contain primary keys of meanings instead of `Meaning`
+        instances, which searches don't need.  Use `load_ordered` to
+        get the meanings for display.
+        """
+        return self._lookup_ordered(normalized_spellings, False, _get_pks)
+
+    def lookup_splitting_pks(self, word):
+        """
+        Same as `lookup_splitting` without `create_missing`, but returns
+        a list of primary keys of the meanings instead of a queryset.
+        """
+        meanings, found_words = self.lookup_splitting(word)
+        return _get_pks(meanings), found_words
+
+    def _lookup_ordered(self, normalized_spellings, create_missing, load):
+        Word._get_cache(self._db).seed(normalized_spellings)
         result = SetList()
         found_words = set()
         cache = {}
@@ -245,39 +938,177 @@ class MeaningManager(models.Manager):
             if word not in cache:
                 meanings, words = self.lookup_splitting(
                     word, create_missing=create_missing)
-                cache[word] = list(meanings)
+                cache[word] = load(meanings)
                 found_words.update(words)
             result.append(cache[word])
         return result, found_words
 
+    def load_ordered(self, meaning_search):
+        """
+        Returns a copy of a SetList of meaning primary keys from
+        `lookup_ordered_pks` with `Meaning` instances instead, fetched
+        with their words in two queries.
+        """
+        meaning_dict = dict(
+            (meaning.pk, meaning) for meaning in
+            self.prefetch_words(self.in_bulk(list(meaning_search.flat))
+                                .itervalues()))
+        return SetList([meaning_dict[pk] for pk in position
+                        if pk in meaning_dict]
+                       for position in meaning_search)
+
     def lookup_sentence(self, sentence):
         return self.lookup_ordered(get_words(sentence))
 
+    def lookup_prefix(self, prefix, limit=10):
+        """
+        Returns a list of at most `limit` meanings with a word starting
+        with the given normalized prefix, meanings of the most frequent
+        words first.
+        """
+        through = self.model.words.through
+        rows = (through.objects
+                .filter(word__in=Word.objects.with_prefix(prefix))
+                .order_by('-word__frequency', 'word__normalized_spelling')
+                .values_list('meaning', flat=True))
+        meaning_pks = []
+        for pk in rows.iterator():
+            if pk not in meaning_pks:
+                meaning_pks.append(pk)
+                if len(meaning_pks) == limit:
+                    break
+        meaning_dict = self.in_bulk(meaning_pks)
+        return [meaning_dict[pk] for pk in meaning_pks]
+
+    def lookup_as_you_type(self, sentence, limit=10):
+        """
+        Same as `lookup_sentence`, but treats the last word as the
+        prefix of an incomplete word unless the sentence ends with
+        whitespace or punctuation.  The last position then holds the
+        meanings from `lookup_prefix`.
+        """
+        words = get_words(sentence)
+        if not words or not sentence[-1].isalnum():
+            return self.lookup_ordered(words)
+        result, found_words = self.lookup_ordered(words[:-1])
+        meanings = self.lookup_prefix(words[-1], limit)
+        result[len(words) - 1].update(meanings)
+        return result, found_words
+
+def _get_pks(meanings):
+    # `values_list` of an `EmptyQuerySet` isn't empty
+    if isinstance(meanings, EmptyQuerySet):
+        return []
+    return list(meanings.values_list('pk', flat=True))
+
+
+def _get_pk(meaning):
+    """Returns the primary key of a `Meaning` or the primary key itself"""
+    return getattr(meaning, 'pk', meaning)
+
+
+def get_document_frequencies(meanings):
+    """
+    Returns a dictionary mapping the primary keys of `meanings`, which
+    may be `Meaning` instances or primary keys, to their document
+    frequencies.  Frequencies of primary keys are fetched in one query.
+    """
+    frequencies = {}
+    pks = []
+    for meaning in meanings:
+        if isinstance(meaning, Meaning):
+            frequencies[meaning.pk] = meaning.document_frequency
+        else:
+            pks.append(meaning)
+    for chunk in chunked(pks):
+        frequencies.update(Meaning.objects.filter(pk__in=chunk)
+                           .values_list('pk', 'document_frequency'))
+    return frequencies
+
+
 class Meaning(models.Model):
     words = models.ManyToManyField(Word)
+    # number of indexed instances with this meaning, maintained by
+    # `IndexManager`
+    document_frequency = models.PositiveIntegerField(default=0)
 
     objects = MeaningManager()
 
     def __unicode__(self):
-        words = self.words.order_by('language', 'normalized_spelling')
+        words = self.get_words()
         return u'%d: %s' % (
             self.pk,
             u','.join(u'%s:%s' % (w.language, repr(w.normalized_spelling)[2:-1])
                       for w in words))
 
+    def get_words(self):
+        """
+        Returns the words of this meaning ordered by language and
+        spelling.  Uses the words cached by
+        `MeaningManager.prefetch_words` if available.
+        """
+        try:
+            return self._prefetched_words
+        except AttributeError:
+            return self.words.order_by('language', 'normalized_spelling')
+
+    @primary_reads
     def add_words(self, words):
-        for word in words:
-            w = None
-            if Word._get_cache().contains(word[1]):
-                try:
-                    w = Word.objects.get(
-                        language=word[0], normalized_spelling=word[1])
-                except Word.DoesNotExist:
-                    pass
-            if w is None:
-                w = Word.objects.create(
-                    language=word[0], normalized_spelling=word[1])
-            self.words.add(w)
+        """
+        Attaches the given ``(language, normalized_spelling)`` 2-tuples
+        to this meaning, creating missing words in the vocabulary.
+        Fires a constant number of queries regardless of the number of
+        words.
+        """
+        self.__dict__.pop('_prefetched_words', None)
+        word_instances = Word.objects.get_or_create_many(words)
+        if not word_instances:
+            return
+        word_pks = set(w.pk for w in word_instances.itervalues())
+        through = Meaning.words.through
+        existing_pks = set(
+            through.objects
+            .filter(meaning=self, word__in=word_pks)
+            .values_list('word', flat=True))
+        bulk_insert(through,
+                    (through(meaning_id=self.pk, word_id=pk)
+                     for pk in word_pks - existing_pks))
+        completer = _get_loaded_completer()
+        if completer:
+            for pk in word_pks - existing_pks:
+                completer.add_meaning(pk, self.pk)
+
+    @primary_reads
+    def remove_words(self, words):
+        """
+        Detaches the given ``(language, normalized_spelling)`` 2-tuples
+        from this meaning.  The words stay in the vocabulary.
+        """
+        self.__dict__.pop('_prefetched_words', None)
+        words = set(words)
+        if not words:
+            return
+        criteria = reduce(operator.or_,
+                          (models.Q(language=language,
+                                    normalized_spelling=spelling)
+                           for language, spelling in words))
+        removed = list(self.words.filter(criteria))
+        self.words.remove(*removed)
+        completer = _get_loaded_completer()
+        if completer:
+            for word in removed:
+                completer.remove_meaning(self.pk, word.pk)
+
+    def delete(self):
+        pk = self.pk
+        # deleting only cascades to the index entries in this database
+        for database in get_index_databases():
+            (IndexEntry.objects.using(database).filter(meaning=pk)
+             .order_by().delete())
+        super(Meaning, self).delete()
+        completer = _get_loaded_completer()
+        if completer:
+            completer.remove_meaning(pk)
 
 class IndexManager(models.Manager):
 
@@ -285,19 +1116,24 @@ class IndexManager(models.Manager):
         self.delete_for_instance(instance)
         self.create_for_instance(instance)
 
+    @primary_reads
     def delete_for_instance(self, instance):
-        model = instance.__class__
-        ctype = ContentType.objects.get_for_model(model)
-
-        ## frequency counting currently disabled, not possible to
-        ## implement consistently in the current model
-        #(Word.objects
-        # .filter(meaning__index_entries__content_type=ctype,
-        #         meaning__index_entries__object_id=instance.pk)
-        # .update(frequency=F('frequency')-1))
-
-        self.filter(content_type=ctype, object_id=instance.pk).delete()
-
+        ctype_id = get_metadata(instance.__class__).content_type_id
+        # without the default ordering, which joins the content types
+        # missing from index shards
+        entries = (self.using(get_shard(ctype_id, instance.pk))
+                   .filter(content_type=ctype_id, object_id=instance.pk)
+                   .order_by())
+        meaning_pks = list(entries.values_list('meaning', flat=True)
+                           .distinct())
+        if meaning_pks:
+            (Meaning.objects
+             .filter(pk__in=meaning_pks, document_frequency__gt=0)
+             .update(document_frequency=F('document_frequency') - 1))
+            _change_frequencies(meaning_pks, -1)
+            entries.delete()
+
+    @primary_reads
     def create_for_instance(self, instance):
         """
         Creates index entries for the given instance.  An index entry
@@ -305,20 +1141,75 @@ class IndexManager(models.Manager):
         of the instance.  Dummy meanings are created for words not yet
         in the vocabulary.  Frequencies of words found are
         incremented.
+
+        With ``BABELSEARCH_INDEX_STOPWORDS = False``, stopwords are
+        skipped but still count when numbering the entries.
+        """
+        with operation('index') as stats:
+            with stats.measure('tokenize'):
+                words = get_instance_words(instance)
+                orders = get_indexed_orders(words)
+            with stats.measure('lookup'):
+                ordered_meanings, found_words = (
+                    Meaning.objects.lookup_ordered(
+                        [words[order - 1] for order in orders],
+                        create_missing=True))
+            rows_written = 0
+            ctype_id = get_metadata(instance.__class__).content_type_id
+            entries = self.db_manager(get_shard(ctype_id, instance.pk))
+            with stats.measure('write'):
+                for order, meanings in zip(orders, ordered_meanings):
+                    for meaning in meanings:
+                        entries.create(content_type_id=ctype_id,
+                                       object_id=instance.pk,
+                                       order=order,
+                                       meaning=meaning)
+                        rows_written += 1
+                meaning_pks = [m.pk for m in ordered_meanings.flat]
+                if meaning_pks:
+                    (Meaning.objects
+                     .filter(pk__in=meaning_pks)
+                     .update(document_frequency=F('document_frequency') + 1))
+                    _change_frequencies(meaning_pks, 1)
+            stats.record(tokens=len(words), rows_written=rows_written)
+
+    @primary_reads
+    def bulk_create_for_instance(self, instance, orders, ordered_meaning_pks):
         """
-        words = get_instance_words(instance)
-        ordered_meanings, found_words = Meaning.objects.lookup_ordered(
-            words, create_missing=True)
-        for order, meanings in enumerate(ordered_meanings):
-            for meaning in meanings:
-                self.create(content_object=instance,
-                            order=order+1,
-                            meaning=meaning)
-        word_instances = Word.objects.filter(normalized_spelling__in=found_words)
+        Creates the index entries of `instance` for lists of meaning
+        primary keys at the given `orders` with one insert, and
+        increments frequencies of the meanings and their words.
 
-        ## frequency counting currently disabled, not possible to
-        ## implement consistently in the current model
-        #word_instances.update(frequency=F('frequency')+1)
+        Returns the number of entries created.
+        """
+        ctype_id = get_metadata(instance.__class__).content_type_id
+        entries = [IndexEntry(content_type_id=ctype_id, object_id=instance.pk,
+                              order=order, meaning_id=meaning_pk)
+                   for order, meaning_pks in zip(orders, ordered_meaning_pks)
+                   for meaning_pk in meaning_pks]
+        bulk_insert(IndexEntry, entries,
+                    using=get_shard(ctype_id, instance.pk))
+        meaning_pks = set(entry.meaning_id for entry in entries)
+        if meaning_pks:
+            (Meaning.objects
+             .filter(pk__in=meaning_pks)
+             .update(document_frequency=F('document_frequency') + 1))
+            _change_frequencies(meaning_pks, 1)
+        return len(entries)
+
+
+def get_indexed_orders(words):
+    """
+    Returns the orders, counting from 1, of those `words` of an
+    instance which are indexed.  With ``BABELSEARCH_INDEX_STOPWORDS =
+    False``, stopwords are skipped.
+    """
+    orders = range(1, len(words) + 1)
+    if not index_stopwords():
+        stopwords = get_stopword_spellings()
+        orders = [order for order in orders
+                  if words[order - 1] not in stopwords]
+    return orders
 
 
 class IndexEntry(models.Model):
@@ -344,7 +1235,7 @@ class ReindexQueue(models.Model):
     value = models.CharField(max_length=200)
 
 
-def get_index_info_for_meanings(queryset, meanings):
+def get_index_info_for_meanings(queryset, meanings, facets=(), using=None):
     """
     Returns a sorted list of 3-tuples for each index entry matching the given
     queryset (or model) and set of meanings.  The elements of the 3-tuple are:
@@ -356,6 +1247,48 @@ def get_index_info_for_meanings(queryset, meanings):
     A model can be provided instead of a queryset, if the results don't need to
     be pre-filtered.
 
+    The values of the `facets` fields of the instances are added to
+    the rows with the keys ``facet_0``, ``facet_1`` etc.  Facets can't
+    be selected from an index shard in another database than the
+    model (see `get_index_entries`), and are left out there.  Neither
+    is the queryset applied there, see `filter_object_ids`.
+
+    """
+    if not _can_join(queryset, using):
+        facets = ()
+    return (
+        get_index_entries(queryset, facets, using)
+        .filter(meaning__in=meanings)
+        .values('object_id', 'order', 'meaning',
+                *[FACET_KEY % i for i in range(len(facets))])
+        .order_by('object_id', 'order')
+        .distinct())
+
+
+def _get_model(queryset):
+    if isinstance(queryset, ModelBase):
+        return queryset
+    return queryset.model
+
+
+FACET_KEY = 'facet_%d'
+
+def get_index_entries(queryset, facets=(), using=None):
+    """
+    Returns a queryset of all index entries for instances in the given
+    queryset (or model), from the database `using` if given.
+
+    If the queryset only filters by columns of the model's own table,
+    its conditions are applied to the model's table joined to the index
+    entries.  Other querysets are applied with a subquery.  With
+    `facets`, the model's table is joined to select the values of the
+    given fields (see `get_index_info_for_meanings`).
+
+    If `using` is another database than that of the model, the
+    entries of all instances of the model are returned and facets are
+    ignored.  Callers then keep the object ids they find which are in
+    the queryset with `filter_object_ids`, rather than passing all
+    primary keys of the queryset to the index database.
     """
     # pylint: disable=W0212
     #         Access to a protected member _meta of a client class
@@ -363,22 +1296,116 @@ def get_index_info_for_meanings(queryset, meanings):
     #         Instance of 'IndexManager' has no 'filter' member
     # pylint: disable=W0142
     #         Used * or ** magic
-    prefilter = {}
+    model = _get_model(queryset)
+    model_metadata = get_metadata(model)
+    entries = IndexEntry.objects.filter(
+        content_type=model_metadata.content_type_id)
+    if using is not None:
+        entries = entries.using(using)
+    if not _can_join(queryset, using):
+        return entries
+    where, params = [], []
+    if model is not queryset:
+        try:
+            condition = _get_local_condition(queryset)
+        except EmptyResultSet:
+            # not `none()`, which doesn't survive `values()`
+            return entries.filter(object_id__in=[])
+        if condition is None:
+            entries = entries.filter(object_id__in=queryset.values('pk'))
+        elif condition[0]:
+            where.append(condition[0])
+            params.extend(condition[1])
+    if not where and not facets:
+        return entries
+    qn = connection.ops.quote_name
+    table = model_metadata.table
+    where.insert(0, '%s.%s = %s.%s' % (
+        qn(table), qn(model_metadata.pk_column),
+        qn(IndexEntry._meta.db_table), qn('object_id')))
+    select = dict((FACET_KEY % i, '%s.%s' % (qn(table),
+                                            qn(_get_facet_column(model, name))))
+                  for i, name in enumerate(facets))
+    return entries.extra(select=select, tables=[table],
+                         where=where, params=params)
+
+
+def _can_join(queryset, using):
+    """
+    Tells whether index entries in the database `using` can be joined
+    to the table of the queryset (or model).  Replicas of a database
+    hold the same tables.
+    """
+    if using is None:
+        return True
     if isinstance(queryset, ModelBase):
-        model = queryset
+        database = router.db_for_read(queryset)
     else:
-        model = queryset.model
-        prefilter['{0}__in'.format(model._meta.module_name)] = queryset
-    ctype = ContentType.objects.get_for_model(model)
-    return (
-        IndexEntry.objects.filter(meaning__in=meanings,
-                                  content_type=ctype,
-                                  **prefilter)
-        .values('object_id', 'order', 'meaning')
-        .order_by('object_id', 'order')
-        .distinct())
+        database = queryset.db
+    return get_primary(using) == get_primary(database)
 
-def calculate_score(matching_meanings, unique_search_meanings):
+
+def filter_object_ids(queryset, object_ids, using=None):
+    """
+    Returns the set of those `object_ids` which are primary keys of
+    instances in the queryset (or model), for index entries fetched
+    from the database `using` by `get_index_entries`.  The ids are
+    only looked up, `IN_CHUNK_SIZE` at a time, if the queryset couldn't
+    be applied in the index database.
+    """
+    object_ids = set(object_ids)
+    if isinstance(queryset, ModelBase) or _can_join(queryset, using):
+        return object_ids
+    found = set()
+    for chunk in chunked(sorted(object_ids)):
+        found.update(queryset.filter(pk__in=chunk)
+                     .values_list('pk', flat=True))
+    return found
+
+
+def _add_facet_values(rows, model, facets):
+    """
+    Adds facet values to rows from an index database which can't be
+    joined to the table of `model`.
+    """
+    for name in facets:
+        _get_facet_column(model, name)
+    values = {}
+    object_ids = set(row['object_id'] for row in rows)
+    for chunk in chunked(object_ids):
+        for row in (model._default_manager.filter(pk__in=chunk)
+                    .values_list('pk', *facets)):
+            values[row[0]] = row[1:]
+    missing = (None,) * len(facets)
+    for row in rows:
+        for index, value in enumerate(values.get(row['object_id'], missing)):
+            row[FACET_KEY % index] = value
+
+
+def _get_local_condition(queryset):
+    """
+    Returns the SQL and parameters of the ``WHERE`` clause of the
+    queryset, or `None` if the queryset joins other tables or is
+    sliced.  The SQL is `None` if the queryset isn't filtered.
+    """
+    query = queryset.query
+    table = queryset.model._meta.db_table
+    aliases = [alias for alias in query.tables if query.alias_refcount[alias]]
+    if (aliases not in ([], [table]) or query.extra_tables or
+        query.low_mark or query.high_mark is not None):
+        return None
+    compiler = query.get_compiler(connection=connection)
+    return query.where.as_sql(compiler.quote_name_unless_alias, connection)
+
+
+def _get_facet_column(model, name):
+    field = model._meta.get_field(name)
+    if isinstance(field, models.ManyToManyField):
+        raise ValueError('Cannot facet by %s.%s' % (model.__name__, name))
+    return field.column
+
+def calculate_score(matching_meanings, unique_search_meanings,
+                    meaning_search=None):
     """
           matching unique meanings btw model inst & search str
     100 * ----------------------------------------------------
@@ -386,7 +1413,53 @@ def calculate_score(matching_meanings, unique_search_meanings):
     """
     return 100 * len(matching_meanings.flat) / unique_search_meanings
 
-def get_scored_matches(queryset, meaning_search):
+
+PROXIMITY_WEIGHT = 100
+
+def calculate_proximity_score(matching_meanings, unique_search_meanings,
+                              meaning_search, weight=PROXIMITY_WEIGHT):
+    """
+    Adds a proximity bonus of up to `weight` points to the score
+    given by `calculate_score`.
+
+    For every pair of consecutive words in the search string, the
+    shortest distance in the instance's indexed text from a match of
+    the first word to a following match of the second one is found.
+    The pair contributes ``1 / distance`` of its share of the bonus,
+    so a phrase found as such in the text gets the full bonus.  Parts
+    of a compound word have the same order and count as adjacent.
+
+    `matching_meanings` is a SetList indexed by the `order` of index
+    entries, so the positions are walked in order and the distances are
+    found in a single pass.
+    """
+    score = calculate_score(matching_meanings, unique_search_meanings)
+    pairs = len(meaning_search) - 1
+    if pairs < 1:
+        return score
+    search_positions = {}
+    for search_position, meanings in enumerate(meaning_search):
+        for meaning in meanings:
+            search_positions.setdefault(meaning, []).append(search_position)
+    last_seen = {}  # search position -> last matching order in the text
+    shortest = {}  # search position -> shortest distance to the next one
+    for order, meanings in enumerate(matching_meanings):
+        found = set()
+        for meaning in meanings:
+            found.update(search_positions.get(meaning, ()))
+        for search_position in found:
+            last_seen[search_position] = order
+        for search_position in found:
+            previous = last_seen.get(search_position - 1)
+            if previous is not None:
+                distance = max(1, order - previous)
+                if distance < shortest.get(search_position - 1, distance + 1):
+                    shortest[search_position - 1] = distance
+    proximity = sum(1.0 / distance for distance in shortest.itervalues())
+    return score + int(round(weight * proximity / pairs))
+
+def get_scored_matches(queryset, meaning_search, scorer=calculate_score,
+                       using=None, limit=None):
     """
     Returns a relevance-sorted list of all instances in the given queryset (or
     model) which match any of the given meanings in the index.
@@ -407,29 +1480,273 @@ def get_scored_matches(queryset, meaning_search):
     A model can be provided instead of a queryset if results don't need to be
     filtered.
 
+    `scorer` is called with the matches of each instance, the number of
+    meanings in the search and `meaning_search`.  Use
+    `calculate_proximity_score` to favor instances where the words
+    appear close to each other in the order of the search.
+
+    Common meanings (see `babelsearch.stopwords`) only add to the
+    scores of instances matching other meanings of the search, unless
+    all meanings of the search are common.
+
+    Index entries are read from the database `using` if given, and
+    otherwise from the one chosen by the routers.
+
+    With `limit`, only the top `limit` matches are returned, which
+    saves sorting the rest.  With `calculate_score`, the scores can be
+    computed with NumPy (see `babelsearch.vectorized`).
+
     """
-    rows = get_index_info_for_meanings(queryset, meaning_search.flat)
-    object_ids = set(row['object_id'] for row in rows)
-    meaning_dict = dict((m.pk, m) for m in meaning_search.flat)
-    instance_matches = dict((pk, SetList()) for pk in object_ids)
-    # rows: [{'object_id': <int>, 'order': <int>, 'meaning': <Meaning>}, ...]
-    # object_ids: set([object_id, ...])
-    # meaning_dict: {object_id: Meaning, ...}
-    for row in rows: # row = (object_id, order, meaning_id)
-        meanings = instance_matches[row['object_id']] # SetList
-        position = meanings[row['order']] # SetWrapper
-        meaning = meaning_dict[row['meaning']] # Meaning
-        position.add(meaning)
-    term_count = len(meaning_search.flat)
-    # `term_count` = number of word meanings in search string,
-    # including multiple meanings for one word.
-    scores = ( (calculate_score(matches, term_count), pk)
-               for (pk, matches) in instance_matches.iteritems() )
-    sorted_scores = sorted(scores, reverse=True)
-    return sorted_scores
-
-
-def get_scored_matches_for_sentence(queryset, sentence, offset=0, limit=50):
+    return get_faceted_matches(queryset, meaning_search, (), scorer,
+                               using, limit)[0]
+
+
+def get_faceted_matches(queryset, meaning_search, facets,
+                        scorer=calculate_score, using=None, limit=None):
+    """
+    Returns a 2-tuple of the list returned by `get_scored_matches` and
+    a dictionary which maps each field name in `facets` to a
+    dictionary of the number of matching instances per value of the
+    field.  The values are read in the same query as the index entries.
+
+    With a sharded index (see `babelsearch.sharding`), the shards, or
+    their replicas, are searched in parallel unless `using` names one
+    of them.  Facet counts always cover all matches, also with `limit`.
+    """
+    model = _get_model(queryset)
+    stats = current_stats()
+    if using is None and is_sharded():
+        results = map_shards(
+            lambda database: get_faceted_matches(
+                queryset, meaning_search, facets, scorer, database, limit),
+            [get_read_database(shard)
+             for shard in get_shards_for_model(model)])
+        sorted_scores = _sort_scores(
+            (score for shard_scores, counts in results
+             for score in shard_scores),
+            limit)
+        facet_counts = dict((name, {}) for name in facets)
+        for shard_scores, counts in results:
+            for name, values in counts.iteritems():
+                for value, count in values.iteritems():
+                    facet_counts[name][value] = (
+                        facet_counts[name].get(value, 0) + count)
+        stats.record(candidates=len(sorted_scores), shards=len(results))
+        return sorted_scores, facet_counts
+    if not facets and scorer is calculate_score and vectorized.is_enabled():
+        with stats.measure('index_fetch'):
+            pairs = get_index_pairs(queryset, meaning_search.flat, using)
+        with stats.measure('scoring'):
+            sorted_scores = vectorized.score_pairs(
+                pairs, len(meaning_search.flat), limit)
+        stats.record(index_rows=len(pairs), candidates=len(sorted_scores))
+        return sorted_scores, {}
+    with stats.measure('index_fetch'):
+        rows = get_index_rows(queryset, meaning_search.flat, facets, using)
+        if facets and not _can_join(queryset, using):
+            _add_facet_values(rows, model, facets)
+    with stats.measure('scoring'):
+        object_ids = set(row['object_id'] for row in rows)
+        meaning_dict = dict((_get_pk(m), m) for m in meaning_search.flat)
+        instance_matches = dict((pk, SetList()) for pk in object_ids)
+        # rows: [{'object_id': <int>, 'order': <int>, 'meaning': <Meaning>}, ...]
+        # object_ids: set([object_id, ...])
+        # meaning_dict: {object_id: Meaning, ...}
+        for row in rows: # row = (object_id, order, meaning_id)
+            meanings = instance_matches[row['object_id']] # SetList
+            position = meanings[row['order']] # SetWrapper
+            meaning = meaning_dict[row['meaning']] # Meaning
+            position.add(meaning)
+        term_count = len(meaning_search.flat)
+        # `term_count` = number of word meanings in search string,
+        # including multiple meanings for one word.
+        scores = ( (scorer(matches, term_count, meaning_search), pk)
+                   for (pk, matches) in instance_matches.iteritems() )
+        sorted_scores = _sort_scores(scores, limit)
+    stats.record(index_rows=len(rows), candidates=len(sorted_scores))
+    return sorted_scores, count_facets(rows, facets)
+
+
+def _sort_scores(scores, limit=None):
+    if limit is None:
+        return sorted(scores, reverse=True)
+    return heapq.nlargest(limit, scores)
+
+
+def count_facets(rows, facets):
+    """
+    Counts instances per value of each facet in rows returned by
+    `get_index_info_for_meanings`.
+    """
+    counts = dict((name, {}) for name in facets)
+    seen = set()
+    for row in rows:
+        if row['object_id'] in seen:
+            continue
+        seen.add(row['object_id'])
+        for index, name in enumerate(facets):
+            value = row[FACET_KEY % index]
+            counts[name][value] = counts[name].get(value, 0) + 1
+    return counts
+
+
+def get_index_pairs(queryset, meanings, using=None):
+    """
+    Returns the distinct ``(object_id, meaning)`` 2-tuples of the
+    index entries which `get_index_rows` would return, as a list.
+    """
+    entries = get_index_entries(queryset, using=using)
+    def fetch(meanings):
+        return (entries.filter(meaning__in=meanings).order_by()
+                .values_list('object_id', 'meaning').distinct())
+    def prefilter(pairs):
+        object_ids = filter_object_ids(
+            queryset, (object_id for object_id, meaning in pairs), using)
+        return [pair for pair in pairs if pair[0] in object_ids]
+    common_pks = get_common_meaning_pks(meanings, _get_model(queryset))
+    selective = [m for m in meanings if _get_pk(m) not in common_pks]
+    if not common_pks or not selective:
+        return prefilter(list(fetch(meanings)))
+    common = [m for m in meanings if _get_pk(m) in common_pks]
+    pairs = prefilter(list(fetch(selective)))
+    object_ids = sorted(set(object_id for object_id, meaning in pairs))
+    for chunk in chunked(object_ids):
+        pairs.extend(fetch(common).filter(object_id__in=chunk))
+    return pairs
+
+
+def get_index_rows(queryset, meanings, facets=(), using=None):
+    """
+    Returns the rows of `get_index_info_for_meanings` as a list.
+    Instances are only looked up by the selective meanings, and rows
+    for common meanings are fetched for those instances only.
+    """
+    def prefilter(rows):
+        object_ids = filter_object_ids(
+            queryset, (row['object_id'] for row in rows), using)
+        return [row for row in rows if row['object_id'] in object_ids]
+    common_pks = get_common_meaning_pks(meanings, _get_model(queryset))
+    selective = [m for m in meanings if _get_pk(m) not in common_pks]
+    if not common_pks or not selective:
+        return prefilter(list(get_index_info_for_meanings(
+            queryset, meanings, facets, using)))
+    common = [m for m in meanings if _get_pk(m) in common_pks]
+    rows = prefilter(list(get_index_info_for_meanings(
+        queryset, selective, facets, using)))
+    object_ids = sorted(set(row['object_id'] for row in rows))
+    for chunk in chunked(object_ids):
+        rows.extend(get_index_info_for_meanings(
+            queryset, common, facets, using).filter(object_id__in=chunk))
+    rows.sort(key=lambda row: (row['object_id'], row['order']))
+    return rows
+
+
+def get_top_scored_matches(queryset, meaning_search, limit, idf=False,
+                           using=None):
+    """
+    Returns the same list as ``get_scored_matches(queryset,
+    meaning_search)[:limit]``, but avoids fetching index entries of
+    common meanings for instances which can't make it to the top.
+
+    Index entries are fetched one meaning at a time, from the rarest to
+    the most common one according to `Meaning.document_frequency`.
+    Once the meanings not yet fetched can't lift any unseen instance to
+    the current top `limit` scores, no new instances are considered,
+    and only the remaining candidates' entries are fetched (MaxScore
+    early termination).
+
+    With `idf`, matching meanings are weighted by their inverse
+    document frequency instead of counting equally, and the score is
+    the weighted percentage of the search's meanings matched.
+
+    As in `get_scored_matches`, common meanings are fetched last and
+    only for instances already found.  The top matches of each shard of
+    a sharded index are found in parallel and merged.
+    """
+    if not len(meaning_search.flat) or limit <= 0:
+        return []
+    model = _get_model(queryset)
+    if using is None and is_sharded():
+        results = map_shards(
+            lambda database: get_top_scored_matches(
+                queryset, meaning_search, limit, idf, using=database),
+            [get_read_database(shard)
+             for shard in get_shards_for_model(model)])
+        return heapq.nlargest(limit, itertools.chain(*results))
+    frequencies = get_document_frequencies(meaning_search.flat)
+    meanings = [_get_pk(m) for m in meaning_search.flat]
+    if idf:
+        total = get_instance_count(model)
+        weights = dict(
+            (pk, 1.0 + math.log((total + 1.0) /
+                                (frequencies.get(pk, 0) + 1.0)))
+            for pk in meanings)
+        total_weight = sum(weights.itervalues())
+        score_for = lambda weight: int(100 * weight / total_weight)
+    else:
+        weights = dict((pk, 1) for pk in meanings)
+        score_for = lambda count: 100 * count / len(meanings)
+    common_pks = get_common_meaning_pks(meaning_search.flat, model,
+                                        frequencies)
+    if common_pks.issuperset(meanings):
+        common_pks = set()
+    meanings.sort(key=lambda pk: (pk in common_pks,
+                                  frequencies.get(pk, 0), pk))
+
+    entries = get_index_entries(queryset, using=using)
+    partial = {}  # object id -> weight of meanings matched so far
+    closed = False  # True when no new candidates can enter the top
+    checked = set()  # object ids looked up in the queryset
+    excluded = set()  # object ids not in the queryset
+    for index, meaning in enumerate(meanings):
+        weight = weights[meaning]
+        if meaning in common_pks:
+            closed = True
+        postings = entries.filter(meaning=meaning)
+        if closed:
+            object_id_chunks = [postings.filter(object_id__in=chunk)
+                                for chunk in chunked(sorted(partial))]
+        else:
+            object_id_chunks = [postings]
+        object_ids = set()
+        for chunk in object_id_chunks:
+            object_ids.update(chunk.order_by()
+                              .values_list('object_id', flat=True)
+                              .distinct())
+        unchecked = object_ids - checked
+        excluded.update(unchecked - filter_object_ids(queryset, unchecked,
+                                                      using))
+        checked.update(unchecked)
+        for object_id in object_ids - excluded:
+            partial[object_id] = partial.get(object_id, 0) + weight
+
+        if len(partial) < limit:
+            continue
+        remaining = sum(weights[m] for m in meanings[index + 1:])
+        threshold = score_for(heapq.nlargest(limit, partial.itervalues())[-1])
+        if score_for(remaining) < threshold:
+            closed = True
+            partial = dict((pk, w) for pk, w in partial.iteritems()
+                           if score_for(w + remaining) >= threshold)
+
+    scores = [(score_for(weight), pk) for pk, weight in partial.iteritems()]
+    return heapq.nlargest(limit, scores)
+
+
+def _get_index_using(using):
+    """
+    Returns the database to read index entries from for searches
+    reading from `using`, which doesn't apply to index shards.
+    """
+    if is_sharded():
+        return None
+    return using
+
+
+def get_scored_matches_for_sentence(queryset, sentence, offset=0, limit=50,
+                                    scorer=calculate_score,
+                                    early_termination=False, idf=False,
+                                    using=None):
     """
     Analyses the given sentence, searches the given queryset (or model) for
     instances which match at least one word meaning in the sentence and returns
@@ -439,18 +1756,66 @@ def get_scored_matches_for_sentence(queryset, sentence, offset=0, limit=50):
     A model can be provided instead of a queryset if the results need to be
     limited.
 
+    With `early_termination` or `idf`, matches are found with
+    `get_top_scored_matches`, and `scorer` is not used.
+
+    With `using`, the vocabulary, the index and the instances are read
+    from that database, e.g. a replica (see `babelsearch.replicas`),
+    instead of the ones chosen by the routers.  The shards of a
+    sharded index are always chosen by the routers.
+
     """
-    if isinstance(queryset, ModelBase):
-        model = queryset
-    else:
-        model = queryset.model
-    meanings, _words = Meaning.objects.lookup_sentence(sentence)
-    matches = get_scored_matches(queryset, meanings)[offset:offset + limit]
-    instance_ids = [pk for (score, pk) in matches]
-    instance_dict = model.objects.in_bulk(instance_ids)
+    model = _get_model(queryset)
+    index_using = _get_index_using(using)
+    with operation('search') as stats:
+        with stats.measure('tokenize'):
+            words = get_words(sentence)
+        with stats.measure('lookup'):
+            meanings, found_words = (Meaning.objects.db_manager(using)
+                                     .lookup_ordered_pks(words))
+        stats.record(tokens=words, found_words=sorted(found_words))
+        if early_termination or idf:
+            matches = get_top_scored_matches(
+                queryset, meanings, offset + limit, idf=idf,
+                using=index_using)[offset:]
+        else:
+            matches = get_scored_matches(
+                queryset, meanings, scorer=scorer, using=index_using,
+                limit=offset + limit)[offset:]
+        instance_ids = [pk for (score, pk) in matches]
+        with stats.measure('instance_loading'):
+            instance_dict = model.objects.db_manager(using).in_bulk(
+                instance_ids)
     return [{'instance': instance_dict[pk], 'score': score}
             for (score, pk) in matches]
 
+def get_faceted_matches_for_sentence(queryset, sentence, facets, offset=0,
+                                     limit=50, scorer=calculate_score,
+                                     using=None):
+    """
+    Same as `get_scored_matches_for_sentence`, but returns a 2-tuple of
+    the results and the facet counts of all matches as returned by
+    `get_faceted_matches`.
+    """
+    model = _get_model(queryset)
+    with operation('search') as stats:
+        with stats.measure('tokenize'):
+            words = get_words(sentence)
+        with stats.measure('lookup'):
+            meanings, found_words = (Meaning.objects.db_manager(using)
+                                     .lookup_ordered_pks(words))
+        stats.record(tokens=words, found_words=sorted(found_words))
+        matches, facet_counts = get_faceted_matches(
+            queryset, meanings, facets, scorer, _get_index_using(using),
+            offset + limit)
+        matches = matches[offset:]
+        with stats.measure('instance_loading'):
+            instance_dict = model.objects.db_manager(using).in_bulk(
+                [pk for (score, pk) in matches])
+    return ([{'instance': instance_dict[pk], 'score': score}
+             for (score, pk) in matches],
+            facet_counts)
+
 def create_babelsearch_indexes_postgresql(**kwargs):
     name = 'babelsearch_word_spelling'
     cursor = connection.cursor()
@@ -460,10 +1825,22 @@ def create_babelsearch_indexes_postgresql(**kwargs):
                        'ON babelsearch_word (normalized_spelling);')
     cursor.close()
 
-if settings.DATABASES['default']['ENGINE'].startswith('postgresql'):
+if connection.vendor == 'postgresql':
     post_syncdb.connect(create_babelsearch_indexes_postgresql)
 
 
+def create_search_indexes_on_syncdb(db, **kwargs):
+    # index shards only hold the tables of some models
+    connection = connections[db]
+    tables = set(connection.introspection.table_names())
+    create_search_indexes(connection, definitions=[
+        (name, table, definition) for name, table, definition
+        in get_index_definitions(connection) if table in tables])
+
+post_syncdb.connect(
+    create_search_indexes_on_syncdb, sender=sys.modules[__name__], weak=False)
+
+
 def make_permissions(**kwargs):
     from django.contrib.contenttypes.models import ContentType
     from django.contrib.auth.models import Permission
@@ -0,0 +1,254 @@
+"""
+Concurrent search entry points.
+
+The functions in this module issue the independent per-token
+vocabulary lookups of a search concurrently and load model instances
+in the background, so a caller can start a search and do other work
+while it runs.  Work is handed to an executor:
+
+ * `ThreadExecutor` runs it in a pool of threads, each of which keeps
+   its own database connections until the executor is closed
+ * `SynchronousExecutor` runs it immediately in the calling thread
+
+The default executor is a `ThreadExecutor` with
+``BABELSEARCH_SEARCH_THREADS`` threads (4 by default), except for
+in-memory SQLite databases which can't be shared between threads.
+"""
+
+from multiprocessing.pool import ThreadPool
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.base import ModelBase
+
+from babelsearch.datastruct import SetList
+from babelsearch.instrumentation import operation
+from babelsearch.models import (
+    Meaning, Word, calculate_score, get_scored_matches)
+from babelsearch.preprocess import get_words
+
+
+DEFAULT_SEARCH_THREADS = 4
+
+
+class ImmediateResult(object):
+    """A finished result with the interface of `ApplyResult`"""
+
+    def __init__(self, function, args, kwargs):
+        self._exception = None
+        try:
+            self._value = function(*args, **kwargs)
+        except Exception, e:
+            self._exception = e
+
+    def ready(self):
+        return True
+
+    def wait(self, timeout=None):
+        pass
+
+    def get(self, timeout=None):
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+
+class SynchronousExecutor(object):
+
+    def submit(self, function, *args, **kwargs):
+        return ImmediateResult(function, args, kwargs)
+
+
+def close_connections():
+    """Closes the database connections of the current thread"""
+    for connection in connections.all():
+        connection.close()
+
+
+def _run_and_end_transactions(function, args, kwargs):
+    try:
+        return function(*args, **kwargs)
+    finally:
+        # an idle pool thread mustn't hold a transaction open
+        for connection in connections.all():
+            if connection.connection is not None:
+                transaction.commit_unless_managed(using=connection.alias)
+
+
+class ThreadExecutor(object):
+
+    def __init__(self, threads=DEFAULT_SEARCH_THREADS):
+        self.threads = threads
+        self.pool = ThreadPool(threads)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Runs `function` in a pool thread, which keeps its database
+        connections for later tasks.  Returns an `ApplyResult` whose
+        `get` method waits for and returns the return value.
+        """
+        return self.pool.apply_async(_run_and_end_transactions,
+                                     (function, args, kwargs))
+
+    def close(self):
+        """Closes the database connections of all threads and stops them"""
+        condition = threading.Condition()
+        arrived = [0]
+        def close_thread_connections():
+            # waits for the other threads so that each runs this once
+            with condition:
+                arrived[0] += 1
+                condition.notify_all()
+                while arrived[0] < self.threads:
+                    condition.wait()
+            close_connections()
+        results = [self.pool.apply_async(close_thread_connections)
+                   for i in range(self.threads)]
+        for result in results:
+            result.get()
+        self.pool.close()
+        self.pool.join()
+
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+def get_default_executor():
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            database = settings.DATABASES['default']
+            if (database['ENGINE'].endswith('sqlite3') and
+                database['NAME'] in ('', ':memory:')):
+                _default_executor = SynchronousExecutor()
+            else:
+                _default_executor = ThreadExecutor(
+                    getattr(settings, 'BABELSEARCH_SEARCH_THREADS',
+                            DEFAULT_SEARCH_THREADS))
+    return _default_executor
+
+
+def lookup_ordered_concurrently(normalized_spellings, executor=None):
+    """
+    Same as `MeaningManager.lookup_ordered_pks`, but looks up all
+    distinct spellings concurrently.
+    """
+    executor = executor or get_default_executor()
+    Word._get_cache().seed(normalized_spellings)
+    pending = dict((word, executor.submit(
+                       Meaning.objects.lookup_splitting_pks, word))
+                   for word in set(normalized_spellings))
+    result = SetList()
+    found_words = set()
+    for word in normalized_spellings:
+        meanings, words = pending[word].get()
+        found_words.update(words)
+        result.append(meanings)
+    return result, found_words
+
+
+def _get_model(queryset):
+    if isinstance(queryset, ModelBase):
+        return queryset
+    return queryset.model
+
+
+def _load_page(model, matches):
+    instance_dict = model.objects.in_bulk([pk for (score, pk) in matches])
+    return [{'instance': instance_dict[pk], 'score': score}
+            for (score, pk) in matches]
+
+
+def search_concurrently(queryset, sentence, offset=0, limit=50,
+                        executor=None, scorer=calculate_score):
+    """
+    Same as `get_scored_matches_for_sentence`, but looks up the words
+    of the sentence concurrently.
+    """
+    executor = executor or get_default_executor()
+    with operation('search') as stats:
+        with stats.measure('tokenize'):
+            words = get_words(sentence)
+        with stats.measure('lookup'):
+            meanings, found_words = lookup_ordered_concurrently(
+                words, executor)
+        stats.record(tokens=words, found_words=sorted(found_words))
+        matches = get_scored_matches(
+            queryset, meanings, scorer=scorer,
+            limit=offset + limit)[offset:]
+        with stats.measure('instance_loading'):
+            return _load_page(_get_model(queryset), matches)
+
+
+def iter_search_pages(queryset, sentence, page_size=50, executor=None,
+                      scorer=calculate_score):
+    """
+    Scores all matches for the sentence once and yields the results
+    a page of `page_size` at a time, in the format of
+    `get_scored_matches_for_sentence`.  Instances for the next page
+    are loaded in the background while the caller handles the current
+    page.
+    """
+    executor = executor or get_default_executor()
+    meanings, _words = lookup_ordered_concurrently(get_words(sentence),
+                                                   executor)
+    matches = get_scored_matches(queryset, meanings, scorer=scorer)
+    model = _get_model(queryset)
+    pages = [matches[offset:offset + page_size]
+             for offset in range(0, len(matches), page_size)]
+    if not pages:
+        return
+    pending = executor.submit(_load_page, model, pages[0])
+    for next_page in pages[1:]:
+        current = pending.get()
+        pending = executor.submit(_load_page, model, next_page)
+        yield current
+    yield pending.get()
+
+
+class BackgroundSearch(threading.Thread):
+    """
+    Runs `search_concurrently` in its own thread.  Call `get` to wait
+    for and return the results.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(BackgroundSearch, self).__init__()
+        self.daemon = True
+        self.args = args
+        self.kwargs = kwargs
+        self._result = None
+        self._exception = None
+
+    def run(self):
+        try:
+            self._result = search_concurrently(*self.args, **self.kwargs)
+        except Exception, e:
+            self._exception = e
+        finally:
+            close_connections()
+
+    def ready(self):
+        return not self.is_alive()
+
+    def get(self, timeout=None):
+        self.join(timeout)
+        if self.is_alive():
+            raise threading.ThreadError('Search timed out')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+def search_async(queryset, sentence, offset=0, limit=50, executor=None,
+                 scorer=calculate_score):
+    """
+    Starts `search_concurrently` in the background without blocking
+    and returns a `BackgroundSearch` whose `get` method returns the
+    results.
+    """
+    search = BackgroundSearch(queryset, sentence, offset=offset, limit=limit,
+                              executor=executor, scorer=scorer)
+    search.start()
+    return search
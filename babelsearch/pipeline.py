@@ -0,0 +1,155 @@
+"""
+Pipelined bulk indexing with a pool of processes.
+
+Tokenizing instances and splitting compound words is CPU work which
+the GIL keeps on one core, while the database waits.  `index_pipelined`
+hands it to ``BABELSEARCH_INDEXING_PROCESSES`` worker processes, which
+split words against a read-only snapshot of the indexable spellings
+taken when the pool starts.  Meanwhile the main process reads
+instances, looks up the meanings of the parts and writes index
+entries in bulk.  At most `max_pending` batches are handed to the pool
+at a time, so memory use stays bounded when the workers fall behind.
+
+Words which can't be divided using the snapshot are looked up, and
+created if missing, by the main process as in
+`IndexManager.create_for_instance`.  The index is thus the same as
+with sequential indexing, except that words added during the run
+aren't used as parts of compounds.
+"""
+
+from collections import deque
+import itertools
+from multiprocessing import Pool
+
+from django.conf import settings
+
+from babelsearch.bulk import chunked
+from babelsearch.models import (
+    IndexEntry, Meaning, Word, best_division, get_indexed_orders)
+from babelsearch.preprocess import get_instance_text, get_words
+from babelsearch.replicas import primary_reads
+
+
+DEFAULT_INDEXING_PROCESSES = 1
+
+# the vocabulary snapshot of a worker process
+_vocabulary = None
+
+
+def get_indexing_processes():
+    return getattr(settings, 'BABELSEARCH_INDEXING_PROCESSES',
+                   DEFAULT_INDEXING_PROCESSES)
+
+
+def get_vocabulary_snapshot():
+    """Returns a frozen set of the spellings of all indexable words"""
+    return frozenset(Word.objects.filter(indexable=True)
+                     .values_list('normalized_spelling', flat=True))
+
+
+def _set_vocabulary(vocabulary):
+    global _vocabulary
+    _vocabulary = vocabulary
+
+
+def split_texts(texts, vocabulary=None):
+    """
+    Returns a ``(words, divisions)`` 2-tuple for each of `texts`, with
+    the list of normalized words of the text and a dictionary which
+    maps each of them to its preferred division into spellings in
+    `vocabulary`, or `None` if it can't be divided.
+    """
+    if vocabulary is None:
+        vocabulary = _vocabulary
+    max_steps = getattr(settings, 'BABELSEARCH_MAX_DIVISION_STEPS', None)
+    memo = {}
+    results = []
+    for text in texts:
+        words = get_words(text)
+        for word in words:
+            if word not in memo:
+                memo[word] = best_division(word, vocabulary,
+                                           max_steps=max_steps)
+        results.append((words, dict((word, memo[word]) for word in words)))
+    return results
+
+
+def get_meaning_pks_for_spellings(spellings):
+    """
+    Returns a dictionary mapping each of `spellings` to the set of
+    primary keys of meanings which have a word with that spelling.
+    """
+    through = Meaning.words.through
+    meaning_pks = {}
+    for chunk in chunked(spellings):
+        for spelling, meaning_pk in (
+            through.objects.filter(word__normalized_spelling__in=chunk)
+            .values_list('word__normalized_spelling', 'meaning')):
+            meaning_pks.setdefault(spelling, set()).add(meaning_pk)
+    return meaning_pks
+
+
+def _write_batch(instances, analyses, callback=None):
+    spellings = set(
+        part for words, divisions in analyses
+        for division in divisions.itervalues() if division
+        for part in division)
+    meaning_pks = get_meaning_pks_for_spellings(spellings)
+    with Word.objects.batched_frequency_updates():
+        for instance, (words, divisions) in zip(instances, analyses):
+            if callback:
+                callback(unicode(instance))
+            IndexEntry.objects.delete_for_instance(instance)
+            orders = get_indexed_orders(words)
+            ordered_meaning_pks = []
+            for order in orders:
+                word = words[order - 1]
+                if divisions[word] is None:
+                    meanings, _words = Meaning.objects.lookup_splitting(
+                        word, create_missing=True)
+                    pks = set(meanings.values_list('pk', flat=True))
+                else:
+                    pks = set()
+                    for part in divisions[word]:
+                        pks.update(meaning_pks.get(part, ()))
+                ordered_meaning_pks.append(pks)
+            IndexEntry.objects.bulk_create_for_instance(
+                instance, orders, ordered_meaning_pks)
+
+
+@primary_reads
+def index_pipelined(instances, processes=None, batch_size=100,
+                    max_pending=None, callback=None):
+    """
+    Indexes `instances` of registered models like
+    `IndexManager.index_instance`, splitting their words in
+    `processes` worker processes.  Batches of `batch_size` instances
+    are handed to the workers, and at most `max_pending` of them (twice
+    the number of processes by default) wait for their results.
+
+    Returns the number of instances indexed.
+    """
+    processes = processes or get_indexing_processes()
+    max_pending = max_pending or 2 * processes
+    pool = Pool(processes, _set_vocabulary, (get_vocabulary_snapshot(),))
+    pending = deque()
+    count = 0
+    try:
+        instances = iter(instances)
+        while True:
+            batch = list(itertools.islice(instances, batch_size))
+            if batch:
+                texts = [get_instance_text(instance) for instance in batch]
+                pending.append(
+                    (batch, pool.apply_async(split_texts, (texts,))))
+            if pending and (not batch or len(pending) >= max_pending):
+                done, result = pending.popleft()
+                _write_batch(done, result.get(), callback=callback)
+                count += len(done)
+            elif not batch:
+                break
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return count
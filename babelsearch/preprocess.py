@@ -3,7 +3,7 @@ from unicodedata import combining, normalize
 
 from django.db import models
 
-from babelsearch.indexer import registry
+from babelsearch.indexer import get_metadata
 
 replace_numbers = re.compile(r'(\d+)').sub
 split_words = re.compile(r"\w+(?:'\w+)?", re.U).findall
@@ -60,9 +60,8 @@ def get_instance_text(instance):
     are specified when registering the model.
     """
     values = []
-    for fieldname in registry[instance.__class__]:
-        values.extend(resolve_field_value(
-                [instance], fieldname.split('__')))
+    for path in get_metadata(instance.__class__).field_paths:
+        values.extend(resolve_field_value([instance], path))
     return u' '.join(values)
 
 
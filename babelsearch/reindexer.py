@@ -1,6 +1,9 @@
 from babelsearch import indexer
+from babelsearch.bulk import bulk_insert, chunked
 from babelsearch.models import IndexEntry, Meaning, Word, ReindexQueue
 from babelsearch.preprocess import get_instance_words
+from babelsearch.replicas import primary_reads
+from babelsearch.sharding import get_shards_for_model
 from django.conf import settings
 import itertools
 import os
@@ -13,16 +16,30 @@ def get_trigger_path():
     return getattr(settings, 'BABELSEARCH_TRIGGER_PATH', DEFAULT_TRIGGER_PATH)
 
 
-def queue_changes(meanings, spellings):
-    for meaning in meanings:
-        ReindexQueue.objects.create(type='meaning.pk',
-                                    value=meaning.pk)
-    for spelling in spellings:
-        ReindexQueue.objects.create(type='word.normalized_spelling',
-                                    value=spelling)
+def touch_trigger():
     file(get_trigger_path(), 'w').close()
 
 
+def queue_changes(meanings, spellings):
+    bulk_insert(ReindexQueue,
+                [ReindexQueue(type='meaning.pk', value=meaning.pk)
+                 for meaning in meanings] +
+                [ReindexQueue(type='word.normalized_spelling', value=spelling)
+                 for spelling in spellings])
+    touch_trigger()
+
+
+def queue_full_reindex():
+    """Queues a re-index of all instances of all registered models
+
+    Used after bulk vocabulary changes, which would otherwise queue
+    one change per meaning and spelling.
+    """
+    if not ReindexQueue.objects.filter(type='all').exists():
+        ReindexQueue.objects.create(type='all', value='')
+    touch_trigger()
+
+
 def pop_changes():
     meaning_changes = ReindexQueue.objects.filter(
         type='meaning.pk')
@@ -37,8 +54,26 @@ def pop_changes():
     return meaning_pks, spellings
 
 
+def pop_full_reindex():
+    """Returns ``True`` if a full re-index has been queued
+
+    Changes for individual meanings and spellings are discarded as
+    well, since a full re-index covers them.
+    """
+    full_changes = ReindexQueue.objects.filter(type='all')
+    if not full_changes.exists():
+        return False
+    ReindexQueue.objects.all().delete()
+    return True
+
+
 def get_batches_for(model, size=100):
-    instances = iter(model.objects.order_by('pk'))
+    instances = model.objects.order_by('pk')
+    select_related = indexer.get_metadata(model).select_related
+    if select_related:
+        # without arguments, `select_related` follows all foreign keys
+        instances = instances.select_related(*select_related)
+    instances = iter(instances)
     while True:
         batch = list(itertools.islice(instances, size))
         if not batch:
@@ -65,6 +100,21 @@ def get_changed_instances(instances, changed_instance_pks, changed_spellings):
                     yield instance
 
             
+def get_instance_pks_with_meanings(model, meaning_pks):
+    """
+    Returns the set of primary keys of instances of `model` with index
+    entries for any of the given meanings, from all index shards.
+    """
+    ctype_id = indexer.get_metadata(model).content_type_id
+    pks = set()
+    for database in get_shards_for_model(model):
+        for chunk in chunked(meaning_pks):
+            pks.update(IndexEntry.objects.using(database)
+                       .filter(content_type=ctype_id, meaning__in=chunk)
+                       .order_by().values_list('object_id', flat=True))
+    return pks
+
+
 def reindex_model_for_meanings(
     model, changed_meaning_pks, changed_spellings, callback=None):
     """Re-indexes potentially changed instances of a model
@@ -77,26 +127,72 @@ def reindex_model_for_meanings(
     * ``changed_spellings``: list of added, removed and
       meaning-changed normalized spellings
     """
-    changed_instance_pks = (
-        model.objects
-        .filter(index_entries__meaning__in=changed_meaning_pks)
-        .values_list('pk', flat=True))
+    changed_instance_pks = get_instance_pks_with_meanings(
+        model, changed_meaning_pks)
     for batch in get_batches_for(model, size=100):
-        for instance in get_changed_instances(
-            batch, changed_instance_pks, changed_spellings):
+        with Word.objects.batched_frequency_updates():
+            for instance in get_changed_instances(
+                batch, changed_instance_pks, changed_spellings):
 
-            if callback:
-                callback(unicode(instance))
-            IndexEntry.objects.index_instance(instance)
+                if callback:
+                    callback(unicode(instance))
+                IndexEntry.objects.index_instance(instance)
 
 
+@primary_reads
 def reindex_for_meanings(changed_meaning_pks, changed_spellings, callback=None):
     for model, fields in indexer.registry.items():
         reindex_model_for_meanings(
             model, changed_meaning_pks, changed_spellings, callback=callback)
+    update_frequencies_for_changes(changed_meaning_pks, changed_spellings)
 
 
-def reindex_for_changes(callback=None):
+def update_frequencies_for_changes(changed_meaning_pks, changed_spellings):
+    """Recomputes frequencies of words affected by vocabulary changes
+
+    Words added to or removed from a meaning after instances were
+    indexed make incremental frequency updates drift, so frequencies of
+    changed words are recomputed from the index after re-indexing.
+    """
+    word_pks = set(Word.objects
+                   .filter(meaning__in=changed_meaning_pks)
+                   .values_list('pk', flat=True))
+    word_pks.update(Word.objects
+                    .filter(normalized_spelling__in=changed_spellings)
+                    .values_list('pk', flat=True))
+    Word.objects.update_frequencies(word_pks)
+    Meaning.objects.update_document_frequencies(changed_meaning_pks)
+
+
+def reindex_all(callback=None, processes=None):
+    """Re-indexes all instances of all registered models
+
+    With more than one process, either given as ``processes`` or in
+    ``BABELSEARCH_INDEXING_PROCESSES``, words are split in a pool of
+    worker processes by `babelsearch.pipeline.index_pipelined`.
+    """
+    from babelsearch.pipeline import get_indexing_processes, index_pipelined
+    processes = processes or get_indexing_processes()
+    for model in indexer.registry.keys():
+        if processes > 1:
+            index_pipelined(
+                itertools.chain.from_iterable(get_batches_for(model, size=100)),
+                processes=processes, callback=callback)
+            continue
+        for batch in get_batches_for(model, size=100):
+            with Word.objects.batched_frequency_updates():
+                for instance in batch:
+                    if callback:
+                        callback(unicode(instance))
+                    IndexEntry.objects.index_instance(instance)
+
+
+def reindex_for_changes(callback=None, processes=None):
+    if pop_full_reindex():
+        if callback:
+            callback('Re-indexing all instances')
+        reindex_all(callback=callback, processes=processes)
+        return True
     changed_meaning_pks, changed_spellings = pop_changes()
     if changed_meaning_pks or changed_spellings:
         callback('Changed meanings: %s' % changed_meaning_pks)
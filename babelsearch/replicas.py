@@ -0,0 +1,138 @@
+"""
+Read replicas for searches.
+
+``BABELSEARCH_READ_REPLICAS`` maps database aliases to lists of aliases
+of their read-only replicas, e.g.::
+
+    BABELSEARCH_READ_REPLICAS = {'default': ['replica1', 'replica2'],
+                                 'index_shard': ['shard_replica']}
+
+With `ReplicaRouter` in ``DATABASE_ROUTERS`` (after `IndexShardRouter`
+if the index is sharded), reads of the vocabulary and the index go to
+a random replica of the database the models are written to, while
+writes and all queries on the `ReindexQueue` go to the primary.
+Searches can also be sent to a given database with the `using`
+argument of `get_scored_matches_for_sentence`.
+
+Replicas lag behind their primary, so indexing, re-indexing,
+vocabulary changes and frequency updates read from the primary inside
+`read_from_primary`.  After a vocabulary edit, `edit_vocabulary` reads
+from the primary for ``BABELSEARCH_REPLICATION_LAG`` seconds (5 by
+default) so that editors see their own changes.
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+import random
+import threading
+
+from django.conf import settings
+
+
+DEFAULT_REPLICATION_LAG = 5
+
+_local = threading.local()
+
+
+def get_replicas(alias):
+    """Returns the aliases of the read replicas of a database"""
+    return tuple(getattr(settings, 'BABELSEARCH_READ_REPLICAS', {})
+                 .get(alias, ()))
+
+
+def has_replicas():
+    return bool(getattr(settings, 'BABELSEARCH_READ_REPLICAS', None))
+
+
+def get_primary(alias):
+    """Returns the alias of the primary of a replica, or `alias` itself"""
+    for primary, replicas in getattr(
+        settings, 'BABELSEARCH_READ_REPLICAS', {}).iteritems():
+        if alias in replicas:
+            return primary
+    return alias
+
+
+def get_replication_lag():
+    return getattr(settings, 'BABELSEARCH_REPLICATION_LAG',
+                   DEFAULT_REPLICATION_LAG)
+
+
+def reading_from_primary():
+    return getattr(_local, 'depth', 0) > 0
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Makes babelsearch read from primary databases in the current
+    thread inside the block.
+    """
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+
+
+def primary_reads(function):
+    """Decorator which runs `function` inside `read_from_primary`"""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with read_from_primary():
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def get_read_database(alias):
+    """
+    Returns the alias of a random replica of the database `alias`, or
+    `alias` itself if it has no replicas or inside `read_from_primary`.
+    """
+    replicas = get_replicas(alias)
+    if not replicas or reading_from_primary():
+        return alias
+    return random.choice(replicas)
+
+
+def _is_babelsearch_model(model):
+    return model._meta.app_label == 'babelsearch'
+
+
+class ReplicaRouter(object):
+    """
+    Sends reads of babelsearch models to replicas and keeps writes and
+    ``syncdb`` on the primaries.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not has_replicas() or not _is_babelsearch_model(model):
+            return None
+        # imported here since `django.db` imports the routers when it
+        # sets up the router
+        from django.db import router
+        from babelsearch.models import ReindexQueue
+        primary = get_primary(router.db_for_write(model, **hints))
+        if model is ReindexQueue:
+            return primary
+        return get_read_database(primary)
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if (has_replicas() and _is_babelsearch_model(model) and
+            instance is not None and instance._state.db):
+            # instances read from a replica are saved to its primary
+            return get_primary(instance._state.db)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if (has_replicas() and _is_babelsearch_model(obj1.__class__) and
+            _is_babelsearch_model(obj2.__class__)):
+            return (get_primary(obj1._state.db) ==
+                    get_primary(obj2._state.db))
+        return None
+
+    def allow_syncdb(self, db, model):
+        if get_primary(db) != db:
+            return False
+        return None
@@ -0,0 +1,122 @@
+"""
+Index entries partitioned across several databases.
+
+With ``BABELSEARCH_INDEX_SHARDS`` set to a list of database aliases,
+each indexed instance has its index entries in one of those databases,
+chosen by ``BABELSEARCH_SHARD_BY``:
+
+ * ``'object_id'`` (the default) splits object ids into consecutive
+   ranges of ``BABELSEARCH_SHARD_RANGE`` ids (1 by default), which are
+   assigned to the shards in turn
+ * ``'content_type'`` keeps all entries of a model in one shard
+
+The vocabulary and all other tables stay in their usual database.
+Add `IndexShardRouter` to ``DATABASE_ROUTERS`` so that ``syncdb``
+creates the index entry table in the shards.
+
+Searches query the shards of the searched model in parallel with the
+executor of `babelsearch.parallel` and merge the results.  Since all
+entries of an instance are in one shard, the scores computed in each
+shard are final.
+"""
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+def get_index_shards():
+    return tuple(getattr(settings, 'BABELSEARCH_INDEX_SHARDS', ()))
+
+
+def is_sharded():
+    return bool(get_index_shards())
+
+
+def _get_index_model():
+    from babelsearch.models import IndexEntry
+    return IndexEntry
+
+
+def _db_for_index():
+    # imported here since `django.db` imports this module when it sets up
+    # the router
+    from django.db import router
+    return router.db_for_write(_get_index_model())
+
+
+def get_index_databases():
+    """Returns the aliases of all databases which hold index entries"""
+    return get_index_shards() or (_db_for_index(),)
+
+
+def get_shard(content_type_id, object_id):
+    """
+    Returns the alias of the database holding the index entries of the
+    given instance.
+    """
+    shards = get_index_shards()
+    if not shards:
+        return _db_for_index()
+    if getattr(settings, 'BABELSEARCH_SHARD_BY', 'object_id') == 'content_type':
+        key = content_type_id
+    else:
+        key = object_id // getattr(settings, 'BABELSEARCH_SHARD_RANGE', 1)
+    return shards[key % len(shards)]
+
+
+def get_shards_for_model(model):
+    """
+    Returns the aliases of the databases which may hold index entries
+    for instances of `model`.
+    """
+    shards = get_index_shards()
+    if shards and getattr(settings, 'BABELSEARCH_SHARD_BY',
+                          'object_id') == 'content_type':
+        from babelsearch.indexer import get_metadata
+        return [get_shard(get_metadata(model).content_type_id, None)]
+    return list(get_index_databases())
+
+
+def map_shards(function, shards, executor=None):
+    """
+    Calls `function` with each database alias in `shards`, in parallel
+    if there are several, and returns the results in the same order.
+    """
+    if len(shards) == 1:
+        return [function(shards[0])]
+    from babelsearch.parallel import get_default_executor
+    executor = executor or get_default_executor()
+    pending = [executor.submit(function, shard) for shard in shards]
+    return [result.get() for result in pending]
+
+
+class IndexShardRouter(object):
+    """
+    Routes index entry instances to their shard, and keeps other
+    tables out of the shards.  The index entry table is also created in
+    the default database, where it stays empty, because deleting a
+    meaning looks for related entries there.
+    """
+
+    def _is_index(self, model):
+        return model is _get_index_model()
+
+    def _db_for_instance(self, model, instance=None, **hints):
+        if (self._is_index(model) and is_sharded() and instance is not None
+            and getattr(instance, 'object_id', None) is not None):
+            return get_shard(instance.content_type_id, instance.object_id)
+        return None
+
+    db_for_read = _db_for_instance
+    db_for_write = _db_for_instance
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self._is_index(obj1.__class__) or self._is_index(obj2.__class__):
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        if (db in get_index_shards() and db != DEFAULT_DB_ALIAS and
+            not self._is_index(model)):
+            return False
+        return None
@@ -0,0 +1,130 @@
+"""
+Stopwords and other common meanings.
+
+Meanings which match a large part of the index make searches fetch
+huge numbers of index entries while contributing little to ranking.
+A meaning is considered common if
+
+ * one of its words is a stopword, i.e. listed for its language in
+   ``BABELSEARCH_STOPWORDS``, or
+ * its `document_frequency` exceeds ``BABELSEARCH_COMMON_MEANING_RATIO``
+   times the number of instances of the searched model.
+
+``BABELSEARCH_STOPWORDS`` is a dictionary mapping language codes to
+lists of normalized spellings, or `True` to use `DEFAULT_STOPWORDS`.
+
+Searches only use common meanings to re-score instances found with the
+other meanings of the search.  With ``BABELSEARCH_INDEX_STOPWORDS =
+False``, words spelled like a stopword in any language aren't indexed
+at all, which also shrinks the index.
+
+The number of instances is counted at most once every
+``BABELSEARCH_INSTANCE_COUNT_MAX_AGE`` seconds per model, or again when
+this process creates or deletes an indexed instance.
+"""
+
+import time
+
+from django.conf import settings
+from django.db.models import Q
+
+from babelsearch.bulk import chunked
+
+
+DEFAULT_STOPWORDS = {
+    'en': ('a', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'of', 'on',
+           'or', 'the', 'to', 'with'),
+    'de': ('der', 'die', 'das', 'des', 'dem', 'den', 'ein', 'eine', 'und',
+           'oder', 'mit', 'von', 'zu', 'im', 'fur'),
+    'fr': ('le', 'la', 'les', 'l', 'un', 'une', 'des', 'du', 'de', 'et',
+           'ou', 'a', 'au', 'aux', 'pour', 'en'),
+    'fi': ('ja', 'tai', 'seka', 'eli'),
+}
+
+
+DEFAULT_INSTANCE_COUNT_MAX_AGE = 60  # seconds
+
+_cache = {}
+_instance_counts = {}  # model -> (time counted, count)
+
+def get_stopwords():
+    """
+    Returns the configured stopwords as a dictionary mapping language
+    codes to frozensets of normalized spellings.
+    """
+    setting = getattr(settings, 'BABELSEARCH_STOPWORDS', None)
+    if setting is True:
+        setting = DEFAULT_STOPWORDS
+    if not setting:
+        return {}
+    key = id(setting)
+    if key not in _cache:
+        _cache.clear()
+        _cache[key] = setting, dict(
+            (language, frozenset(spellings))
+            for language, spellings in setting.iteritems())
+    return _cache[key][1]
+
+
+def get_stopword_spellings():
+    """Returns the stopwords of all languages as one frozenset"""
+    return frozenset().union(*get_stopwords().values())
+
+
+def index_stopwords():
+    return getattr(settings, 'BABELSEARCH_INDEX_STOPWORDS', True)
+
+
+def get_instance_count(model):
+    """
+    Returns the number of instances of `model`, counted at most
+    ``BABELSEARCH_INSTANCE_COUNT_MAX_AGE`` seconds ago.
+    """
+    max_age = getattr(settings, 'BABELSEARCH_INSTANCE_COUNT_MAX_AGE',
+                      DEFAULT_INSTANCE_COUNT_MAX_AGE)
+    now = time.time()
+    counted, count = _instance_counts.get(model, (None, None))
+    if counted is None or now - counted >= max_age:
+        count = model._default_manager.count()
+        _instance_counts[model] = now, count
+    return count
+
+
+def forget_instance_count(model):
+    """Makes `get_instance_count` count the instances of `model` again"""
+    _instance_counts.pop(model, None)
+
+
+def get_common_meaning_pks(meanings, model, frequencies=None):
+    """
+    Returns the set of primary keys of those `meanings` which are
+    common according to the stopword lists or the document frequency
+    ratio for `model`.  `meanings` may be `Meaning` instances or
+    primary keys.  `frequencies` may map their primary keys to
+    document frequencies which have been fetched already.  Doesn't
+    query the database unless stopwords or a ratio are configured.
+    """
+    from babelsearch.models import Meaning, get_document_frequencies
+
+    meanings = list(meanings)
+    pks = [getattr(m, 'pk', m) for m in meanings]
+    common = set()
+    ratio = getattr(settings, 'BABELSEARCH_COMMON_MEANING_RATIO', None)
+    if ratio is not None and meanings:
+        limit = ratio * get_instance_count(model)
+        if frequencies is None:
+            frequencies = get_document_frequencies(meanings)
+        common.update(pk for pk in pks if frequencies.get(pk, 0) > limit)
+    stopwords = get_stopwords()
+    if stopwords and meanings:
+        word_filter = reduce(
+            lambda q1, q2: q1 | q2,
+            (Q(word__language=language,
+               word__normalized_spelling__in=spellings)
+             for language, spellings in stopwords.iteritems()))
+        through = Meaning.words.through
+        for chunk in chunked(pk for pk in pks if pk not in common):
+            common.update(through.objects
+                          .filter(word_filter, meaning__in=chunk)
+                          .values_list('meaning', flat=True))
+    return common
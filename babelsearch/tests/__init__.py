@@ -1,5 +1,6 @@
 from babelsearch.tests.model_tests import (
     DivisionsTests,
+    BestDivisionTests,
     MeaningCreationTests,
     MeaningAnalysisTests,
     IndexerTests,
@@ -7,4 +8,25 @@ from babelsearch.tests.model_tests import (
 from babelsearch.tests.preprocess_tests import MeaningPreProcessTests
 from babelsearch.tests.search_tests import SearchTests
 from babelsearch.tests.datastruct_tests import (
-    SetListTests, AutoDiscardDictTests, PrefixCacheTests)
+    SetListTests, AutoDiscardDictTests, PrefixCacheTests, BoundedSetTests,
+    BloomFilterTests)
+from babelsearch.tests.vocabulary_tests import (
+    ReadMeanings_Tests,
+    FormatMeanings_Tests,
+    ImportExport_Tests,
+    FullReindexQueue_Tests)
+from babelsearch.tests.instrumentation_tests import Instrumentation_Tests
+from babelsearch.tests.benchmark_tests import (
+    SyntheticCorpus_Tests, Percentile_Tests)
+from babelsearch.tests.parallel_tests import (
+    ThreadExecutor_Tests, ConcurrentSearch_Tests, ThreadedSearch_Tests,
+    ThreadedPrefixCache_Tests)
+from babelsearch.tests.dbindexes_tests import SearchIndexes_Tests
+from babelsearch.tests.autocomplete_tests import (
+    Completer_Tests, WordCompletion_Tests)
+from babelsearch.tests.sharding_tests import ShardedIndex_Tests
+from babelsearch.tests.replicas_tests import ReadReplica_Tests
+from babelsearch.tests.vectorized_tests import (
+    ScorePairs_Tests, VectorizedSearchTests)
+from babelsearch.tests.pipeline_tests import (
+    SplitTexts_Tests, PipelinedIndexing_Tests)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase as UnitTestCase
+
+from django.test import TestCase
+
+from babelsearch.autocomplete import Completer
+from babelsearch.forms import MeaningForm
+from babelsearch.models import Meaning, Word
+from babelsearch.tests.testapp.models import Sentence
+
+
+class Completer_Tests(UnitTestCase):
+
+    def setUp(self):
+        self.completer = Completer.from_rows(
+            [(1, u'konsertto', 'fi', 3),
+             (2, u'konzert', 'de', 5),
+             (3, u'koti', 'fi', 1),
+             (4, u'piano', 'fi', 2),
+             (5, u'piano', 'en', 7)],
+            [(1, 10), (2, 10), (3, 11), (4, 12), (5, 12), (5, 13)])
+
+    def spellings(self, prefix, limit=10):
+        return [c['spelling'] for c in self.completer.complete(prefix, limit)]
+
+    def test_01_ranked_by_frequency(self):
+        self.assertEqual(self.spellings(u'ko'),
+                         [u'konzert', u'konsertto', u'koti'])
+        self.assertEqual(self.spellings(u'kon', 1), [u'konzert'])
+        self.assertEqual(self.spellings(u'x'), [])
+        self.assertEqual(self.spellings(u''),
+                         [u'piano', u'konzert', u'konsertto', u'koti'])
+
+    def test_02_meanings_per_language(self):
+        self.assertEqual(self.completer.complete(u'pia'),
+                         [{'spelling': u'piano', 'frequency': 7,
+                           'meanings': {'fi': [12], 'en': [12, 13]}}])
+
+    def test_03_incremental_updates(self):
+        self.assertEqual(self.spellings(u'k'),
+                         [u'konzert', u'konsertto', u'koti'])
+        self.completer.set_word(6, u'kone', 'fi', 4)
+        self.completer.change_frequency(3, 9)
+        self.assertEqual(self.spellings(u'k'),
+                         [u'koti', u'konzert', u'kone', u'konsertto'])
+        self.completer.set_word(6, u'masiina', 'fi', 4)
+        self.completer.remove_word(3)
+        self.assertEqual(self.spellings(u'k'), [u'konzert', u'konsertto'])
+        self.assertEqual(self.spellings(u'm'), [u'masiina'])
+
+    def test_04_meaning_changes(self):
+        self.completer.add_meaning(4, 14)
+        self.completer.remove_meaning(12, 5)
+        self.assertEqual(self.completer.complete(u'piano')[0]['meanings'],
+                         {'fi': [12, 14], 'en': [13]})
+        self.completer.remove_meaning(12)
+        self.assertEqual(self.completer.complete(u'piano')[0]['meanings'],
+                         {'fi': [14], 'en': [13]})
+
+    def test_05_memo_not_shared(self):
+        for limit in (10, 1):
+            completion = self.completer.complete(u'p', limit)[0]
+            completion['frequency'] = 0
+            completion['meanings']['en'].append(14)
+            del completion['meanings']['fi']
+        self.assertEqual(self.completer.complete(u'p'),
+                         [{'spelling': u'piano', 'frequency': 7,
+                           'meanings': {'fi': [12], 'en': [12, 13]}}])
+
+
+class WordCompletion_Tests(TestCase):
+
+    def setUp(self):
+        Word._completer = None
+        self.piano = Meaning.objects.create(words=[('en', u'piano')])
+        self.piece = Meaning.objects.create(words=[('en', u'piece')])
+
+    def tearDown(self):
+        Word._completer = None
+
+    def spellings(self, prefix):
+        return [c['spelling'] for c in Word.objects.complete(prefix)]
+
+    def test_01_complete(self):
+        self.assertEqual(Word.objects.complete(u'Pián'),
+                         [{'spelling': u'piano', 'frequency': 0,
+                           'meanings': {'en': [self.piano.pk]}}])
+
+    def test_02_updated_on_save_and_delete(self):
+        self.assertEqual(self.spellings(u'pi'), [u'piano', u'piece'])
+        word = Word.objects.create(language='en', normalized_spelling=u'pick')
+        self.assertEqual(self.spellings(u'pi'), [u'piano', u'pick', u'piece'])
+        word.indexable = False
+        word.save()
+        self.assertEqual(self.spellings(u'pi'), [u'piano', u'piece'])
+        Word.objects.get(normalized_spelling=u'piece').delete()
+        self.assertEqual(self.spellings(u'pi'), [u'piano'])
+
+    def test_03_updated_by_meaning_form(self):
+        self.assertEqual(self.spellings(u'pi'), [u'piano', u'piece'])
+        form = MeaningForm({'meaning': self.piano.pk,
+                            'words': u'en:pianoforte\nfi:piano'})
+        self.assertTrue(form.is_valid())
+        form.save()
+        completions = Word.objects.complete(u'pi')
+        self.assertEqual(
+            [(c['spelling'], c['meanings']) for c in completions],
+            [(u'piano', {'fi': [self.piano.pk]}),
+             (u'pianoforte', {'en': [self.piano.pk]}),
+             (u'piece', {'en': [self.piece.pk]})])
+
+    def test_04_ranked_by_indexing(self):
+        Word.get_completer()
+        Sentence.objects.create(text=u'piece')
+        self.assertEqual(self.spellings(u'pi'), [u'piece', u'piano'])
+        self.assertEqual(Word.objects.complete(u'pi')[0]['frequency'], 1)
+
+    def test_05_updated_by_bulk_creation(self):
+        Word.get_completer()
+        concerto, = Meaning.objects.bulk_create_meanings(
+            [[('en', u'piano concerto'), ('fi', u'pianokonsertto')]])
+        self.assertEqual(
+            [(c['spelling'], c['meanings'])
+             for c in Word.objects.complete(u'pian')],
+            [(u'piano', {'en': [self.piano.pk]}),
+             (u'piano concerto', {'en': [concerto.pk]}),
+             (u'pianokonsertto', {'fi': [concerto.pk]})])
@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+from babelsearch.benchmark import SyntheticCorpus, percentile, compare_results
+
+
+class SyntheticCorpus_Tests(TestCase):
+    def test_reproducible(self):
+        corpus1 = SyntheticCorpus(meanings=50, seed=3)
+        corpus2 = SyntheticCorpus(meanings=50, seed=3)
+        self.assertEqual(corpus1.vocabulary, corpus2.vocabulary)
+        self.assertEqual(list(corpus1.documents(5)),
+                         list(corpus2.documents(5)))
+
+    def test_vocabulary(self):
+        corpus = SyntheticCorpus(meanings=50)
+        self.assertEqual(len(corpus.vocabulary), 50)
+        for meaning in corpus.vocabulary:
+            self.assertTrue(1 <= len(meaning) <= 3)
+
+
+class Percentile_Tests(TestCase):
+    def test_percentiles(self):
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.99), 7)
+        self.assertEqual(percentile([], 0.5), None)
+
+    def test_compare(self):
+        rows = compare_results({'search': {'p50': 2.0}},
+                               {'search': {'p50': 1.0}},
+                               keys=('search.p50', 'reindex_time'))
+        self.assertEqual(rows, [('search.p50', 2.0, 1.0, 0.5),
+                                ('reindex_time', None, None, None)])
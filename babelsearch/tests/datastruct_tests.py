@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
+from StringIO import StringIO
 from unittest import TestCase
 
-from babelsearch.datastruct import SetList, AutoDiscardDict, PrefixCache
+from babelsearch.datastruct import (
+    SetList, AutoDiscardDict, PrefixCache, BoundedPrefixCache, BloomFilter,
+    BoundedSet)
 from babelsearch.models import Word
 
 class AutoDiscardDictTests(TestCase):
@@ -113,21 +116,28 @@ class PrefixCacheTests(TestCase):
 
     def test_add(self):
         c = PrefixCache(Word, 'normalized_spelling')
+        c.contains(u'abx')
+        c.add(u'abd')
         c.add(u'ghi')
-        self.assertEqual(c.items(), [(u'gh', set([u'ghi']))])
+        self.assertEqual(c.items(), [(u'ab', set([u'abc', u'abd']))])
 
     def test_discard(self):
         c = PrefixCache(Word, 'normalized_spelling')
-        c.add(u'jkl')
-        c.add(u'mno')
-        c.add(u'mnp')
-        self.assertEqual(sorted(c.items()),
-                         [(u'jk', set([u'jkl'])),
-                          (u'mn', set([u'mno', u'mnp']))])
+        c.seed([u'abx', u'efx'])
+        c.discard(u'abc')
         c.discard(u'jkl')
-        c.discard(u'mno')
-        self.assertEqual(c.items(), [(u'mn', set([u'mnp'])),
-                                     (u'jk', set([]))])
+        self.assertEqual(sorted(c.items()), [(u'ab', set()),
+                                             (u'ef', set([u'efg']))])
+
+    def test_add_after_eviction(self):
+        c = BoundedPrefixCache(Word, 'normalized_spelling', max_bytes=1)
+        self.assertTrue(c.contains(u'abc'))
+        self.assertTrue(c.contains(u'efg'))
+        c.add(u'abd')
+        c.discard(u'abe')
+        self.assertEqual(c.keys(), [u'ef'])
+        self.assertTrue(c.contains(u'abc'))
+        self.assertFalse(c.contains(u'abd'))
 
     def test_contains(self):
         c = PrefixCache(Word, 'normalized_spelling')
@@ -138,7 +148,90 @@ class PrefixCacheTests(TestCase):
         self.assertEqual(c.items(), [(u'ab', set([u'abc'])),
                                      (u'ef', set([u'efg']))])
 
+    def test_contains_with_bloom_filter(self):
+        bloom_filter = BloomFilter.from_values([u'abc', u'efg'], 10)
+        c = PrefixCache(Word, 'normalized_spelling',
+                        bloom_filter=lambda: bloom_filter)
+        self.assertFalse(c.contains(u'abd'))
+        self.assertEqual(c.items(), [])
+        self.assertTrue(c.contains(u'abc'))
+        self.assertEqual(c.items(), [(u'ab', set([u'abc']))])
+        c.seed([u'efx'])
+        self.assertEqual(c.items(), [(u'ab', set([u'abc']))])
+
+    def test_stats(self):
+        c = PrefixCache(Word, 'normalized_spelling')
+        self.assertTrue(c.contains(u'abc'))
+        self.assertFalse(c.contains(u'abd'))
+        c.seed([u'efg', u'abc', u'xyz'])
+        stats = c.get_stats()
+        self.assertEqual(
+            (stats['hits'], stats['misses'], stats['fills'],
+             stats['evictions'], stats['prefixes']),
+            (1, 1, 3, 0, 3))
+        self.assertTrue(stats['bytes'] > 0)
+        c.add(u'abd')
+        self.assertTrue(c.get_stats()['bytes'] > stats['bytes'])
+        c.clear()
+        self.assertEqual(c.get_stats()['bytes'], 0)
+
+    def test_bounded(self):
+        c = BoundedPrefixCache(Word, 'normalized_spelling', max_bytes=1)
+        self.assertTrue(c.contains(u'abc'))
+        self.assertTrue(c.contains(u'efg'))
+        self.assertEqual(c.items(), [(u'ef', set([u'efg']))])
+        self.assertTrue(c.contains(u'abc'))
+        self.assertEqual(c.items(), [(u'ab', set([u'abc']))])
+        stats = c.get_stats()
+        self.assertEqual((stats['fills'], stats['evictions']), (3, 2))
+        self.assertEqual(stats['bytes'], c._bytes[u'ab'])
+
     def test_instances_with_prefix(self):
         c = PrefixCache(Word, 'normalized_spelling')
         words = c._instances_with_prefix(u'ab')
         self.assertEqual(list(words), [self.abc])
+
+
+class BoundedSetTests(TestCase):
+
+    def test_forgets_oldest(self):
+        s = BoundedSet(2)
+        s.add(u'a')
+        s.add(u'b')
+        s.add(u'a')
+        s.add(u'c')
+        self.assertEqual((u'a' in s, u'b' in s, u'c' in s),
+                         (True, False, True))
+        self.assertEqual(len(s), 2)
+
+    def test_disabled(self):
+        s = BoundedSet(0)
+        s.add(u'a')
+        self.assertFalse(u'a' in s)
+
+
+class BloomFilterTests(TestCase):
+
+    def test_no_false_negatives(self):
+        values = [u'word%d' % i for i in range(1000)] + [u'k\xe4si', 'str']
+        f = BloomFilter.from_values(values, capacity=len(values))
+        self.assertTrue(all(value in f for value in values))
+        self.assertFalse(f.is_full())
+
+    def test_save_and_load(self):
+        f = BloomFilter.from_values([u'abc', u'def'], capacity=10)
+        data = StringIO()
+        f.save(data)
+        data.seek(0)
+        loaded = BloomFilter.load(data)
+        self.assertEqual((loaded.size, loaded.hash_count, loaded.count),
+                         (f.size, f.hash_count, 2))
+        self.assertEqual(loaded.bits, f.bits)
+        self.assertTrue(u'abc' in loaded)
+
+    def test_false_positive_rate(self):
+        f = BloomFilter.from_values(
+            (u'word%d' % i for i in range(1000)), capacity=1000,
+            error_rate=0.01)
+        false_positives = sum(u'other%d' % i in f for i in range(10000))
+        self.assertTrue(false_positives < 300, false_positives)
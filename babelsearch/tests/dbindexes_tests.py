@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db import connection, connections
+from django.test import TestCase
+
+from babelsearch.dbindexes import (
+    SEARCH_INDEXES, create_search_indexes, drop_search_indexes,
+    get_index_definitions, index_exists, prefixes_where,
+    supports_expression_indexes)
+from babelsearch.datastruct import PrefixCache
+from babelsearch.models import Word
+
+
+class SearchIndexes_Tests(TestCase):
+
+    def assertIndexes(self, exist):
+        self.assertEqual(
+            [index_exists(connection, table, name)
+             for name, table, columns in SEARCH_INDEXES],
+            [exist] * len(SEARCH_INDEXES))
+
+    def test_01_created_on_syncdb(self):
+        self.assertIndexes(True)
+        self.assertEqual(create_search_indexes(), [])
+
+    def test_01b_created_on_syncdb_of_other_databases(self):
+        if 'index_shard' not in settings.DATABASES:
+            self.skipTest('needs the index_shard database')
+        self.assertTrue(index_exists(connections['index_shard'],
+                                     'babelsearch_indexentry',
+                                     'babelsearch_entry_search'))
+
+    def test_02_drop_and_create(self):
+        drop_search_indexes()
+        self.assertIndexes(False)
+        self.assertEqual(create_search_indexes(),
+                         [name for name, table, definition
+                          in get_index_definitions(connection)])
+        self.assertIndexes(True)
+
+    def test_03_seed_with_one_indexed_query(self):
+        if (connection.vendor == 'sqlite' and
+            supports_expression_indexes(connection)):
+            # before any writes, since pysqlite commits before EXPLAIN
+            where, params = prefixes_where(Word, 'normalized_spelling',
+                                           [u'ab', u'pi'])
+            sql, sql_params = (Word.objects.extra(where=where, params=params)
+                               .values_list('normalized_spelling')
+                               .query.get_compiler(connection=connection)
+                               .as_sql())
+            cursor = connection.cursor()
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, sql_params)
+            self.assertTrue('babelsearch_word_seed' in repr(cursor.fetchall()))
+        Word.objects.create(normalized_spelling=u'piano')
+        cache = PrefixCache(Word, 'normalized_spelling')
+        spellings = [u'%s%03d' % (letter, i)
+                     for letter in u'abcdefghij' for i in range(10)]
+        self.assertNumQueries(1, cache.seed, spellings + [u'piano'])
+        self.assertEqual(len(cache), 11)
+        self.assertEqual(cache[u'pi'], set([u'piano']))
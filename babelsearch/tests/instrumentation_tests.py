@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+from django.db import connection
+from django.test import TestCase
+
+from babelsearch.instrumentation import (
+    collect_stats, operation, stats_collected)
+from babelsearch.models import Meaning, get_scored_matches_for_sentence
+from babelsearch.tests.testapp.models import Sentence
+
+
+class Instrumentation_Tests(TestCase):
+    def setUp(self):
+        Meaning.objects.create(words=[('en', 'piano'), ('de', 'klavier')])
+        Meaning.objects.create(words=[('en', 'concerto'), ('de', 'konzert')])
+
+    def test_search_stats(self):
+        Sentence.objects.create(text=u'klavierkonzert')
+        with collect_stats() as collected:
+            get_scored_matches_for_sentence(Sentence, u'piano concerto')
+        stats, = collected
+        self.assertEqual(stats.kind, 'search')
+        self.assertEqual(sorted(stats.timings),
+                         ['index_fetch', 'instance_loading',
+                          'lookup', 'scoring', 'tokenize'])
+        self.assertEqual(stats.info['tokens'], [u'piano', u'concerto'])
+        self.assertEqual(stats.info['found_words'], [u'concerto', u'piano'])
+        self.assertEqual(stats.info['index_rows'], 2)
+        self.assertEqual(stats.queries['index_fetch'], 1)
+        self.assertEqual(stats.queries['instance_loading'], 1)
+        self.assertEqual(stats.as_dict()['candidates'], 1)
+
+    def test_index_stats(self):
+        with collect_stats() as collected:
+            Sentence.objects.create(text=u'piano concerto')
+        stats, = collected
+        self.assertEqual(stats.kind, 'index')
+        self.assertEqual(stats.info, {'tokens': 2, 'rows_written': 2})
+        # two index entries, document frequency update, and word
+        # frequency update with a lookup of the meanings' words
+        self.assertEqual(stats.queries['write'], 5)
+
+    def test_query_log_trimmed(self):
+        logged = len(connection.queries)
+        with collect_stats():
+            get_scored_matches_for_sentence(Sentence, u'piano concerto')
+            self.assertTrue(len(connection.queries) > logged)
+        self.assertEqual(len(connection.queries), logged)
+
+    def test_signal(self):
+        received = []
+        def receiver(sender, stats, **kwargs):
+            received.append((sender, stats))
+        stats_collected.connect(receiver)
+        try:
+            with operation('test') as stats:
+                with stats.measure('phase'):
+                    pass
+        finally:
+            stats_collected.disconnect(receiver)
+        self.assertEqual(received, [('test', stats)])
+        self.assertTrue('phase' in stats.timings)
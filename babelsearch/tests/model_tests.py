@@ -1,13 +1,20 @@
 # -*- coding: utf-8 -*-
 
 from django.test import TestCase
+import os
+import tempfile
 import unittest
 
+from django.contrib.contenttypes.models import ContentType
 from django.db import IntegrityError
 from django.db.models import F
 
-from babelsearch.models import divisions, Meaning, Word, IndexEntry
-from babelsearch.indexer import registry
+from babelsearch.models import (
+    best_division, divisions, sorted_divisions, Meaning, Word, IndexEntry,
+    read_vocabulary_filter, write_vocabulary_filter)
+from babelsearch.bulk import bulk_insert
+from babelsearch.indexer import ModelMetadata, get_metadata, registry
+from babelsearch.tests.settings_helpers import patch_settings
 from babelsearch.tests.testapp.models import Author, Sentence
 from babelsearch.tests.tools import (listify,
                                      setify,
@@ -61,6 +68,30 @@ class DivisionsTests(unittest.TestCase):
         self.assertDivision('12345', vocabulary='1,2345', expected='')
 
 
+class BestDivisionTests(unittest.TestCase):
+    def test_same_as_sorted_divisions(self):
+        vocabulary = set('a,ab,abc,abcd,bc,bcd,cde,cdef,def,defg,efg,fgh,'
+                         'gh,ghij,hij,ij,12,123'.split(','))
+        for word in ('abcdefghij', 'abcdefg', 'abcdef', 'a', 'x', 'abcx',
+                     '123', '12', 'abc123', 'bcdefghij', 'ghijabcd'):
+            for max_parts in (1, 2, 3, 4):
+                for min_lengths in ((1, 3), (1,), (2, 3, 4), (0, 1)):
+                    divs = sorted_divisions(word, vocabulary,
+                                            max_parts, min_lengths)
+                    self.assertEqual(
+                        best_division(word, vocabulary,
+                                      max_parts, min_lengths),
+                        divs and divs[0] or None,
+                        (word, max_parts, min_lengths))
+
+    def test_max_steps(self):
+        word = 'a' * 40
+        vocabulary = set('a' * length for length in range(3, 40))
+        self.assertEqual(best_division(word, vocabulary),
+                         ('a' * 20, 'a' * 20))
+        self.assertEqual(best_division(word, vocabulary, max_steps=10), None)
+
+
 class MeaningCreationTests(TestCase):
 
     def test_01_add_empty_meaning(self):
@@ -111,6 +142,38 @@ class MeaningCreationTests(TestCase):
             words=[('en', 'mold'), ('fi', 'muotti')])
         m.add_words([('en', 'mold')])
 
+    def test_08_add_many_words_with_constant_queries(self):
+        Word.objects.create(language='en', normalized_spelling='mold')
+        m = Meaning.objects.create()
+        words = [('en', 'mold'), ('fi', 'home'), ('fi', 'vuoka'),
+                 ('fi', 'muotti'), ('de', 'schimmel')]
+        # fetch, insert, re-fetch words; check and insert links
+        self.assertNumQueries(5, m.add_words, words)
+        assert_meaning(m, 'de:schimmel', 'en:mold',
+                       'fi:home', 'fi:muotti', 'fi:vuoka')
+        self.assertEqual(Word.objects.count(), 5)
+        self.assertTrue(Word._get_cache().contains('schimmel'))
+
+    def test_09_bulk_create_with_words(self):
+        Word.objects.create(language='en', normalized_spelling='mold')
+        meanings = Meaning.objects.bulk_create_with_words(
+            [('en', 'mold'), (None, 'fuge'), ('fi', 'koti')])
+        self.assertEqual(len(meanings), 3)
+        assert_meaning(meanings[0], 'en:mold')
+        assert_meaning(meanings[1], '?:fuge')
+        assert_meaning(meanings[2], 'fi:koti')
+        self.assertEqual(Word.objects.count(), 3)
+
+    def test_10_prefetch_words(self):
+        Meaning.objects.create(words=[('fi', 'koti'), ('en', 'home')])
+        Meaning.objects.create(words=[(None, 'bach')])
+        Meaning.objects.create()
+        meanings = list(Meaning.objects.all())
+        self.assertNumQueries(1, Meaning.objects.prefetch_words, meanings)
+        self.assertNumQueries(0, lambda: [unicode(m) for m in meanings])
+        self.assertEqual([unicode(m) for m in meanings],
+                         [u'1: en:home,fi:koti', u'2: None:bach', u'3: '])
+
 class MeaningHelpers(object):
     def assertMeanings(self, queryset, *expected_meanings):
         """
@@ -265,6 +328,99 @@ class MeaningAnalysisTests(TestCase, MeaningHelpers):
             ())
         self.assertEqual(words, set([u'konsertto', 'home', 'piano']))
 
+    def test_13b_lookup_ordered_pks(self):
+        spellings = ['home', 'pianokonsertto', 'home', 'unknown']
+        meaning_tree, words = Meaning.objects.lookup_ordered_pks(spellings)
+        self.assertEqual(
+            [sorted(position) for position in meaning_tree],
+            [sorted([self.mold_fungus.pk, self.home.pk]),
+             sorted([self.piano.pk, self.concerto.pk]),
+             sorted([self.mold_fungus.pk, self.home.pk]),
+             []])
+        self.assertEqual(words, set([u'konsertto', 'home', 'piano']))
+        self.assertMeaningTree(
+            Meaning.objects.load_ordered(meaning_tree),
+            (self.mold_fungus, self.home),
+            (self.piano, self.concerto),
+            (self.mold_fungus, self.home),
+            ())
+
+    def test_13c_unknown_words_remembered(self):
+        lookup = Meaning.objects.lookup_splitting
+        self.assertNumQueries(1, lookup, u'xyzzy')
+        self.assertNumQueries(1, lookup, u'xyzzy')
+        with patch_settings(BABELSEARCH_UNKNOWN_WORD_CACHE_SIZE=10):
+            Word._vocabulary_changed()
+            self.assertNumQueries(1, lookup, u'xyzzy')
+            self.assertNumQueries(0, lookup, u'xyzzy')
+            # added by another process, without a new vocabulary version
+            meaning = Meaning.objects.create()
+            bulk_insert(Word, [Word(language='en',
+                                    normalized_spelling=u'xyzzy')])
+            word = Word.objects.get(normalized_spelling=u'xyzzy')
+            bulk_insert(Meaning.words.through, [Meaning.words.through(
+                meaning_id=meaning.pk, word_id=word.pk)])
+            Word._get_cache().add(u'xyzzy')
+            meanings, words = lookup(u'xyzzy', create_missing=True)
+            self.assertMeanings(meanings, meaning)
+            self.assertEqual(Meaning.objects.filter(
+                words__normalized_spelling=u'xyzzy').count(), 1)
+
+    def test_13d_bloom_filter(self):
+        with patch_settings(BABELSEARCH_VOCABULARY_BLOOM_FILTER=True):
+            try:
+                Word.get_bloom_filter()
+                self.assertNumQueries(
+                    0, Meaning.objects.lookup_splitting, u'qwzxj')
+                meanings, words = Meaning.objects.lookup_splitting(
+                    u'pianokonsertto')
+                self.assertMeanings(meanings, self.piano, self.concerto)
+                qwzxj = self.create_meaning('en:qwzxj')
+                meanings, words = Meaning.objects.lookup_splitting(u'qwzxj')
+                self.assertMeanings(meanings, qwzxj)
+            finally:
+                Word._bloom_filter = None
+
+    def test_13e_bloom_filter_refresh(self):
+        with patch_settings(BABELSEARCH_VOCABULARY_BLOOM_FILTER=True,
+                            BABELSEARCH_VOCABULARY_BLOOM_FILTER_REFRESH=0):
+            try:
+                Word.get_bloom_filter()
+                # added by another process
+                bulk_insert(Word, [Word(language='en',
+                                        normalized_spelling=u'qwzxj')])
+                self.assertTrue(u'qwzxj' in Word.get_bloom_filter())
+                meanings, words = Meaning.objects.lookup_splitting(
+                    u'qwzxj', create_missing=True)
+                self.assertEqual(words, (u'qwzxj',))
+                self.assertEqual(Word.objects.filter(
+                    normalized_spelling=u'qwzxj').count(), 1)
+            finally:
+                Word._bloom_filter = None
+
+    def test_13f_shared_bloom_filter(self):
+        path = tempfile.mktemp()
+        settings = dict(BABELSEARCH_VOCABULARY_BLOOM_FILTER=True,
+                        BABELSEARCH_VOCABULARY_BLOOM_FILTER_PATH=path)
+        try:
+            written, signature = write_vocabulary_filter(path)
+            self.assertTrue(u'konsertto' in written)
+            read, read_signature = read_vocabulary_filter(path)
+            self.assertEqual(read_signature, signature)
+            self.assertEqual(read.size, written.size)
+            self.assertTrue(u'konsertto' in read)
+            # added by another process after the file was written
+            bulk_insert(Word, [Word(language='en',
+                                    normalized_spelling=u'qwzxj')])
+            with patch_settings(**settings):
+                self.assertTrue(u'qwzxj' in Word.get_bloom_filter())
+            read, read_signature = read_vocabulary_filter(path)
+            self.assertNotEqual(read_signature, signature)
+            self.assertTrue(u'qwzxj' in read)
+        finally:
+            Word._bloom_filter = None
+            os.remove(path)
+
     def test_14_lookup_ordered_create_missing(self):
         meaning_tree, words = Meaning.objects.lookup_ordered(
             ['home', 'beef'], create_missing=True)
@@ -287,6 +443,29 @@ class MeaningAnalysisTests(TestCase, MeaningHelpers):
             self.mold_fungus, self.home, self.piano, self.concerto)
         self.assertEqual(words, set([u'konsertto', u'home', u'piano']))
 
+    def test_16_lookup_prefix(self):
+        Word.objects.filter(normalized_spelling='konzert').update(frequency=5)
+        self.assertEqual(Meaning.objects.lookup_prefix(u'kon'),
+                         [self.concerto])
+        self.assertEqual(
+            sorted(m.pk for m in Meaning.objects.lookup_prefix(u'm')),
+            [self.mold_fungus.pk, self.mold_food.pk,
+             self.mold_manufacturing.pk])
+        self.assertEqual(len(Meaning.objects.lookup_prefix(u'm', limit=2)), 2)
+        self.assertEqual(Meaning.objects.lookup_prefix(u'x'), [])
+        self.assertEqual(
+            Meaning.objects.lookup_prefix(u'k'),
+            [self.concerto, self.piano, self.home])
+
+    def test_17_lookup_as_you_type(self):
+        meaning_tree, words = Meaning.objects.lookup_as_you_type(
+            u'piano kons')
+        self.assertMeaningTree(meaning_tree, (self.piano,), (self.concerto,))
+        self.assertEqual(words, set([u'piano']))
+        meaning_tree, words = Meaning.objects.lookup_as_you_type(
+            u'piano kons ')
+        self.assertMeaningTree(meaning_tree, (self.piano,), ())
+
 
 class IndexerTests(TestCase, MeaningHelpers):
 
@@ -351,6 +530,23 @@ class IndexerTests(TestCase, MeaningHelpers):
         self.assertTrue(Sentence in registry)
         self.assertEqual(registry[Sentence],  ('authors__name', 'text',))
 
+    def test_01b_metadata(self):
+        metadata = get_metadata(Sentence)
+        self.assertEqual(metadata.field_paths,
+                         [('authors', 'name'), ('text',)])
+        self.assertEqual(metadata.table, 'testapp_sentence')
+        self.assertEqual(metadata.content_type_id,
+                         ContentType.objects.get_for_model(Sentence).pk)
+        # many-to-many relations can't be selected with the instances
+        self.assertEqual(metadata.select_related, [])
+        metadata = ModelMetadata(
+            IndexEntry, ('meaning__words__normalized_spelling', 'order'))
+        self.assertEqual(metadata.select_related, ['meaning'])
+        self.assertEqual(
+            [(e.content_type_id, e.object_id)
+             for e in self.sentence.index_entries.all()][:1],
+            [(get_metadata(Sentence).content_type_id, self.sentence.pk)])
+
     def test_02_index_on_post_save(self):
         self.assertIndexEntries(
             (self.sentence.index_entries.all()),
@@ -358,20 +554,18 @@ class IndexerTests(TestCase, MeaningHelpers):
 
     def test_03_frequencies_updated_on_save(self):
         f=self.assertWordFrequency
-        f(0, 'en:mold', 'fi:home', 'en:home', 'fi:koti', 'en:piano', 'fi:piano',
-          'en:concerto', 'fi:konsertto')
-
-        ## frequency counting currently disabled, not possible to
-        ## implement consistently in the current model
-        #f(1, 'de:klavier', 'de:konzert', ':goethe')
-        f(0, 'de:klavier', 'de:konzert', ':goethe')
+        f(0, 'en:mold', 'fi:home', 'en:home', 'fi:koti')
+        # all words of matched meanings are counted
+        f(1, 'en:piano', 'fi:piano', 'en:concerto', 'fi:konsertto',
+          'de:klavier', 'de:konzert', ':goethe')
 
     def test_04_raw_save_not_indexed(self):
         s = Sentence(text=u'home pianokonsertto')
         s.save_base(raw=True) # prevent automatic indexing
         self.assertFalse([e.meaning for e in s.index_entries.all()])
         f=self.assertWordFrequency
-        f(0, 'fi:home', 'en:home', 'en:piano', 'fi:piano', 'fi:konsertto')
+        f(0, 'fi:home', 'en:home')
+        f(1, 'en:piano', 'fi:piano', 'fi:konsertto')
         IndexEntry.objects.create_for_instance(s)
         s.delete()
 
@@ -388,13 +582,25 @@ class IndexerTests(TestCase, MeaningHelpers):
             s.index_entries.all(),
             1, self.mold_fungus, self.home, 2, self.piano, self.concerto)
         f=self.assertWordFrequency
-
-        ## frequency counting currently disabled, not possible to
-        ## implement consistently in the current model
-        #f(1, 'fi:home', 'en:home', 'en:piano', 'fi:piano', 'fi:konsertto')
-        f(0, 'fi:home', 'en:home', 'en:piano', 'fi:piano', 'fi:konsertto')
-
+        f(1, 'fi:home', 'en:home', 'en:mold', 'fi:koti')
+        f(2, 'en:piano', 'fi:piano', 'fi:konsertto')
         s.delete()
+        f(0, 'fi:home', 'en:home', 'en:mold', 'fi:koti')
+        f(1, 'en:piano', 'fi:piano', 'fi:konsertto')
+
+    def test_06b_batched_frequency_updates(self):
+        with Word.objects.batched_frequency_updates():
+            s = Sentence.objects.create(text=u'home pianokonsertto')
+            self.assertWordFrequency(0, 'fi:home')
+            s.delete()
+            t = Sentence.objects.create(text=u'koti')
+        self.assertWordFrequency(1, 'fi:koti', 'en:home', 'en:piano')
+        self.assertWordFrequency(0, 'fi:home', 'en:mold')
+        Word.objects.update(frequency=0)
+        Word.objects.update_frequencies()
+        self.assertWordFrequency(1, 'fi:koti', 'en:home', 'en:piano')
+        self.assertWordFrequency(0, 'fi:home', 'en:mold')
+        t.delete()
 
     def test_07_add_missing_words_to_index(self):
         self.assertEqual(repr(Meaning.objects.all()),
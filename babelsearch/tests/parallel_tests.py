@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.test import TestCase
+
+from babelsearch.datastruct import BoundedPrefixCache
+from babelsearch.models import (
+    Meaning, Word, get_scored_matches_for_sentence)
+from babelsearch.parallel import (
+    SynchronousExecutor,
+    ThreadExecutor,
+    lookup_ordered_concurrently,
+    search_concurrently,
+    iter_search_pages)
+from babelsearch.tests.testapp.models import Sentence
+
+
+class SharedConnectionExecutor(ThreadExecutor):
+    """
+    A `ThreadExecutor` whose threads use the connections of the thread
+    which created it, since each connection to an in-memory SQLite
+    database has a database of its own.
+    """
+
+    def __init__(self, threads=2):
+        super(SharedConnectionExecutor, self).__init__(threads)
+        self.connections = {}
+        for alias in settings.DATABASES:
+            connections[alias].cursor()
+            self.connections[alias] = connections[alias].connection
+
+    def submit(self, function, *args, **kwargs):
+        def run():
+            for alias, connection in self.connections.iteritems():
+                connections[alias].connection = connection
+            try:
+                return function(*args, **kwargs)
+            finally:
+                # detached so that closing can't destroy the databases
+                for alias in self.connections:
+                    connections[alias].connection = None
+        return super(SharedConnectionExecutor, self).submit(run)
+
+
+def get_threaded_executor(test):
+    for database in settings.DATABASES.itervalues():
+        if database.get('OPTIONS', {}).get('check_same_thread', True):
+            test.skipTest('needs connections which threads can share')
+    return SharedConnectionExecutor()
+
+
+class ThreadExecutor_Tests(TestCase):
+    def test_submit(self):
+        executor = ThreadExecutor(2)
+        results = [executor.submit(pow, i, 2) for i in range(5)]
+        self.assertEqual([r.get() for r in results], [0, 1, 4, 9, 16])
+        executor.close()
+
+    def test_closes_connections(self):
+        closed = []
+        arrived = []
+        condition = threading.Condition()
+        def use_connection():
+            # attributes of connections are local to the thread
+            connections['default'].close = lambda: closed.append(True)
+            # waits for the other task so that each thread runs one
+            with condition:
+                arrived.append(True)
+                condition.notify_all()
+                while len(arrived) < 2:
+                    condition.wait()
+        executor = ThreadExecutor(2)
+        for result in [executor.submit(use_connection) for i in range(2)]:
+            result.get()
+        self.assertEqual(closed, [])
+        executor.close()
+        self.assertEqual(closed, [True, True])
+
+    def test_synchronous_exception(self):
+        result = SynchronousExecutor().submit(int, 'x')
+        self.assertRaises(ValueError, result.get)
+
+
+class ConcurrentSearch_Tests(TestCase):
+    def setUp(self):
+        self.executor = SynchronousExecutor()
+        self.piano = Meaning.objects.create(
+            words=[('en', 'piano'), ('de', 'klavier')])
+        self.concerto = Meaning.objects.create(
+            words=[('en', 'concerto'), ('de', 'konzert')])
+        self.sentences = [Sentence.objects.create(text=text) for text in (
+            u'klavierkonzert', u'piano', u'concerto grosso')]
+
+    def test_lookup_ordered(self):
+        result, words = lookup_ordered_concurrently(
+            [u'piano', u'klavierkonzert', u'piano'], self.executor)
+        self.assertEqual([set(position) for position in result],
+                         [set([self.piano.pk]),
+                          set([self.piano.pk, self.concerto.pk]),
+                          set([self.piano.pk])])
+        self.assertEqual(words, set([u'piano', u'klavier', u'konzert']))
+
+    def test_lookup_ordered_same_as_sequential(self):
+        words = [u'konzert', u'klavierkonzert', u'grosso', u'piano']
+        result, found_words = lookup_ordered_concurrently(
+            words, self.executor)
+        expected, expected_words = Meaning.objects.lookup_ordered_pks(words)
+        self.assertEqual([set(position) for position in result],
+                         [set(position) for position in expected])
+        self.assertEqual(found_words, expected_words)
+
+    def test_same_as_sequential(self):
+        self.assertEqual(
+            search_concurrently(Sentence, u'piano concerto',
+                                executor=self.executor),
+            get_scored_matches_for_sentence(Sentence, u'piano concerto'))
+
+    def test_pages(self):
+        pages = list(iter_search_pages(Sentence, u'piano concerto',
+                                       page_size=2, executor=self.executor))
+        self.assertEqual([len(page) for page in pages], [2, 1])
+        self.assertEqual(pages[0] + pages[1],
+                         get_scored_matches_for_sentence(Sentence,
+                                                         u'piano concerto'))
+
+
+class ThreadedSearch_Tests(ConcurrentSearch_Tests):
+    """Runs the concurrent search tests in threads"""
+
+    def setUp(self):
+        super(ThreadedSearch_Tests, self).setUp()
+        self.executor = get_threaded_executor(self)
+
+    def tearDown(self):
+        self.executor.close()
+
+
+class ThreadedPrefixCache_Tests(TestCase):
+    """Shares a cache which keeps evicting between threads"""
+
+    def setUp(self):
+        self.executor = get_threaded_executor(self)
+        self.spellings = [u'%s%s' % (a, b) for a in u'abcdef' for b in u'xyz']
+        for spelling in self.spellings:
+            Word.objects.create(normalized_spelling=spelling)
+
+    def tearDown(self):
+        self.executor.close()
+
+    def test_contains_while_evicting(self):
+        cache = BoundedPrefixCache(Word, 'normalized_spelling', max_bytes=1)
+        def look_up(spellings):
+            found = []
+            for spelling in spellings:
+                cache.add(spelling)
+                cache.discard(spelling + u'q')
+                found.append(cache.contains(spelling) and
+                             not cache.contains(spelling + u'q'))
+            return found
+        results = [self.executor.submit(look_up, self.spellings[i % 4::4])
+                   for i in range(20)]
+        self.assertTrue(all(all(result.get()) for result in results))
+        self.assertEqual(cache.get_stats()['fills'],
+                         cache.get_stats()['misses'])
@@ -0,0 +1,58 @@
+from django.test import TestCase
+
+from babelsearch.models import IndexEntry, Meaning, Word
+from babelsearch.pipeline import index_pipelined, split_texts
+from babelsearch.reindexer import reindex_all
+from babelsearch.tests.testapp.models import Sentence
+
+
+class SplitTexts_Tests(TestCase):
+    def test_divisions(self):
+        vocabulary = frozenset([u'piano', u'konsertto', u'home'])
+        self.assertEqual(
+            split_texts([u'Pianokonsertto, home', u'Unknown piano'],
+                        vocabulary),
+            [([u'pianokonsertto', u'home'],
+              {u'pianokonsertto': (u'piano', u'konsertto'),
+               u'home': (u'home',)}),
+             ([u'unknown', u'piano'],
+              {u'unknown': None, u'piano': (u'piano',)})])
+
+
+class PipelinedIndexing_Tests(TestCase):
+
+    def setUp(self):
+        m = lambda *words: Meaning.objects.create(
+            words=[word.split(':') for word in words])
+        m('en:piano', 'fi:piano', 'de:klavier')
+        m('en:concerto', 'fi:konsertto')
+        m('en:home', 'fi:koti')
+        m('fi:home')
+        for text in (u'Pianokonsertto home', u'Klavier', u'koti ja piano',
+                     u'ja ja'):
+            Sentence.objects.create(text=text)
+
+    def get_index(self):
+        return (
+            sorted(IndexEntry.objects.values_list(
+                'object_id', 'order', 'meaning')),
+            sorted(Meaning.objects.values_list('pk', 'document_frequency')),
+            sorted(Word.objects.values_list(
+                'normalized_spelling', 'language', 'frequency')))
+
+    def test_01_same_as_sequential(self):
+        expected = self.get_index()
+        reindex_all(processes=2)
+        self.assertEqual(self.get_index(), expected)
+
+    def test_02_creates_missing_words(self):
+        sentence = Sentence.objects.create(text=u'zyzzyva')
+        IndexEntry.objects.delete_for_instance(sentence)
+        Meaning.objects.filter(words__normalized_spelling=u'zyzzyva').delete()
+        Word.objects.filter(normalized_spelling=u'zyzzyva').delete()
+        self.assertEqual(index_pipelined([sentence], processes=1), 1)
+        meaning = Meaning.objects.get(words__normalized_spelling=u'zyzzyva')
+        self.assertEqual(
+            list(sentence.index_entries.values_list('order', 'meaning')),
+            [(1, meaning.pk)])
+        self.assertEqual(meaning.document_frequency, 1)
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.db import router
+from django.test import TestCase
+
+from babelsearch.models import (
+    Meaning, ReindexQueue, Word, get_scored_matches_for_sentence)
+from babelsearch.replicas import (
+    get_primary, get_read_database, read_from_primary)
+from babelsearch.tests.settings_helpers import patch_settings
+from babelsearch.tests.testapp.models import Sentence
+from babelsearch.views import READ_FROM_PRIMARY_COOKIE
+
+
+# the tables of the index_shard test database stand in for a replica
+# which hasn't caught up with the primary yet
+REPLICAS = {'default': ['index_shard']}
+
+
+class ReadReplica_Tests(TestCase):
+
+    urls = 'babelsearch.urls'
+
+    def setUp(self):
+        if 'index_shard' not in settings.DATABASES:
+            self.skipTest('needs the index_shard database')
+        self.piano = Meaning.objects.create(
+            words=[('en', 'piano'), ('de', 'klavier')])
+        self.sentence = Sentence.objects.create(text=u'piano')
+        self.patch = patch_settings(BABELSEARCH_READ_REPLICAS=REPLICAS)
+        self.patch.__enter__()
+
+    def tearDown(self):
+        self.patch.__exit__(None, None, None)
+        # the prefix cache of the replica outlives its test database
+        for cache in Word._get_caches():
+            cache.clear()
+
+    def test_01_routing(self):
+        self.assertEqual(get_primary('index_shard'), 'default')
+        self.assertEqual(get_read_database('default'), 'index_shard')
+        self.assertEqual(router.db_for_read(Word), 'index_shard')
+        self.assertEqual(router.db_for_read(ReindexQueue), 'default')
+        self.assertEqual(router.db_for_write(Word), 'default')
+        self.assertFalse(router.allow_syncdb('index_shard', Word))
+        with read_from_primary():
+            self.assertEqual(router.db_for_read(Word), 'default')
+        self.assertEqual(router.db_for_read(Sentence), 'default')
+
+    def test_02_instances_from_replicas_are_saved_to_primary(self):
+        word = Word.objects.using('default').get(normalized_spelling='piano')
+        word._state.db = 'index_shard'
+        self.assertEqual(router.db_for_write(Word, instance=word), 'default')
+
+    def test_03_search_reads_from_replica(self):
+        self.assertEqual(
+            get_scored_matches_for_sentence(Sentence, u'piano'), [])
+        self.assertEqual(
+            get_scored_matches_for_sentence(Sentence, u'piano',
+                                            using='default'),
+            [{'instance': self.sentence, 'score': 100}])
+
+    def test_04_writes_read_from_primary(self):
+        words = Word.objects.get_or_create_many([('en', 'piano')])
+        self.assertEqual(words[('en', 'piano')].normalized_spelling, 'piano')
+        self.assertEqual(
+            Word.objects.using('default')
+            .filter(normalized_spelling='piano').count(), 1)
+        self.piano.add_words([('en', 'piano'), ('fr', 'piano')])
+        self.assertEqual(self.piano.words.using('default').count(), 3)
+        Sentence.objects.create(text=u'Klavier')
+        self.assertEqual(
+            Meaning.objects.using('default')
+            .get(pk=self.piano.pk).document_frequency, 2)
+
+    def test_05_edit_vocabulary_reads_own_writes(self):
+        path = '/vocabulary/testapp/sentence/%d/' % self.sentence.pk
+        response = self.client.get(path)
+        self.assertEqual(response.context['meanings_formset'].initial, [])
+        response = self.client.post('/vocabulary/', {
+            'words-words': u'',
+            'meanings-TOTAL_FORMS': u'0',
+            'meanings-INITIAL_FORMS': u'0'})
+        self.assertTrue(READ_FROM_PRIMARY_COOKIE in response.cookies)
+        response = self.client.get(path)
+        self.assertEqual(
+            [data['meaning']
+             for data in response.context['meanings_formset'].initial],
+            [self.piano.pk])
+
+    def test_06_prefix_cache_per_database(self):
+        self.assertEqual(list(Meaning.objects.lookup_exact(u'piano')), [])
+        self.assertEqual(
+            list(Meaning.objects.db_manager('default').lookup_exact(u'piano')),
+            [self.piano])
+        self.assertFalse(Word._get_cache().contains(u'piano'))
+        self.assertTrue(Word._get_cache('default').contains(u'piano'))
@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
 
+from django.db import connection
 from django.test import TestCase
 
 from babelsearch.models import (
     Meaning, Word, IndexEntry,
     get_index_info_for_meanings,
-    get_scored_matches, get_scored_matches_for_sentence)
+    get_scored_matches, get_scored_matches_for_sentence,
+    calculate_proximity_score, get_top_scored_matches,
+    get_faceted_matches_for_sentence)
 from babelsearch.indexer import registry
 from babelsearch.datastruct import SetList
+from babelsearch.stopwords import forget_instance_count, get_instance_count
 from babelsearch.tests.testapp.models import Sentence
+from babelsearch.tests.settings_helpers import patch_settings
 
 class SearchTests(TestCase):
 
@@ -69,3 +74,167 @@ class SearchTests(TestCase):
         self.assertEqual(result,
                          [{'instance': self.bach_oeuvres, 'score': 75},
                           {'instance': self.tsaikovski_werke, 'score': 25}])
+
+    def test_05_proximity_score(self):
+        near = Sentence.objects.create(text=u'Bach works')
+        far = Sentence.objects.create(text=u'works by Bach')
+        result = get_scored_matches_for_sentence(
+            Sentence, u'bach works', scorer=calculate_proximity_score)
+        self.assertEqual(result,
+                         [{'instance': near, 'score': 200},
+                          {'instance': self.bach_oeuvres, 'score': 166},
+                          {'instance': far, 'score': 100},
+                          {'instance': self.tsaikovski_werke, 'score': 33}])
+
+    def test_06_proximity_score_compound(self):
+        meaning_tree = SetList([[self.piano], [self.works]])
+        result = get_scored_matches(Sentence, meaning_tree,
+                                    scorer=calculate_proximity_score)
+        self.assertEqual(result, [(200, self.tsaikovski_werke.pk),
+                                  (50, self.bach_oeuvres.pk)])
+
+    def test_07_document_frequencies(self):
+        self.assertEqual(
+            Meaning.objects.get(pk=self.bach.pk).document_frequency, 1)
+        self.assertEqual(
+            Meaning.objects.get(pk=self.works.pk).document_frequency, 2)
+        Sentence.objects.create(text=u'Bach')
+        self.bach_oeuvres.delete()
+        self.assertEqual(
+            Meaning.objects.get(pk=self.bach.pk).document_frequency, 1)
+        self.assertEqual(
+            Meaning.objects.get(pk=self.works.pk).document_frequency, 1)
+        Meaning.objects.update(document_frequency=0)
+        Meaning.objects.update_document_frequencies(chunk_size=3)
+        self.assertEqual(
+            Meaning.objects.get(pk=self.bach.pk).document_frequency, 1)
+        self.assertEqual(
+            Meaning.objects.get(pk=self.works.pk).document_frequency, 1)
+
+    def test_08_top_scored_matches_same_as_full(self):
+        for text in (u'works', u'complete works', u'Bach', u'works works'):
+            Sentence.objects.create(text=text)
+        meaning_tree = SetList([[self.bach],
+                                [self.functions, self.works],
+                                [self.complete]])
+        # the tree must hold current document frequencies
+        meaning_tree = SetList(
+            [Meaning.objects.filter(pk__in=[m.pk for m in position])
+             for position in meaning_tree])
+        full = get_scored_matches(Sentence, meaning_tree)
+        for limit in range(1, len(full) + 2):
+            self.assertEqual(
+                get_top_scored_matches(Sentence, meaning_tree, limit),
+                full[:limit])
+
+    def test_09_top_scored_matches_prunes_common_meanings(self):
+        meaning_tree = SetList([[Meaning.objects.get(pk=self.works.pk)],
+                                [Meaning.objects.get(pk=self.bach.pk)],
+                                [Meaning.objects.get(pk=self.complete.pk)]])
+        connection.use_debug_cursor = True
+        try:
+            start = len(connection.queries)
+            result = get_top_scored_matches(Sentence, meaning_tree, 1)
+            queries = [q['sql'] for q in connection.queries[start:]]
+        finally:
+            connection.use_debug_cursor = None
+        self.assertEqual(result, [(100, self.bach_oeuvres.pk)])
+        # bach and complete first, then the common works meaning only
+        # for the one remaining candidate
+        self.assertEqual(len(queries), 3)
+        self.assertTrue('"object_id" IN (%d)' % self.bach_oeuvres.pk
+                        in queries[-1], queries[-1])
+
+    def test_10_idf(self):
+        result = get_scored_matches_for_sentence(
+            Sentence, u'bach works', idf=True)
+        # the rare 'functions' meaning outweighs 'bach' and 'works'
+        self.assertEqual(result,
+                         [{'instance': self.bach_oeuvres, 'score': 55},
+                          {'instance': self.tsaikovski_werke, 'score': 23}])
+
+    def test_11_stopwords_only_rescore(self):
+        Sentence.objects.create(text=u'the end')
+        with patch_settings(BABELSEARCH_STOPWORDS={'en': ['the']}):
+            result = get_scored_matches_for_sentence(Sentence, u'the viola')
+            self.assertEqual(result,
+                             [{'instance': self.laubach_school, 'score': 100}])
+            result = get_scored_matches_for_sentence(
+                Sentence, u'the viola', early_termination=True)
+            self.assertEqual(result,
+                             [{'instance': self.laubach_school, 'score': 100}])
+
+    def test_12_only_stopwords(self):
+        end = Sentence.objects.create(text=u'the end')
+        with patch_settings(BABELSEARCH_STOPWORDS={'en': ['the']}):
+            result = get_scored_matches_for_sentence(Sentence, u'the')
+        self.assertEqual(result,
+                         [{'instance': end, 'score': 100},
+                          {'instance': self.laubach_school, 'score': 100}])
+
+    def test_13_common_meaning_ratio(self):
+        with patch_settings(BABELSEARCH_COMMON_MEANING_RATIO=0.5):
+            for early_termination in False, True:
+                result = get_scored_matches_for_sentence(
+                    Sentence, u'bach works',
+                    early_termination=early_termination)
+                self.assertEqual(result,
+                                 [{'instance': self.bach_oeuvres,
+                                   'score': 66}])
+
+    def test_13b_instance_count_cached(self):
+        forget_instance_count(Sentence)
+        count = Sentence.objects.count()
+        self.assertNumQueries(1, get_instance_count, Sentence)
+        self.assertNumQueries(0, get_instance_count, Sentence)
+        sentence = Sentence.objects.create(text=u'viola')
+        self.assertEqual(get_instance_count(Sentence), count + 1)
+        sentence.delete()
+        self.assertEqual(get_instance_count(Sentence), count)
+
+    def test_14_stopwords_not_indexed(self):
+        with patch_settings(BABELSEARCH_STOPWORDS={'en': ['the']},
+                            BABELSEARCH_INDEX_STOPWORDS=False):
+            sentence = Sentence.objects.create(text=u'the viola')
+        entries = IndexEntry.objects.filter(object_id=sentence.pk)
+        self.assertEqual([(e.order, e.meaning) for e in entries],
+                         [(2, self.viola)])
+        self.assertEqual(
+            Meaning.objects.get(pk=self.the.pk).document_frequency, 1)
+
+    def test_15_prefilter_joined(self):
+        queryset = Sentence.objects.filter(text__startswith=u'Bach')
+        sql = unicode(get_index_info_for_meanings(
+            queryset, [self.works.pk]).query)
+        self.assertFalse('SELECT' in sql[1:], sql)
+        result = get_scored_matches_for_sentence(queryset, u'bach works')
+        self.assertEqual(result,
+                         [{'instance': self.bach_oeuvres, 'score': 66}])
+        self.assertEqual(get_scored_matches_for_sentence(
+                Sentence.objects.filter(pk__in=[]), u'bach works'), [])
+
+    def test_16_prefilter_with_joins(self):
+        self.tsaikovski_werke.authors.create(name=u'Tsaikovski')
+        queryset = Sentence.objects.filter(authors__name=u'Tsaikovski')
+        result = get_scored_matches_for_sentence(queryset, u'bach works')
+        self.assertEqual(result,
+                         [{'instance': self.tsaikovski_werke, 'score': 33}])
+
+    def test_17_facets(self):
+        Sentence.objects.filter(pk=self.bach_oeuvres.pk).update(
+            category=u'organ')
+        Sentence.objects.filter(pk=self.tsaikovski_werke.pk).update(
+            category=u'piano')
+        Sentence.objects.create(text=u'Werke', category=u'piano')
+        result, facets = get_faceted_matches_for_sentence(
+            Sentence, u'bach works', ['category'], limit=1)
+        self.assertEqual(result,
+                         [{'instance': self.bach_oeuvres, 'score': 66}])
+        self.assertEqual(facets, {'category': {u'organ': 1, u'piano': 2}})
+        result, facets = get_faceted_matches_for_sentence(
+            Sentence.objects.filter(category=u'piano'), u'bach works',
+            ['category', 'id'])
+        self.assertEqual(facets['category'], {u'piano': 2})
+        self.assertEqual(len(facets['id']), 2)
+        self.assertRaises(ValueError, get_faceted_matches_for_sentence,
+                          Sentence, u'bach', ['authors'])
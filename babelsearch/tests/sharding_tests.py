@@ -0,0 +1,182 @@
+import contextlib
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.test import TestCase
+import mock
+
+from babelsearch import parallel
+from babelsearch.bulk import chunked
+from babelsearch.models import (
+    IndexEntry, Meaning, Word,
+    get_faceted_matches_for_sentence, get_scored_matches_for_sentence)
+from babelsearch.reindexer import get_instance_pks_with_meanings
+from babelsearch.sharding import IndexShardRouter, get_shard
+from babelsearch.tests.parallel_tests import get_threaded_executor
+from babelsearch.tests.settings_helpers import patch_settings
+from babelsearch.tests.testapp.models import Sentence
+
+
+SHARDS = ('default', 'index_shard')
+
+
+class ShardedIndex_Tests(TestCase):
+
+    def setUp(self):
+        if 'index_shard' not in settings.DATABASES:
+            self.skipTest('needs the index_shard database')
+        self.patch = patch_settings(BABELSEARCH_INDEX_SHARDS=SHARDS)
+        self.patch.__enter__()
+        m = lambda *words: Meaning.objects.create(
+            words=[word.split(':') for word in words])
+        self.bach = m('de:bach')
+        self.works = m('en:works', 'de:werke')
+        self.piano = m('en:piano', 'de:klavier')
+        self.sentences = [
+            Sentence.objects.create(text=text, category=category)
+            for text, category in ((u'Bach works', u'organ'),
+                                   (u'Bach piano works', u'piano'),
+                                   (u'piano', u'piano'),
+                                   (u'Klavierwerke', u'piano'))]
+
+    def tearDown(self):
+        self.patch.__exit__(None, None, None)
+        # only the default database is rolled back after each test
+        IndexEntry.objects.using('index_shard').order_by().delete()
+
+    def entry_counts(self):
+        return [IndexEntry.objects.using(database).count()
+                for database in SHARDS]
+
+    def test_01_entries_in_owning_shard(self):
+        ctype = ContentType.objects.get_for_model(Sentence)
+        for sentence in self.sentences:
+            shard = SHARDS[sentence.pk % 2]
+            self.assertEqual(get_shard(ctype.pk, sentence.pk), shard)
+            self.assertTrue(IndexEntry.objects.using(shard)
+                            .filter(object_id=sentence.pk).exists())
+        self.assertTrue(all(self.entry_counts()))
+        self.sentences[1].delete()
+        self.assertFalse(any(
+            IndexEntry.objects.using(database)
+            .filter(object_id=self.sentences[1].pk).exists()
+            for database in SHARDS))
+
+    def test_02_search_merges_shards(self):
+        s = self.sentences
+        expected = [{'instance': s[3], 'score': 100},
+                    {'instance': s[1], 'score': 100},
+                    {'instance': s[2], 'score': 50},
+                    {'instance': s[0], 'score': 50}]
+        self.assertEqual(
+            get_scored_matches_for_sentence(Sentence, u'piano works'),
+            expected)
+        self.assertEqual(
+            get_scored_matches_for_sentence(Sentence, u'piano works',
+                                            early_termination=True),
+            expected)
+        self.assertEqual(
+            get_scored_matches_for_sentence(
+                Sentence.objects.filter(category=u'organ'), u'piano works'),
+            [{'instance': s[0], 'score': 50}])
+
+    def test_03_facets(self):
+        results, facets = get_faceted_matches_for_sentence(
+            Sentence, u'works', ['category'])
+        self.assertEqual(facets, {'category': {u'organ': 1, u'piano': 2}})
+
+    def test_04_frequencies(self):
+        Meaning.objects.update(document_frequency=0)
+        Word.objects.update(frequency=0)
+        Meaning.objects.update_document_frequencies()
+        Word.objects.update_frequencies()
+        self.assertEqual(
+            Meaning.objects.get(pk=self.works.pk).document_frequency, 3)
+        self.assertEqual(
+            Word.objects.get(normalized_spelling=u'piano').frequency, 3)
+
+    def test_05_reindexer_finds_instances_in_all_shards(self):
+        self.assertEqual(
+            get_instance_pks_with_meanings(Sentence, [self.bach.pk]),
+            set([self.sentences[0].pk, self.sentences[1].pk]))
+
+    def test_06_join_meanings(self):
+        Meaning.objects.join(self.works, self.bach)
+        self.assertEqual(
+            [IndexEntry.objects.using(database)
+             .filter(meaning=self.bach.pk).count()
+             for database in SHARDS],
+            [0, 0])
+        self.assertEqual(
+            get_instance_pks_with_meanings(Sentence, [self.works.pk]),
+            set(sentence.pk for sentence in self.sentences
+                if sentence.text != u'piano'))
+
+    def test_07_router(self):
+        router = IndexShardRouter()
+        ctype = ContentType.objects.get_for_model(Sentence)
+        entry = IndexEntry(content_type=ctype, object_id=3, order=1)
+        self.assertEqual(router.db_for_write(IndexEntry, instance=entry),
+                         'index_shard')
+        self.assertEqual(router.db_for_read(Meaning), None)
+        self.assertFalse(router.allow_syncdb('index_shard', Meaning))
+        self.assertEqual(router.allow_syncdb('index_shard', IndexEntry), None)
+        self.assertEqual(router.allow_syncdb('default', Meaning), None)
+
+    def test_08_search_shards_in_threads(self):
+        executor = get_threaded_executor(self)
+        try:
+            with mock.patch.object(parallel, '_default_executor', executor):
+                self.test_02_search_merges_shards()
+        finally:
+            executor.close()
+
+    def record_parameters(self):
+        """
+        Returns a list which receives the number of parameters of each
+        query on all connections, and a context manager to patch them.
+        """
+        counts = []
+        def record(sql, params):
+            counts.append((sql, len(params)))
+        patches = []
+        for alias in SHARDS:
+            connection = connections[alias]
+            patches.append(mock.patch.object(connection, 'use_debug_cursor',
+                                             True))
+            patches.append(mock.patch.object(
+                connection.ops, 'last_executed_query',
+                lambda cursor, sql, params: record(sql, params)))
+        return counts, contextlib.nested(*patches)
+
+    def test_09_prefilter_applied_in_chunks(self):
+        for category in (u'piano', u'organ') * 3:
+            Sentence.objects.create(text=u'piano', category=category)
+        pianos = Sentence.objects.filter(category=u'piano')
+        counts, patches = self.record_parameters()
+        with patches:
+            with mock.patch('babelsearch.models.chunked',
+                            lambda items: chunked(items, 2)):
+                results = [
+                    get_scored_matches_for_sentence(
+                        pianos, u'piano', early_termination=early_termination)
+                    for early_termination in (False, True)]
+        for result in results:
+            self.assertEqual(
+                sorted(match['instance'].pk for match in result),
+                sorted(pianos.values_list('pk', flat=True)))
+        prefilter_counts = [count for sql, count in counts
+                            if '"category" = %s' in sql and
+                            'babelsearch_indexentry' not in sql]
+        # the category and at most two primary keys
+        self.assertTrue(len(prefilter_counts) > 2)
+        self.assertTrue(max(prefilter_counts) <= 3, counts)
+
+    def test_10_meaning_deleted_from_all_shards(self):
+        pk = self.works.pk
+        self.works.delete()
+        self.assertEqual(
+            [IndexEntry.objects.using(database).filter(meaning=pk).count()
+             for database in SHARDS],
+            [0, 0])
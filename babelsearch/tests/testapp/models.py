@@ -13,6 +13,7 @@ class Author(models.Model):
 class Sentence(models.Model):
     authors = models.ManyToManyField(Author)
     text = models.CharField(max_length=300)
+    category = models.CharField(max_length=20, blank=True)
     index_entries = generic.GenericRelation(IndexEntry)
 
     def __unicode__(self):
@@ -0,0 +1,44 @@
+import unittest
+
+from babelsearch import vectorized
+from babelsearch.tests.search_tests import SearchTests
+from babelsearch.tests.settings_helpers import patch_settings
+
+
+class ScorePairs_Tests(unittest.TestCase):
+
+    def setUp(self):
+        if vectorized.numpy is None:
+            self.skipTest('needs NumPy')
+
+    def test_01_scores(self):
+        pairs = [(1, 10), (1, 11), (2, 10), (3, 12), (3, 10), (3, 11)]
+        self.assertEqual(vectorized.score_pairs(pairs, 3),
+                         [(100, 3), (66, 1), (33, 2)])
+        self.assertEqual(vectorized.score_pairs(iter(pairs), 3, limit=2),
+                         [(100, 3), (66, 1)])
+
+    def test_02_ties_by_descending_pk(self):
+        pairs = [(5, 1), (7, 1), (6, 1), (2, 1), (2, 2)]
+        self.assertEqual(vectorized.score_pairs(pairs, 2),
+                         [(100, 2), (50, 7), (50, 6), (50, 5)])
+        self.assertEqual(vectorized.score_pairs(pairs, 2, limit=3),
+                         [(100, 2), (50, 7), (50, 6)])
+
+    def test_03_empty(self):
+        self.assertEqual(vectorized.score_pairs([], 2), [])
+        self.assertEqual(vectorized.score_pairs([(1, 1)], 1, limit=0), [])
+
+
+class VectorizedSearchTests(SearchTests):
+    """Runs the search tests with vectorized scoring"""
+
+    def setUp(self):
+        if vectorized.numpy is None:
+            self.skipTest('needs NumPy')
+        super(VectorizedSearchTests, self).setUp()
+        self.patch = patch_settings(BABELSEARCH_VECTORIZED_SCORING=True)
+        self.patch.__enter__()
+
+    def tearDown(self):
+        self.patch.__exit__(None, None, None)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+
+from babelsearch.models import Meaning, Word, ReindexQueue
+from babelsearch.reindexer import queue_full_reindex, pop_full_reindex
+from babelsearch.vocabulary import (
+    VocabularyFormatError,
+    read_meanings,
+    format_meanings,
+    import_meanings,
+    iter_meanings)
+from babelsearch.tests.settings_helpers import patch_settings
+from babelsearch.tests.tools import assert_meanings
+
+
+class ReadMeanings_Tests(TestCase):
+    def test_txt(self):
+        result = list(read_meanings([u'en:piano  fi:Piano de:klavier\n',
+                                     u'\n',
+                                     u'# comment\n',
+                                     u'bach\n']))
+        self.assertEqual(result, [[('en', u'piano'),
+                                   ('fi', u'piano'),
+                                   ('de', u'klavier')],
+                                  [(None, u'bach')]])
+
+    def test_csv(self):
+        result = list(read_meanings([u'fr:pratique,"en:practical"\n'],
+                                    'csv'))
+        self.assertEqual(result, [[('fr', u'pratique'),
+                                   ('en', u'practical')]])
+
+    def test_jsonl(self):
+        result = list(read_meanings([u'["fr:\\u00e9cole", "en:school"]\n'],
+                                    'jsonl'))
+        self.assertEqual(result, [[('fr', u'ecole'), ('en', u'school')]])
+
+    def test_invalid_language(self):
+        self.assertRaises(VocabularyFormatError, list,
+                          read_meanings([u'english:piano']))
+
+    def test_jsonl_not_strings(self):
+        for line in (u'{"en": "school"}', u'"en:school"',
+                     u'["en:school", 1]'):
+            try:
+                list(read_meanings([u'["en:home"]', line], 'jsonl'))
+            except VocabularyFormatError, e:
+                self.assertTrue(str(e).startswith('Line 2:'), str(e))
+            else:
+                self.fail('No error for %r' % line)
+
+
+class FormatMeanings_Tests(TestCase):
+    def test_formats(self):
+        meanings = [[('de', u'klavier'), (None, u'piano')]]
+        self.assertEqual(list(format_meanings(meanings, 'txt')),
+                         [u'de:klavier piano'])
+        self.assertEqual(list(format_meanings(meanings, 'tsv')),
+                         [u'de:klavier\tpiano'])
+        self.assertEqual(list(format_meanings(meanings, 'csv')),
+                         [u'de:klavier,piano'])
+        self.assertEqual(list(format_meanings(meanings, 'jsonl')),
+                         [u'["de:klavier", "piano"]'])
+
+
+class ImportExport_Tests(TestCase):
+    def test_import(self):
+        Word.objects.create(language='en', normalized_spelling='piano')
+        count = import_meanings(
+            read_meanings([u'en:piano fi:piano de:klavier',
+                           u'en:concerto fi:konsertto',
+                           u'en:piano']),
+            batch_size=2)
+        self.assertEqual(count, 3)
+        assert_meanings(['de:klavier', 'en:piano', 'fi:piano'],
+                        ['en:concerto', 'fi:konsertto'],
+                        ['en:piano'])
+        self.assertEqual(Word.objects.count(), 5)
+
+    def test_import_twice(self):
+        Meaning.objects.create(words=[('en', 'home'), ('fi', 'koti')])
+        lines = [u'fi:koti en:home', u'en:piano de:klavier',
+                 u'de:klavier en:piano en:piano', u'en:piano']
+        self.assertEqual(import_meanings(read_meanings(lines)), 2)
+        self.assertEqual(import_meanings(read_meanings(lines)), 0)
+        assert_meanings(['en:home', 'fi:koti'],
+                        ['de:klavier', 'en:piano'],
+                        ['en:piano'])
+
+    def test_round_trip(self):
+        Meaning.objects.create(words=[('en', 'home'), ('fi', 'koti')])
+        Meaning.objects.create()
+        Meaning.objects.create(words=[(None, 'bach')])
+        lines = list(format_meanings(iter_meanings(batch_size=1)))
+        self.assertEqual(lines, [u'en:home fi:koti', u'bach'])
+
+
+class FullReindexQueue_Tests(TestCase):
+    def test_coalesced(self):
+        with patch_settings(BABELSEARCH_TRIGGER_PATH='/tmp/babelsearch.test'):
+            queue_full_reindex()
+            queue_full_reindex()
+        ReindexQueue.objects.create(type='meaning.pk', value='1')
+        self.assertEqual(ReindexQueue.objects.count(), 2)
+        self.assertTrue(pop_full_reindex())
+        self.assertEqual(ReindexQueue.objects.count(), 0)
+        self.assertFalse(pop_full_reindex())
@@ -0,0 +1,62 @@
+"""
+Vectorized scoring with NumPy.
+
+With ``BABELSEARCH_VECTORIZED_SCORING = True``, searches scored with
+`calculate_score` fetch the index entries as ``(object_id, meaning)``
+pairs into a NumPy array and count the distinct meanings of each
+instance with array operations, instead of building a `SetList` for
+every instance.  The scores and their order are the same as with
+`get_scored_matches`.
+
+NumPy is only needed when the setting is on.
+"""
+
+import itertools
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def is_enabled():
+    if not getattr(settings, 'BABELSEARCH_VECTORIZED_SCORING', False):
+        return False
+    if numpy is None:
+        raise ImproperlyConfigured(
+            'BABELSEARCH_VECTORIZED_SCORING requires NumPy')
+    return True
+
+
+def pairs_to_array(pairs):
+    """
+    Converts an iterable of ``(object_id, meaning)`` 2-tuples into an
+    ``n x 2`` integer array without creating a list of the pairs.
+    """
+    flat = numpy.fromiter(itertools.chain.from_iterable(pairs),
+                          dtype=numpy.int64)
+    return flat.reshape(-1, 2)
+
+
+def score_pairs(pairs, term_count, limit=None):
+    """
+    Returns ``(score, pk)`` 2-tuples with the `calculate_score` of
+    each instance in the distinct ``(object_id, meaning)`` `pairs`,
+    highest scores first and ties by descending primary key.  With
+    `limit`, only the top `limit` scores are returned.
+    """
+    array = pairs_to_array(pairs)
+    if not len(array) or limit is not None and limit <= 0:
+        return []
+    object_ids, counts = numpy.unique(array[:, 0], return_counts=True)
+    scores = 100 * counts // term_count
+    if limit is not None and limit < len(object_ids):
+        # a single key which orders by score and then by primary key
+        keys = scores * (object_ids.max() + 1) + object_ids
+        top = numpy.argpartition(-keys, limit - 1)[:limit]
+        object_ids, scores = object_ids[top], scores[top]
+    order = numpy.lexsort((object_ids, scores))[::-1]
+    return zip(scores[order].tolist(), object_ids[order].tolist())
@@ -1,10 +1,15 @@
+from django.conf import settings
+from django.core.paginator import Paginator, InvalidPage
 from django.db.models import get_model
+from django.http import Http404
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 
 from babelsearch.forms import WordsForm, MeaningsFormset
 from babelsearch.models import Meaning
 from babelsearch.preprocess import get_instance_text, get_words
+from babelsearch.replicas import (
+    get_replication_lag, has_replicas, read_from_primary)
 
 
 def get_tokenization_for(terms):
@@ -12,17 +17,66 @@ def get_tokenization_for(terms):
     return u' '.join(found_words)
 
 
+DEFAULT_VOCABULARY_PAGE_SIZE = 50
+
+def get_vocabulary_page_size():
+    return getattr(settings, 'BABELSEARCH_VOCABULARY_PAGE_SIZE',
+                   DEFAULT_VOCABULARY_PAGE_SIZE)
+
+
 def _make_meaning_data(meaning):
     return {'meaning': meaning.pk,
             'words': [(w.language, w.normalized_spelling)
-                      for w in meaning.words.all()]}
+                      for w in meaning.get_words()]}
+
+
+def _make_meanings_data(meanings):
+    """
+    Returns initial formset data for the given meanings.  Words for all
+    meanings are fetched with a single query.
+    """
+    return [_make_meaning_data(meaning)
+            for meaning in Meaning.objects.prefetch_words(meanings)]
+
+
+def _unique_meanings(ordered_meanings):
+    seen = set()
+    for word in ordered_meanings:
+        for meaning in word:
+            if meaning.pk not in seen:
+                seen.add(meaning.pk)
+                yield meaning
+
+
+# set after a vocabulary edit while replicas may not have caught up
+READ_FROM_PRIMARY_COOKIE = 'babelsearch_read_from_primary'
+
+def edit_vocabulary(request, *args, **kwargs):
+    """
+    Edits the vocabulary, or the meanings of the words of an indexed
+    instance.  With read replicas, reads from the primary database
+    while saving and for ``BABELSEARCH_REPLICATION_LAG`` seconds
+    afterwards, so that the editor sees the changes.
+    """
+    if (request.method == 'POST' or
+        READ_FROM_PRIMARY_COOKIE in request.COOKIES):
+        with read_from_primary():
+            response = _edit_vocabulary(request, *args, **kwargs)
+    else:
+        response = _edit_vocabulary(request, *args, **kwargs)
+    if request.method == 'POST' and has_replicas():
+        response.set_cookie(READ_FROM_PRIMARY_COOKIE, '1',
+                            max_age=get_replication_lag())
+    return response
 
 
-def edit_vocabulary(request, app_name=None, model_name=None, instance_pk=None):
+def _edit_vocabulary(request, app_name=None, model_name=None,
+                     instance_pk=None):
     template_name = 'babelsearch/edit-vocabulary.html'
 
     meanings_data = None
     text = None
+    page = None
 
     if request.method == 'POST':
         words_form = WordsForm(request.POST, prefix='words')
@@ -35,11 +89,11 @@ def edit_vocabulary(request, app_name=None, model_name=None, instance_pk=None):
 
             if words_form.is_valid():
                 words = words_form.cleaned_data['words'].split()
-                new_meanings = Meaning.objects.filter(
-                    words__normalized_spelling__in=words).distinct()
-                for meaning in new_meanings:
-                    if meaning.pk not in old_meaning_pks:
-                        meanings_data.append(_make_meaning_data(meaning))
+                new_meanings = (Meaning.objects
+                                .filter(words__normalized_spelling__in=words)
+                                .exclude(pk__in=old_meaning_pks)
+                                .distinct())
+                meanings_data.extend(_make_meanings_data(new_meanings))
                 meanings_formset = MeaningsFormset(initial=meanings_data,
                                                    prefix='meanings')
     else:
@@ -52,10 +106,15 @@ def edit_vocabulary(request, app_name=None, model_name=None, instance_pk=None):
             words = get_words(text)
             ordered_meanings, found_words = Meaning.objects.lookup_ordered(
                 words, create_missing=False)
-            meanings_data = []
-            for word in ordered_meanings:
-                for meaning in word:
-                    meanings_data.append(_make_meaning_data(meaning))
+            # only build forms for one page of meanings at a time,
+            # long documents may have hundreds of them
+            paginator = Paginator(list(_unique_meanings(ordered_meanings)),
+                                  get_vocabulary_page_size())
+            try:
+                page = paginator.page(request.GET.get('page', 1))
+            except (InvalidPage, ValueError):
+                raise Http404
+            meanings_data = _make_meanings_data(page.object_list)
         words_form = WordsForm(prefix='words')
         meanings_formset = MeaningsFormset(initial=meanings_data,
                                            prefix='meanings')
@@ -63,5 +122,6 @@ def edit_vocabulary(request, app_name=None, model_name=None, instance_pk=None):
     return render_to_response(template_name,
                               {'words_form': words_form,
                                'meanings_formset': meanings_formset,
-                               'analyzed_text': text},
+                               'analyzed_text': text,
+                               'page': page},
                               RequestContext(request));
@@ -0,0 +1,214 @@
+"""
+Streaming import and export of the vocabulary.
+
+A vocabulary file contains one meaning per line.  Each meaning is a
+list of words in the same ``language:spelling`` format used by
+`Word.editformat` and the vocabulary editing form.  The language and
+colon are omitted for words without a language.  Supported file
+formats are:
+
+ * ``txt``: words separated by whitespace
+ * ``tsv``: words separated by tabs
+ * ``csv``: words as comma-separated values
+ * ``jsonl``: a JSON list of words
+"""
+
+from cStringIO import StringIO
+import csv
+import itertools
+import json
+from operator import itemgetter
+
+from django.db import transaction
+
+from babelsearch.bulk import chunked
+from babelsearch.models import Meaning
+from babelsearch.preprocess import lower_without_diacritics
+
+
+FORMATS = 'txt', 'tsv', 'csv', 'jsonl'
+
+
+class VocabularyFormatError(ValueError):
+    pass
+
+
+def decode_word(token):
+    """
+    Converts a ``language:spelling`` token into a ``(language,
+    normalized_spelling)`` 2-tuple.  The language is `None` if the
+    token has no language prefix.
+    """
+    if ':' in token:
+        language, spelling = (item.strip() for item in token.split(':', 1))
+        if len(language) > 5:
+            raise VocabularyFormatError(
+                'Invalid language code in %r' % token)
+    else:
+        language, spelling = None, token.strip()
+    normalized_spelling = lower_without_diacritics(spelling)
+    if not normalized_spelling:
+        raise VocabularyFormatError('No word found in %r' % token)
+    return language or None, normalized_spelling
+
+
+def encode_word(language, normalized_spelling):
+    return u'%s%s' % (language and u'%s:' % language or u'',
+                      normalized_spelling)
+
+
+def _split_csv_line(line):
+    row, = csv.reader([line.encode('utf-8')])
+    return [cell.decode('utf-8') for cell in row]
+
+
+def _split_jsonl_line(line):
+    tokens = json.loads(line)
+    if not (isinstance(tokens, list) and
+            all(isinstance(token, basestring) for token in tokens)):
+        raise VocabularyFormatError('Expected a JSON list of strings')
+    return tokens
+
+
+_splitters = {
+    'txt': lambda line: line.split(),
+    'tsv': lambda line: line.rstrip(u'\r\n').split(u'\t'),
+    'csv': _split_csv_line,
+    'jsonl': _split_jsonl_line,
+}
+
+
+def read_meanings(lines, format='txt'):
+    """
+    Parses a vocabulary file lazily.  `lines` is an iterable of
+    unicode strings.  Yields a list of ``(language,
+    normalized_spelling)`` 2-tuples for every non-blank line.  Lines
+    starting with ``#`` are skipped.
+    """
+    split = _splitters[format]
+    for lineno, line in enumerate(lines, 1):
+        if not line.strip() or line.startswith(u'#'):
+            continue
+        try:
+            tokens = [token for token in split(line) if token.strip()]
+            yield [decode_word(token) for token in tokens]
+        except (ValueError, csv.Error), e:
+            raise VocabularyFormatError('Line %d: %s' % (lineno, e))
+
+
+def _format_csv_line(tokens):
+    output = StringIO()
+    csv.writer(output, lineterminator='').writerow(
+        [token.encode('utf-8') for token in tokens])
+    return output.getvalue().decode('utf-8')
+
+
+_joiners = {
+    'txt': u' '.join,
+    'tsv': u'\t'.join,
+    'csv': _format_csv_line,
+    'jsonl': json.dumps,
+}
+
+
+def format_meanings(meanings, format='txt'):
+    """
+    Yields a line (without a line separator) for each list of
+    ``(language, normalized_spelling)`` 2-tuples in `meanings`.
+    """
+    join = _joiners[format]
+    for words in meanings:
+        yield join([encode_word(*word) for word in words])
+
+
+def import_meanings(meanings, batch_size=1000, callback=None):
+    """
+    Creates a meaning for each list of words in `meanings`.  Meanings
+    are created in batches of `batch_size`, each in its own
+    transaction, with words looked up and inserted in bulk.  Words not
+    in the vocabulary are added to it.  Lists with the same set of
+    words as an existing meaning, or as an earlier list, are skipped,
+    so importing a file again doesn't duplicate its meanings.
+
+    Returns the number of meanings created.
+    """
+    meanings = iter(meanings)
+    count = 0
+    while True:
+        batch = list(itertools.islice(meanings, batch_size))
+        if not batch:
+            break
+        count += _import_batch(batch)
+        if callback:
+            callback(count)
+    return count
+
+
+@transaction.commit_on_success
+def _import_batch(batch):
+    groups = [frozenset(tuple(word) for word in words) for words in batch]
+    seen = _get_existing_word_sets(groups)
+    new_groups = []
+    for group in groups:
+        if group not in seen:
+            seen.add(group)
+            new_groups.append(group)
+    Meaning.objects.bulk_create_meanings(new_groups)
+    return len(new_groups)
+
+
+def _get_existing_word_sets(groups):
+    """
+    Returns the word sets of the meanings sharing a spelling with any
+    of the word sets in `groups`, as frozensets of ``(language,
+    normalized_spelling)`` 2-tuples.
+    """
+    through = Meaning.words.through
+    spellings = set(spelling for group in groups
+                    for language, spelling in group)
+    meaning_pks = set()
+    for chunk in chunked(spellings):
+        meaning_pks.update(through.objects
+                           .filter(word__normalized_spelling__in=chunk)
+                           .values_list('meaning', flat=True))
+    word_sets = set()
+    for chunk in chunked(meaning_pks):
+        rows = (through.objects
+                .filter(meaning__in=chunk)
+                .order_by('meaning')
+                .values_list('meaning',
+                             'word__language',
+                             'word__normalized_spelling'))
+        for meaning_pk, group in itertools.groupby(rows, itemgetter(0)):
+            word_sets.add(frozenset((language, spelling)
+                                    for _pk, language, spelling in group))
+    return word_sets
+
+
+def iter_meanings(batch_size=1000):
+    """
+    Yields a sorted list of ``(language, normalized_spelling)``
+    2-tuples for every meaning in the vocabulary, in primary key
+    order.  Meanings are fetched in batches of `batch_size` so the
+    whole vocabulary is never held in memory.  Meanings without words
+    are skipped.
+    """
+    through = Meaning.words.through
+    last_pk = 0
+    while True:
+        pks = list(Meaning.objects
+                   .filter(pk__gt=last_pk)
+                   .order_by('pk')
+                   .values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        last_pk = pks[-1]
+        rows = (through.objects
+                .filter(meaning__in=pks)
+                .order_by('meaning')
+                .values_list('meaning',
+                             'word__language',
+                             'word__normalized_spelling'))
+        for meaning_pk, group in itertools.groupby(rows, lambda r: r[0]):
+            yield sorted((language, spelling)
+                         for _pk, language, spelling in group)
@@ -9,12 +9,24 @@ ADMINS = (
 
 MANAGERS = ADMINS
 
-DATABASE_ENGINE = 'sqlite3'
-DATABASE_NAME = ':memory:'
-DATABASE_USER = ''             # Not used with sqlite3.
-DATABASE_PASSWORD = ''         # Not used with sqlite3.
-DATABASE_HOST = ''             # Set to empty string for localhost. Not used with sqlite3.
-DATABASE_PORT = ''             # Set to empty string for default. Not used with sqlite3.
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+        # lets the threaded tests share the in-memory test database
+        'OPTIONS': {'check_same_thread': False},
+    },
+    # used by the tests of babelsearch.sharding and babelsearch.replicas
+    'index_shard': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'example-index-shard.sqlite',
+        'TEST_NAME': ':memory:',
+        'OPTIONS': {'check_same_thread': False},
+    },
+}
+
+DATABASE_ROUTERS = ['babelsearch.sharding.IndexShardRouter',
+                    'babelsearch.replicas.ReplicaRouter']
 
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
@@ -1,3 +1,3 @@
 from base import *
 
-DATABASE_NAME = 'example.sqlite'
+DATABASES['default']['NAME'] = 'example.sqlite'
@@ -0,0 +1,13 @@
+from base import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'NAME': 'babelsearch_example',
+    },
+    # used by the tests of babelsearch.sharding and babelsearch.replicas
+    'index_shard': {
+        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'NAME': 'babelsearch_example_index_shard',
+    },
+}